@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Query
 from pydantic import BaseModel
 from typing import Optional
 from uuid import UUID, uuid4
@@ -9,9 +9,10 @@ from domain.sql_models import (
     InternalOrganizationBankAccount,
     ExternalOrganizationBankAccount
 )
-from config.database import get_db
+from config.database import get_db, get_read_db
 from auth.roles import Role, get_current_user_role
 from auth.jwt import get_current_user
+from api.pagination import COUNT_MODES, fetch_page_with_total
 
 router = APIRouter(prefix="/accounts", tags=["accounts"])
 
@@ -246,7 +247,7 @@ async def update_external_account(
 
 @router.get("")
 async def list_accounts(
-    session: AsyncSession = Depends(get_db),
+    session: AsyncSession = Depends(get_read_db),
     account_type: Optional[str] = None,
     status: Optional[AccountStatus] = None,
     organization_id: Optional[UUID] = None,
@@ -254,9 +255,16 @@ async def list_accounts(
     offset: int = 0,
     sort_by: Optional[str] = None,
     sort_direction: Optional[str] = 'desc',
+    count: str = Query("exact", description="Total count mode: exact, estimated (planner statistics) or none"),
     user = Depends(get_current_user)
 ):
     """List accounts with role-based access control and organization filtering."""
+    if count not in COUNT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid count mode. Must be one of: {', '.join(COUNT_MODES)}"
+        )
+
     response = {
         "internal_accounts": {
             "total": 0,
@@ -267,7 +275,8 @@ async def list_accounts(
             "accounts": []
         },
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "count_mode": count
     }
 
     # Get user role
@@ -289,18 +298,17 @@ async def list_accounts(
                 )
         
         internal_query = internal_query.offset(offset).limit(limit)
-        internal_result = await session.execute(internal_query)
-        internal_accounts = internal_result.scalars().all()
         
-        # Get total count for internal accounts using COUNT
+        # Get total count for internal accounts using COUNT, in the same round trip as the page
         internal_count_query = select(func.count()).select_from(InternalOrganizationBankAccount)
         if status:
             internal_count_query = internal_count_query.where(InternalOrganizationBankAccount.status == status)
         if account_type:
             internal_count_query = internal_count_query.where(InternalOrganizationBankAccount.type == account_type)
         
-        internal_count_result = await session.execute(internal_count_query)
-        internal_total = internal_count_result.scalar()
+        internal_accounts, internal_total = await fetch_page_with_total(
+            session, internal_query, internal_count_query, count_mode=count, first_page=offset == 0
+        )
         
         response["internal_accounts"] = {
             "total": internal_total,
@@ -332,10 +340,8 @@ async def list_accounts(
             )
     
     external_query = external_query.offset(offset).limit(limit)
-    external_result = await session.execute(external_query)
-    external_accounts = external_result.scalars().all()
 
-    # Get total count for external accounts using COUNT
+    # Get total count for external accounts using COUNT, in the same round trip as the page
     external_count_query = select(func.count()).select_from(ExternalOrganizationBankAccount)
     if user_role == Role.ORGANIZATION_ADMIN and user_org_id:
         external_count_query = external_count_query.where(
@@ -350,8 +356,9 @@ async def list_accounts(
     if account_type:
         external_count_query = external_count_query.where(ExternalOrganizationBankAccount.account_type == account_type)
     
-    external_count_result = await session.execute(external_count_query)
-    external_total = external_count_result.scalar()
+    external_accounts, external_total = await fetch_page_with_total(
+        session, external_query, external_count_query, count_mode=count, first_page=offset == 0
+    )
     
     response["external_accounts"] = {
         "total": external_total,
@@ -0,0 +1,98 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from pydantic import BaseModel
+from collections import OrderedDict
+from typing import List, Optional
+import logging
+import os
+from auth.roles import Role
+from auth.jwt import get_current_user
+from message_queue.base import PaymentQueue, get_queue
+from message_queue.dlq import DLQ_REPLAY_RATE, DeadLetterFilter, ReplayJob, find_dead_letters
+
+router = APIRouter(prefix="/dlq", tags=["dlq"])
+logger = logging.getLogger(__name__)
+
+# Most dead letters one replay request puts back on the queue; larger replays are split across requests
+DLQ_REPLAY_MAX_PER_REQUEST = int(os.getenv("DLQ_REPLAY_MAX_PER_REQUEST", "1000"))
+# Fastest replay rate a request may ask for, in dead letters per second; higher rates are lowered to it
+DLQ_REPLAY_MAX_RATE = float(os.getenv("DLQ_REPLAY_MAX_RATE", str(DLQ_REPLAY_RATE)))
+# Finished replay jobs whose status stays available, most recent first
+DLQ_REPLAY_JOBS_KEPT = int(os.getenv("DLQ_REPLAY_JOBS_KEPT", "100"))
+
+# Replay jobs started by this process, by id, oldest first
+replay_jobs: "OrderedDict[str, ReplayJob]" = OrderedDict()
+
+class DeadLetterReplay(BaseModel):
+    ids: Optional[List[str]] = None
+    reason: Optional[str] = None
+    organization_id: Optional[str] = None
+    payment_type: Optional[str] = None
+    older_than_seconds: Optional[float] = None
+    newer_than_seconds: Optional[float] = None
+    rate: float = DLQ_REPLAY_RATE
+    max_count: Optional[int] = None
+
+def require_superuser(user) -> None:
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if user.role != Role.SUPERUSER.value:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+@router.get("")
+async def list_dead_letters(
+    user = Depends(get_current_user),
+    queue: PaymentQueue = Depends(get_queue),
+    reason: Optional[str] = Query(None, description="Substring of the failure reason"),
+    organization_id: Optional[str] = None,
+    payment_type: Optional[str] = None,
+    older_than_seconds: Optional[float] = None,
+    newer_than_seconds: Optional[float] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """List dead letters, oldest first, with their failure reason and attempt history."""
+    require_superuser(user)
+    dead_letter_filter = DeadLetterFilter(
+        reason, organization_id, payment_type, older_than_seconds, newer_than_seconds
+    )
+    dead_letters, next_cursor = await find_dead_letters(queue, dead_letter_filter, cursor, limit)
+    return {"dead_letters": dead_letters, "next_cursor": next_cursor}
+
+def remember_job(job: ReplayJob) -> None:
+    replay_jobs[job.id] = job
+    finished = [job_id for job_id, known in replay_jobs.items() if known.finished_at]
+    for job_id in finished[:max(0, len(finished) - DLQ_REPLAY_JOBS_KEPT)]:
+        del replay_jobs[job_id]
+
+@router.post("/replay", status_code=202)
+async def replay(
+    request: DeadLetterReplay,
+    user = Depends(get_current_user),
+    queue: PaymentQueue = Depends(get_queue)
+):
+    """Start putting the given dead letters, or those matching the filters, back on the queue at a limited rate.
+
+    The replay runs in the background; poll GET /dlq/replay/{job_id} for its progress.
+    """
+    require_superuser(user)
+    if request.rate <= 0:
+        raise HTTPException(status_code=400, detail="rate must be positive")
+    rate = min(request.rate, DLQ_REPLAY_MAX_RATE)
+    max_count = min(request.max_count or DLQ_REPLAY_MAX_PER_REQUEST, DLQ_REPLAY_MAX_PER_REQUEST)
+    dead_letter_filter = DeadLetterFilter(
+        request.reason, request.organization_id, request.payment_type,
+        request.older_than_seconds, request.newer_than_seconds
+    )
+    job = ReplayJob().start(queue, dead_letter_filter, request.ids, rate, max_count)
+    remember_job(job)
+    logger.info(f"User {user.email} started dead letter replay {job.id} at {rate}/s")
+    return job.to_dict()
+
+@router.get("/replay/{job_id}")
+async def replay_status(job_id: str, user = Depends(get_current_user)):
+    """Progress of a replay started by this API process."""
+    require_superuser(user)
+    job = replay_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Replay job not found")
+    return job.to_dict()
@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import literal, literal_column, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement, ColumnElement
+
+# Ways of computing the total row count of a listing
+COUNT_MODES = ("exact", "estimated", "none")
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Encode a cursor payload as an opaque URL-safe token."""
+    raw = json.dumps(payload, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a token produced by encode_cursor, raising ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+def filters_fingerprint(**filters: Any) -> str:
+    """Short hash of the filters a cursor was issued for, so it cannot be replayed against others."""
+    raw = json.dumps(filters, sort_keys=True, default=str).encode()
+    return hashlib.sha256(raw).hexdigest()[:12]
+
+def keyset_condition(
+    sort_column: ColumnElement,
+    tiebreak_column: ColumnElement,
+    direction: str,
+    value: Any,
+    tiebreak_value: Any
+) -> ColumnElement:
+    """Row-value predicate selecting rows strictly after (value, tiebreak_value) in sort order."""
+    key = tuple_(sort_column, tiebreak_column)
+    after = tuple_(literal(value, sort_column.type), literal(tiebreak_value, tiebreak_column.type))
+    return key < after if direction == "desc" else key > after
+
+def cursor_value(value: Any) -> Any:
+    """Convert a sort key value to its JSON representation in a cursor."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    if hasattr(value, "value"):
+        return value.value
+    return value
+
+def parse_cursor_value(value: Any, python_type: Optional[type]) -> Any:
+    """Convert a cursor value back to the Python type of its sort column."""
+    if value is None or python_type is None:
+        return value
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) wrapper around a select statement."""
+
+    inherit_cache = False
+
+    def __init__(self, statement: Select):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element: Explain, compiler, **kw) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+async def estimate_count(session: AsyncSession, statement: Select) -> int:
+    """Planner row estimate for a statement, taken from table statistics without running it."""
+    result = await session.execute(Explain(statement))
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+async def fetch_page_with_total(
+    session: AsyncSession,
+    page_query: Select,
+    count_query: Select,
+    count_mode: str = "exact",
+    first_page: bool = True
+) -> Tuple[List[Any], Optional[int]]:
+    """Fetch a page of ORM rows and the listing total according to count_mode.
+
+    count_query must be a `select(func.count()).select_from(Model).where(...)` with
+    the listing's filters. In exact mode the count is selected as a scalar subquery
+    next to every page row, so page and total come back in one round trip; it is
+    only queried separately when a later page turns out empty. Estimated mode uses
+    the planner's row estimate and none skips the total.
+    """
+    if count_mode == "exact":
+        rows = (await session.execute(
+            page_query.add_columns(count_query.scalar_subquery().label("total"))
+        )).all()
+        items = [row[0] for row in rows]
+        if rows:
+            total = rows[0][-1]
+        elif first_page:
+            total = 0
+        else:
+            total = (await session.execute(count_query)).scalar()
+        return items, total
+
+    items = list((await session.execute(page_query)).scalars().all())
+    if count_mode == "estimated":
+        return items, await estimate_count(session, count_query.with_only_columns(literal_column("1")))
+    return items, None
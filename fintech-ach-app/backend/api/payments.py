@@ -1,27 +1,59 @@
 from fastapi import APIRouter, HTTPException, Depends, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, UUID4
 from typing import Optional
 from uuid import UUID, uuid4
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, and_, func
+from sqlalchemy.exc import IntegrityError
 from domain.models import PaymentStatus, AccountStatus
 from domain.sql_models import (
     Payment as SQLPayment,
+    PaymentArchiveEntry,
+    PaymentIdempotencyKey,
     ExternalOrganizationBankAccount,
     InternalOrganizationBankAccount
 )
-from config.database import get_db
+from config.database import get_db, get_read_db
 from auth.roles import Role, check_role
 from auth.jwt import get_current_user
-from message_queue.redis_queue import RedisQueue
-from datetime import datetime
-import os
+from message_queue.backpressure import queue_pressure
+from message_queue.base import PaymentQueue, get_queue
+from message_queue.outbox import outbox_entry
+from archive.payment_archive import (
+    ARCHIVE_SCHEMA,
+    ArchivedPayment,
+    archive_file_path,
+    count_archive,
+    hot_window_start,
+    merge_with_archive,
+    read_archived_payment,
+    scan_archive
+)
+from api.pagination import (
+    COUNT_MODES,
+    fetch_page_with_total,
+    encode_cursor,
+    decode_cursor,
+    filters_fingerprint,
+    keyset_condition,
+    cursor_value,
+    parse_cursor_value
+)
+from datetime import datetime, timedelta, timezone
 import logging
 
 router = APIRouter(prefix="/payments", tags=["payments"])
-queue = RedisQueue(os.getenv("REDIS_URL", "redis://localhost:6379"))
 logger = logging.getLogger(__name__)
 
+# Sort columns that support keyset (cursor) pagination, with their Python types
+KEYSET_SORT_COLUMNS = {
+    "created_at": datetime,
+    "amount": float,
+    "status": PaymentStatus,
+    "payment_type": str
+}
+
 class PaymentCreate(BaseModel):
     amount: float
     from_account_id: UUID4
@@ -30,14 +62,32 @@ class PaymentCreate(BaseModel):
     idempotency_key: str
     payment_type: str
 
+async def find_idempotent_payment(session: AsyncSession, idempotency_key: str) -> Optional[UUID]:
+    """Return the id of the payment already created with this idempotency key, if any."""
+    result = await session.execute(
+        select(PaymentIdempotencyKey.payment_uuid).where(PaymentIdempotencyKey.idempotency_key == idempotency_key)
+    )
+    return result.scalar_one_or_none()
+
+async def find_archived_payment(session: AsyncSession, payment_id: UUID, user) -> Optional[ArchivedPayment]:
+    """Look up a payment in the archive index and read it from its Parquet file."""
+    query = select(PaymentArchiveEntry).where(PaymentArchiveEntry.payment_uuid == payment_id)
+    if user.role == Role.ORGANIZATION_ADMIN.value:
+        query = query.where(PaymentArchiveEntry.organization_id == user.organization_id)
+    entry = (await session.execute(query)).scalar_one_or_none()
+    if not entry:
+        return None
+    return await run_in_threadpool(read_archived_payment, archive_file_path(entry), payment_id)
+
 @router.post("")
 async def create_payment(
     request: Request,
     payment: PaymentCreate,
     user = Depends(get_current_user),
-    session: AsyncSession = Depends(get_db)
+    session: AsyncSession = Depends(get_db),
+    queue: PaymentQueue = Depends(get_queue)
 ):
-    """Create a new payment and enqueue it for processing."""
+    """Create a new payment; the outbox relay enqueues it for processing."""
     try:
         if not user:
             raise HTTPException(
@@ -46,12 +96,9 @@ async def create_payment(
             )
 
         # Check idempotency
-        result = await session.execute(
-            select(SQLPayment).where(SQLPayment.idempotency_key == payment.idempotency_key)
-        )
-        existing_payment = result.scalar_one_or_none()
-        if existing_payment:
-            return {"payment_id": existing_payment.uuid}
+        existing_payment_id = await find_idempotent_payment(session, payment.idempotency_key)
+        if existing_payment_id:
+            return {"payment_id": existing_payment_id}
 
         # Validate accounts based on payment type
         try:
@@ -127,8 +174,22 @@ async def create_payment(
             logger.error(f"Account validation failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Account validation failed: {str(e)}")
 
+        # The external side of the payment determines the organization it belongs to
+        external_account = from_account if payment.payment_type == "ach_debit" else to_account
+
+        # Refuse new work while the workers are behind
+        rejection = await queue_pressure.check(queue, external_account.organization_id)
+        if rejection:
+            logger.warning(f"Payment refused by queue backpressure: {rejection.detail}")
+            raise HTTPException(
+                status_code=rejection.status_code,
+                detail=rejection.detail,
+                headers={"Retry-After": str(rejection.retry_after)}
+            )
+
         try:
-            # Create payment
+            # Create payment together with its idempotency key, which is unique across all partitions
+            created_at = datetime.now(timezone.utc)
             new_payment = SQLPayment(
                 uuid=uuid4(),
                 from_account=payment.from_account_id,
@@ -139,24 +200,32 @@ async def create_payment(
                 source_routing_number=from_account.routing_number,
                 destination_routing_number=to_account.routing_number,
                 payment_type=payment.payment_type,
-                idempotency_key=payment.idempotency_key
+                idempotency_key=payment.idempotency_key,
+                organization_id=external_account.organization_id,
+                created_at=created_at
             )
             
             session.add(new_payment)
-            await session.commit()
-            
-            # Enqueue for processing
-            await queue.enqueue_payment(str(new_payment.uuid), {
-                "payment_id": str(new_payment.uuid),
-                "amount": payment.amount,
-                "from_account": str(payment.from_account_id),
-                "to_account": str(payment.to_account_id),
-                "payment_type": payment.payment_type
-            })
+            session.add(PaymentIdempotencyKey(
+                idempotency_key=payment.idempotency_key,
+                payment_uuid=new_payment.uuid,
+                payment_created_at=created_at
+            ))
+            # Enqueued by the outbox relay once this transaction commits
+            session.add(outbox_entry(new_payment))
+            try:
+                await session.commit()
+            except IntegrityError:
+                # A concurrent request with the same idempotency key won the race
+                await session.rollback()
+                existing_payment_id = await find_idempotent_payment(session, payment.idempotency_key)
+                if existing_payment_id:
+                    return {"payment_id": existing_payment_id}
+                raise
             
             return {"payment_id": new_payment.uuid}
         except Exception as e:
-            logger.error(f"Payment creation or enqueuing failed: {str(e)}")
+            logger.error(f"Payment creation failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Payment creation failed: {str(e)}")
             
     except HTTPException:
@@ -189,34 +258,28 @@ async def get_payment(
             detail="Not enough permissions"
         )
     
-    result = await session.execute(
-        select(SQLPayment).where(SQLPayment.uuid == payment_id)
-    )
-    payment = result.scalar_one_or_none()
-    if not payment:
-        raise HTTPException(status_code=404, detail="Payment not found")
-        
+    query = select(SQLPayment).where(SQLPayment.uuid == payment_id)
+
     # For org admin, only show their own organization's payments
     if user.role == Role.ORGANIZATION_ADMIN.value:
-        # Get the external account to check organization
-        from_account_result = await session.execute(
-            select(ExternalOrganizationBankAccount).where(
-                ExternalOrganizationBankAccount.uuid == payment.from_account
-            )
-        )
-        from_account = from_account_result.scalar_one_or_none()
-        if not from_account:
-            raise HTTPException(status_code=404, detail="Payment not found")
-            
-        # Check if payment belongs to the organization
-        if not user.organization_id or str(from_account.organization_id) != str(user.organization_id):
+        if not user.organization_id:
             raise HTTPException(status_code=403, detail="Not authorized to view this payment")
+        query = query.where(SQLPayment.organization_id == user.organization_id)
+
+    result = await session.execute(query)
+    payment = result.scalar_one_or_none()
+    if not payment:
+        # Settled payments past the hot window live in the Parquet archive
+        archived_payment = await find_archived_payment(session, payment_id, user)
+        if not archived_payment:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        return archived_payment.to_dict()
             
     return payment
 
 @router.get("")
 async def list_payments(
-    session: AsyncSession = Depends(get_db),
+    session: AsyncSession = Depends(get_read_db),
     status: Optional[str] = Query(None, description="Filter by payment status"),
     startDate: Optional[str] = Query(None, description="Filter by start date (YYYY-MM-DD)"),
     endDate: Optional[str] = Query(None, description="Filter by end date (YYYY-MM-DD)"),
@@ -226,17 +289,33 @@ async def list_payments(
     sort_direction: Optional[str] = Query(None, description="Sort direction (asc/desc)"),
     limit: int = 10,
     offset: int = 0,
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor (keyset pagination)"),
+    count: str = Query("exact", description="Total count mode: exact, estimated (planner statistics) or none"),
+    includeArchived: bool = Query(False, description="Also list settled payments moved to the archive"),
     user = Depends(get_current_user)
 ):
-    """List payments with optional filtering, sorting, and role-based access control."""
+    """List payments with optional filtering, sorting, and role-based access control.
+
+    Pass the returned next_cursor back as `cursor` to page with keyset pagination,
+    which stays fast on deep pages. Without a cursor, offset pagination is used.
+    Archived payments are listed only with includeArchived or a startDate before
+    the hot window.
+    """
     if not user:
         raise HTTPException(
             status_code=401,
             detail="Authentication required"
         )
 
+    if count not in COUNT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid count mode. Must be one of: {', '.join(COUNT_MODES)}"
+        )
+
     query = select(SQLPayment)
     filters = []
+    payment_status = start_date = end_date = min_amount = max_amount = None
 
     # Organization-based filtering for organization admins
     if user.role == Role.ORGANIZATION_ADMIN.value:
@@ -246,30 +325,7 @@ async def list_payments(
                 detail="Organization ID not found for admin user"
             )
         
-        # Get all external accounts for the organization
-        org_accounts_result = await session.execute(
-            select(ExternalOrganizationBankAccount.uuid).where(
-                ExternalOrganizationBankAccount.organization_id == user.organization_id
-            )
-        )
-        org_account_ids = [str(acc[0]) for acc in org_accounts_result.fetchall()]
-        
-        if not org_account_ids:
-            # Return empty result if organization has no accounts
-            return {
-                "total": 0,
-                "payments": [],
-                "limit": limit,
-                "offset": offset
-            }
-        
-        # Filter payments where either from_account or to_account belongs to the organization
-        filters.append(
-            or_(
-                SQLPayment.from_account.in_(org_account_ids),
-                SQLPayment.to_account.in_(org_account_ids)
-            )
-        )
+        filters.append(SQLPayment.organization_id == user.organization_id)
 
     # Status filter
     if status and status.strip():
@@ -282,10 +338,10 @@ async def list_payments(
                 detail=f"Invalid status value. Must be one of: {', '.join([s.value for s in PaymentStatus])}"
             )
     
-    # Date range filter
+    # Date range filter, as UTC bounds on created_at so Postgres prunes the monthly partitions
     if startDate:
         try:
-            start_date = datetime.strptime(startDate, "%Y-%m-%d")
+            start_date = datetime.strptime(startDate, "%Y-%m-%d").replace(tzinfo=timezone.utc)
             filters.append(SQLPayment.created_at >= start_date)
         except ValueError:
             raise HTTPException(
@@ -296,8 +352,8 @@ async def list_payments(
     if endDate:
         try:
             # Add one day to include the entire end date
-            end_date = datetime.strptime(endDate, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
-            filters.append(SQLPayment.created_at <= end_date)
+            end_date = datetime.strptime(endDate, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)
+            filters.append(SQLPayment.created_at < end_date)
         except ValueError:
             raise HTTPException(
                 status_code=400,
@@ -329,29 +385,106 @@ async def list_payments(
     if filters:
         query = query.where(and_(*filters))
     
-    # Apply sorting
-    if sort_by and sort_direction:
-        sort_column = getattr(SQLPayment, sort_by, None)
-        if sort_column is not None:
-            query = query.order_by(
-                sort_column.desc() if sort_direction == 'desc' else sort_column.asc()
-            )
+    # Apply sorting, defaulting to created_at desc; uuid breaks ties so pages are stable
+    sort_key = "created_at"
+    direction = "desc"
+    if sort_by and sort_direction and getattr(SQLPayment, sort_by, None) is not None:
+        sort_key = sort_by
+        direction = "desc" if sort_direction == "desc" else "asc"
+    sort_column = getattr(SQLPayment, sort_key)
+    if direction == "desc":
+        page_query = query.order_by(sort_column.desc(), SQLPayment.uuid.desc())
     else:
-        # Default sorting by created_at desc
-        query = query.order_by(SQLPayment.created_at.desc())
-    
-    # Apply pagination after sorting
-    query = query.offset(offset).limit(limit)
-    result = await session.execute(query)
-    payments = result.scalars().all()
-    
-    # Get total count with same filters
-    count_query = select(SQLPayment)
+        page_query = query.order_by(sort_column.asc(), SQLPayment.uuid.asc())
+
+    # Apply pagination after sorting: keyset when a cursor is given, offset otherwise
+    cursor_filters = filters_fingerprint(
+        status=status, startDate=startDate, endDate=endDate, minAmount=minAmount, maxAmount=maxAmount,
+        includeArchived=includeArchived
+    )
+    if cursor:
+        if sort_key not in KEYSET_SORT_COLUMNS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cursor pagination supports sorting by: {', '.join(KEYSET_SORT_COLUMNS)}"
+            )
+        try:
+            cursor_data = decode_cursor(cursor)
+            if (cursor_data["s"], cursor_data["d"], cursor_data["f"]) != (sort_key, direction, cursor_filters):
+                raise ValueError("Cursor does not match the requested sort or filters")
+            last_value = parse_cursor_value(cursor_data["v"], KEYSET_SORT_COLUMNS[sort_key])
+            last_uuid = UUID(cursor_data["u"])
+        except (ValueError, KeyError, TypeError):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid cursor. Restart pagination without a cursor"
+            )
+        page_query = page_query.where(
+            keyset_condition(sort_column, SQLPayment.uuid, direction, last_value, last_uuid)
+        )
+    # The archive is only read when asked for, or when the start date reaches past the hot window
+    include_archive = (
+        (includeArchived or (start_date is not None and start_date < hot_window_start()))
+        and sort_key in ARCHIVE_SCHEMA.names
+    )
+
+    # Fetch one extra row to know whether another page follows, with the total in the same round trip
+    count_query = select(func.count()).select_from(SQLPayment)
     if filters:
         count_query = count_query.where(and_(*filters))
-    
-    count_result = await session.execute(count_query)
-    total = len(count_result.scalars().all())
+    if include_archive:
+        archive_filters = dict(
+            organization_id=user.organization_id if user.role == Role.ORGANIZATION_ADMIN.value else None,
+            start=start_date,
+            end=end_date,
+            status=payment_status,
+            min_amount=min_amount,
+            max_amount=max_amount
+        )
+        # The offset applies to the merged listing, so both sources start from the beginning
+        page_offset = 0 if cursor else offset
+        archived = await run_in_threadpool(
+            scan_archive,
+            sort_key=sort_key,
+            direction=direction,
+            after=(last_value, last_uuid) if cursor else None,
+            limit=page_offset + limit + 1,
+            **archive_filters
+        )
+        hot_payments, total = await fetch_page_with_total(
+            session,
+            page_query.limit(page_offset + limit + 1),
+            count_query,
+            count_mode=count,
+            first_page=not cursor
+        )
+        payments = merge_with_archive(list(hot_payments), archived, sort_key, direction)
+        payments = payments[page_offset:page_offset + limit + 1]
+        if total is not None:
+            total += await run_in_threadpool(count_archive, **archive_filters)
+    else:
+        if not cursor:
+            page_query = page_query.offset(offset)
+        payments, total = await fetch_page_with_total(
+            session,
+            page_query.limit(limit + 1),
+            count_query,
+            count_mode=count,
+            first_page=not cursor and offset == 0
+        )
+    has_more = len(payments) > limit
+    payments = payments[:limit]
+
+    next_cursor = None
+    if has_more and sort_key in KEYSET_SORT_COLUMNS:
+        last_payment = payments[-1]
+        next_cursor = encode_cursor({
+            "s": sort_key,
+            "d": direction,
+            "f": cursor_filters,
+            "v": cursor_value(getattr(last_payment, sort_key)),
+            "u": str(last_payment.uuid)
+        })
     
     # Enhance payment data with account details
     enhanced_payments = []
@@ -364,7 +497,8 @@ async def list_payments(
             "created_at": payment.created_at,
             "description": payment.description,
             "from_account": payment.from_account,
-            "to_account": payment.to_account
+            "to_account": payment.to_account,
+            "archived": getattr(payment, "archived", False)
         }
         
         # Get account details
@@ -416,5 +550,7 @@ async def list_payments(
         "total": total,
         "payments": enhanced_payments,
         "limit": limit,
-        "offset": offset
+        "offset": offset,
+        "next_cursor": next_cursor,
+        "count_mode": count
     }
\ No newline at end of file
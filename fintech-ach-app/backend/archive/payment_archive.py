@@ -0,0 +1,346 @@
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID, uuid4
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config.partitions import month_start
+from domain.sql_models import Payment, PaymentArchiveEntry, PaymentStatus
+
+logger = logging.getLogger(__name__)
+
+# Root directory of the Parquet archive: <dir>/organization_id=<id>/month=<YYYY-MM>/part-*.parquet
+PAYMENT_ARCHIVE_DIR = os.getenv("PAYMENT_ARCHIVE_DIR", "archive_data/payments")
+# Settled payments older than this many days are moved out of the hot table
+PAYMENT_ARCHIVE_AFTER_DAYS = int(os.getenv("PAYMENT_ARCHIVE_AFTER_DAYS", "90"))
+PAYMENT_ARCHIVE_COMPRESSION = os.getenv("PAYMENT_ARCHIVE_COMPRESSION", "zstd")
+
+TERMINAL_STATUSES = (PaymentStatus.COMPLETED, PaymentStatus.FAILED, PaymentStatus.CANCELLED)
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("uuid", pa.string()),
+    ("from_account", pa.string()),
+    ("to_account", pa.string()),
+    ("amount", pa.float64()),
+    ("status", pa.string()),
+    ("description", pa.string()),
+    ("source_routing_number", pa.string()),
+    ("destination_routing_number", pa.string()),
+    ("payment_type", pa.string()),
+    ("idempotency_key", pa.string()),
+    ("organization_id", pa.string()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("updated_at", pa.timestamp("us", tz="UTC")),
+])
+
+_UUID_FIELDS = ("uuid", "from_account", "to_account", "organization_id")
+
+class ArchivedPayment:
+    """A payment read back from the archive, exposing the same attributes as the Payment model."""
+
+    archived = True
+
+    def __init__(self, record: Dict[str, Any]):
+        for field in ARCHIVE_SCHEMA.names:
+            value = record.get(field)
+            if field in _UUID_FIELDS and value is not None:
+                value = UUID(value)
+            elif field == "status":
+                value = PaymentStatus(value)
+            setattr(self, field, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {field: getattr(self, field) for field in ARCHIVE_SCHEMA.names}
+        data["archived"] = True
+        return data
+
+def hot_window_start(now: Optional[datetime] = None, after_days: int = PAYMENT_ARCHIVE_AFTER_DAYS) -> datetime:
+    """Oldest created_at still guaranteed to be in the hot table."""
+    return (now or datetime.now(timezone.utc)) - timedelta(days=after_days)
+
+def organization_dir(organization_id: Optional[UUID], root: str = PAYMENT_ARCHIVE_DIR) -> str:
+    return os.path.join(root, f"organization_id={organization_id or 'none'}")
+
+def month_dir(organization_id: Optional[UUID], month: date, root: str = PAYMENT_ARCHIVE_DIR) -> str:
+    return os.path.join(organization_dir(organization_id, root), f"month={month.year:04d}-{month.month:02d}")
+
+def payment_record(payment: Payment) -> Dict[str, Any]:
+    """Archive row for a payment."""
+    return {
+        "uuid": str(payment.uuid),
+        "from_account": str(payment.from_account),
+        "to_account": str(payment.to_account),
+        "amount": payment.amount,
+        "status": PaymentStatus(payment.status).value,
+        "description": payment.description,
+        "source_routing_number": payment.source_routing_number,
+        "destination_routing_number": payment.destination_routing_number,
+        "payment_type": payment.payment_type,
+        "idempotency_key": payment.idempotency_key,
+        "organization_id": str(payment.organization_id) if payment.organization_id else None,
+        "created_at": payment.created_at,
+        "updated_at": payment.updated_at,
+    }
+
+def write_archive_file(
+    records: List[Dict[str, Any]],
+    organization_id: Optional[UUID],
+    month: date,
+    root: str = PAYMENT_ARCHIVE_DIR
+) -> str:
+    """Write one compressed Parquet file for an organization's month and return its path."""
+    directory = month_dir(organization_id, month, root)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{uuid4().hex[:8]}.parquet")
+    table = pa.Table.from_pylist(sorted(records, key=lambda record: record["created_at"]), schema=ARCHIVE_SCHEMA)
+    # Write under a temporary name so readers never see a partial file
+    pq.write_table(table, path + ".tmp", compression=PAYMENT_ARCHIVE_COMPRESSION)
+    os.replace(path + ".tmp", path)
+    return path
+
+def read_archived_payment(path: str, payment_id: UUID) -> Optional[ArchivedPayment]:
+    """Read a single payment from an archive file."""
+    if not os.path.exists(path):
+        logger.error(f"Archive file {path} for payment {payment_id} is missing")
+        return None
+    rows = pq.read_table(path, filters=[("uuid", "=", str(payment_id))]).to_pylist()
+    return ArchivedPayment(rows[0]) if rows else None
+
+def _archive_months(
+    organization_id: Optional[UUID],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    root: str
+) -> Dict[date, List[str]]:
+    """Parquet files by month, of the organization and month directories that can hold payments in [start, end)."""
+    if organization_id is not None:
+        org_dirs = [organization_dir(organization_id, root)]
+    elif os.path.isdir(root):
+        org_dirs = [os.path.join(root, name) for name in sorted(os.listdir(root))]
+    else:
+        org_dirs = []
+
+    first_month = month_start(start.astimezone(timezone.utc).date()) if start else None
+    last_month = month_start(end.astimezone(timezone.utc).date()) if end else None
+    months: Dict[date, List[str]] = defaultdict(list)
+    for org_dir in org_dirs:
+        if not os.path.isdir(org_dir):
+            continue
+        for name in sorted(os.listdir(org_dir)):
+            if not name.startswith("month="):
+                continue
+            month = date.fromisoformat(name[len("month="):] + "-01")
+            if (first_month and month < first_month) or (last_month and month > last_month):
+                continue
+            directory = os.path.join(org_dir, name)
+            months[month].extend(
+                os.path.join(directory, file_name)
+                for file_name in sorted(os.listdir(directory))
+                if file_name.endswith(".parquet")
+            )
+    return {month: files for month, files in sorted(months.items()) if files}
+
+def _archive_files(
+    organization_id: Optional[UUID],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    root: str
+) -> List[str]:
+    """Parquet files whose organization and month directories can hold payments in [start, end)."""
+    return [path for files in _archive_months(organization_id, start, end, root).values() for path in files]
+
+def _archive_filters(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    status: Optional[PaymentStatus],
+    min_amount: Optional[float],
+    max_amount: Optional[float]
+) -> List[Tuple[str, str, Any]]:
+    filters: List[Tuple[str, str, Any]] = []
+    if start:
+        filters.append(("created_at", ">=", start))
+    if end:
+        filters.append(("created_at", "<", end))
+    if status:
+        filters.append(("status", "=", PaymentStatus(status).value))
+    if min_amount is not None:
+        filters.append(("amount", ">=", min_amount))
+    if max_amount is not None:
+        filters.append(("amount", "<=", max_amount))
+    return filters
+
+def _sort_column(table: pa.Table, sort_key: str) -> pa.ChunkedArray:
+    # Statuses sort by enum declaration order, as Postgres sorts enum values
+    if sort_key == "status":
+        return pc.index_in(table["status"], value_set=pa.array([member.value for member in PaymentStatus]))
+    return table[sort_key]
+
+def _sort_scalar(sort_key: str, value: Any) -> Any:
+    if sort_key == "status":
+        return _sort_value(PaymentStatus(getattr(value, "value", value)))
+    return value.value if isinstance(value, Enum) else value
+
+def scan_archive(
+    organization_id: Optional[UUID] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[PaymentStatus] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    sort_key: Optional[str] = None,
+    direction: str = "desc",
+    after: Optional[Tuple[Any, UUID]] = None,
+    limit: Optional[int] = None,
+    root: str = PAYMENT_ARCHIVE_DIR
+) -> List[ArchivedPayment]:
+    """Archived payments matching the list_payments filters; start is inclusive and end exclusive.
+
+    With a sort_key the rows come back ordered like ORDER BY sort_key, uuid, starting
+    after the (value, uuid) keyset cursor and cut at limit, so only that page is built.
+    """
+    months = _archive_months(organization_id, start, end, root)
+    if not months:
+        return []
+
+    # Months partition created_at, so a created_at page is read month by month in listing
+    # order and stops once it holds limit rows; other sort keys need every matching month
+    if sort_key == "created_at" and limit is not None:
+        batches = [months[month] for month in sorted(months, reverse=direction == "desc")]
+    else:
+        batches = [[path for files in months.values() for path in files]]
+
+    filters = _archive_filters(start, end, status, min_amount, max_amount)
+    tables = []
+    found = 0
+    for files in batches:
+        table = pq.read_table(files, schema=ARCHIVE_SCHEMA, filters=filters or None)
+        if sort_key and after:
+            # Canonical uuid strings order like the uuids themselves
+            key = _sort_column(table, sort_key)
+            last_value, last_uuid = _sort_scalar(sort_key, after[0]), str(after[1])
+            past = pc.less if direction == "desc" else pc.greater
+            table = table.filter(pc.or_(
+                past(key, last_value),
+                pc.and_(pc.equal(key, last_value), past(table["uuid"], last_uuid))
+            ))
+        tables.append(table)
+        found += table.num_rows
+        if limit is not None and found >= limit:
+            break
+
+    table = pa.concat_tables(tables)
+    if sort_key:
+        # NULLs go last ascending and first descending, as in Postgres
+        order, nulls = ("descending", "at_start") if direction == "desc" else ("ascending", "at_end")
+        table = table.append_column("_sort", _sort_column(table, sort_key)).sort_by(
+            [("_sort", order, nulls), ("uuid", order, nulls)]
+        ).drop_columns(["_sort"])
+    if limit is not None:
+        table = table.slice(0, limit)
+    return [ArchivedPayment(record) for record in table.to_pylist()]
+
+def count_archive(
+    organization_id: Optional[UUID] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    status: Optional[PaymentStatus] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    root: str = PAYMENT_ARCHIVE_DIR
+) -> int:
+    """Number of archived payments scan_archive would match without a cursor or limit.
+
+    Answered from the Parquet footers: row groups whose statistics show they
+    match entirely are counted without being read, so unfiltered counts of
+    whole months read no data at all.
+    """
+    files = _archive_files(organization_id, start, end, root)
+    if not files:
+        return 0
+    filters = _archive_filters(start, end, status, min_amount, max_amount)
+    dataset = ds.dataset(files, schema=ARCHIVE_SCHEMA, format="parquet")
+    return dataset.count_rows(filter=pq.filters_to_expression(filters) if filters else None)
+
+def _sort_value(value: Any) -> Any:
+    # Enums sort in declaration order, as Postgres sorts enum values
+    if isinstance(value, Enum):
+        return [member.value for member in type(value)].index(value.value)
+    return value
+
+def sort_payments(payments: Iterable[Any], sort_key: str, direction: str) -> List[Any]:
+    """Sort like ORDER BY sort_key, uuid with Postgres NULL placement (last ascending, first descending)."""
+    def key(payment: Any) -> Tuple:
+        value = getattr(payment, sort_key)
+        return (value is None, _sort_value(value) if value is not None else 0, payment.uuid)
+    return sorted(payments, key=key, reverse=direction == "desc")
+
+def merge_with_archive(hot: List[Any], archived: List[Any], sort_key: str, direction: str) -> List[Any]:
+    """Merge hot and archived payments in listing order, dropping archived duplicates of hot rows."""
+    hot_ids = {payment.uuid for payment in hot}
+    return sort_payments(hot + [p for p in archived if p.uuid not in hot_ids], sort_key, direction)
+
+async def archive_payments(
+    session: AsyncSession,
+    older_than_days: int = PAYMENT_ARCHIVE_AFTER_DAYS,
+    batch_size: int = 5000,
+    root: str = PAYMENT_ARCHIVE_DIR
+) -> int:
+    """Move one batch of settled payments older than the cutoff to Parquet and return how many moved.
+
+    Files are written before the transaction that indexes the payments and deletes them
+    from the hot table commits; if it fails the new files are removed again.
+    """
+    cutoff = hot_window_start(after_days=older_than_days)
+    result = await session.execute(
+        select(Payment)
+        .where(Payment.status.in_(TERMINAL_STATUSES), Payment.created_at < cutoff)
+        .order_by(Payment.created_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    payments = result.scalars().all()
+    if not payments:
+        return 0
+
+    groups: Dict[Tuple[Optional[UUID], date], List[Payment]] = defaultdict(list)
+    for payment in payments:
+        groups[(payment.organization_id, month_start(payment.created_at.astimezone(timezone.utc).date()))].append(payment)
+
+    written = []
+    try:
+        for (organization_id, month), group in groups.items():
+            path = write_archive_file([payment_record(payment) for payment in group], organization_id, month, root)
+            written.append(path)
+            session.add_all([
+                PaymentArchiveEntry(
+                    payment_uuid=payment.uuid,
+                    organization_id=payment.organization_id,
+                    created_at=payment.created_at,
+                    archive_file=os.path.relpath(path, root)
+                )
+                for payment in group
+            ])
+        await session.execute(
+            delete(Payment)
+            .where(Payment.uuid.in_([payment.uuid for payment in payments]), Payment.created_at < cutoff)
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        for path in written:
+            os.remove(path)
+        raise
+
+    logger.info(f"Archived {len(payments)} payments into {len(written)} files")
+    return len(payments)
+
+def archive_file_path(entry: PaymentArchiveEntry, root: str = PAYMENT_ARCHIVE_DIR) -> str:
+    return os.path.join(root, entry.archive_file)
@@ -7,7 +7,7 @@ from pydantic import BaseModel, UUID4, EmailStr, validator
 from datetime import datetime
 import logging
 
-from config.database import get_db
+from config.database import get_db, get_read_db
 from domain.sql_models import (
     SuperUser, 
     OrganizationAdministrator, 
@@ -20,6 +20,7 @@ from domain.sql_models import (
 from .roles import Role, RoleChecker
 from .service import AuthService, get_auth_service
 from .jwt import get_current_user
+from api.pagination import COUNT_MODES, fetch_page_with_total
 
 logger = logging.getLogger(__name__)
 
@@ -105,7 +106,7 @@ class AdminResponse(AdminBase):
 
 class OrganizationsResponse(BaseModel):
     organizations: List[OrganizationResponse]
-    total: int
+    total: Optional[int] = None
 
 class UsersResponse(BaseModel):
     data: List[Union[UserResponse, AdminResponse]]
@@ -128,12 +129,13 @@ async def create_organization(
 
 @router.get("/organizations", response_model=OrganizationsResponse)
 async def list_organizations(
-    session: AsyncSession = Depends(get_db),
+    session: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user),
     limit: int = 10,
     offset: int = 0,
     sort_by: Optional[str] = None,
-    sort_direction: Optional[str] = 'desc'
+    sort_direction: Optional[str] = 'desc',
+    count: str = Query("exact", description="Total count mode: exact, estimated (planner statistics) or none")
 ):
     """List all organizations. Only superusers can view all organizations."""
     if current_user.role != UserRole.SUPERUSER:
@@ -142,10 +144,14 @@ async def list_organizations(
             detail="Only superusers can view all organizations"
         )
 
-    # Get total count
+    if count not in COUNT_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid count mode. Must be one of: {', '.join(COUNT_MODES)}"
+        )
+
+    # Total count, fetched in the same round trip as the page
     count_query = select(func.count()).select_from(Organization)
-    total_result = await session.execute(count_query)
-    total = total_result.scalar()
 
     # Get paginated and sorted results
     query = select(Organization)
@@ -161,8 +167,9 @@ async def list_organizations(
     # Apply pagination
     query = query.offset(offset).limit(limit)
     
-    result = await session.execute(query)
-    organizations = result.scalars().all()
+    organizations, total = await fetch_page_with_total(
+        session, query, count_query, count_mode=count, first_page=offset == 0
+    )
 
     return {
         "organizations": organizations,
@@ -474,7 +481,7 @@ async def list_users(
     offset: int = Query(0, ge=0),
     sort_by: Optional[str] = Query(None, description="Field to sort by (email, first_name, last_name, role, created_at, organization)"),
     sort_direction: Optional[str] = Query('desc', description="Sort direction (asc/desc)"),
-    session: AsyncSession = Depends(get_db),
+    session: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """List users with pagination and sorting. Superusers can view all users, org admins can only view users in their org."""
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Monthly partitions of payments kept ready beyond the current month
+PAYMENT_PARTITION_MONTHS_AHEAD = int(os.getenv("PAYMENT_PARTITION_MONTHS_AHEAD", "3"))
+# How often the maintenance task checks that future partitions exist
+PAYMENT_PARTITION_CHECK_SECONDS = float(os.getenv("PAYMENT_PARTITION_CHECK_SECONDS", "3600"))
+
+PAYMENT_DEFAULT_PARTITION = "payments_default"
+
+UNPARTITIONED_PAYMENTS_WARNING = "The payments table is not partitioned; run `alembic upgrade head` to convert it"
+
+_PARTITION_NAME = re.compile(r"payments_y(\d{4})m(\d{2})")
+
+def month_start(value: date) -> date:
+    """First day of the month containing value."""
+    return date(value.year, value.month, 1)
+
+def add_months(value: date, months: int) -> date:
+    """First day of the month `months` months after the month containing value."""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def payment_partition_name(month: date) -> str:
+    return f"payments_y{month.year:04d}m{month.month:02d}"
+
+def partition_month(name: str) -> Optional[date]:
+    """Month of a partition named by payment_partition_name, or None for other tables."""
+    match = _PARTITION_NAME.fullmatch(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def payment_partition_ddl(month: date) -> str:
+    """CREATE TABLE statement for the partition holding payments created in the given month (UTC)."""
+    start = month_start(month)
+    end = add_months(start, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {payment_partition_name(start)} PARTITION OF payments "
+        f"FOR VALUES FROM ('{start.isoformat()} 00:00:00+00') TO ('{end.isoformat()} 00:00:00+00')"
+    )
+
+async def payments_are_partitioned(conn: AsyncConnection) -> bool:
+    """Whether payments is the partitioned table of the migrations, not a plain one created before them."""
+    result = await conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = 'payments'"
+    ))
+    return result.scalar_one_or_none() is not None
+
+async def ensure_payment_partitions(
+    conn: AsyncConnection,
+    months_ahead: int = PAYMENT_PARTITION_MONTHS_AHEAD,
+    today: Optional[date] = None
+) -> List[str]:
+    """Create the default partition and the monthly partitions from the current month to months_ahead."""
+    today = today or datetime.now(timezone.utc).date()
+    created = []
+    wanted = [payment_partition_name(add_months(today, offset)) for offset in range(months_ahead + 1)]
+    existing = {
+        row[0] for row in await conn.execute(
+            text("SELECT relname FROM pg_class WHERE relname = ANY(:names)"),
+            {"names": wanted + [PAYMENT_DEFAULT_PARTITION]}
+        )
+    }
+
+    if PAYMENT_DEFAULT_PARTITION not in existing:
+        await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {PAYMENT_DEFAULT_PARTITION} PARTITION OF payments DEFAULT"))
+        created.append(PAYMENT_DEFAULT_PARTITION)
+
+    for offset, name in enumerate(wanted):
+        if name in existing:
+            continue
+        # Fails if the default partition already holds rows for that month; those must be moved first
+        await conn.execute(text(payment_partition_ddl(add_months(today, offset))))
+        created.append(name)
+
+    if created:
+        logger.info(f"Created payment partitions: {', '.join(created)}")
+    return created
+
+async def drop_empty_payment_partitions(conn: AsyncConnection, before: date) -> List[str]:
+    """Drop monthly partitions that end on or before `before` and hold no rows (e.g. after archiving)."""
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'payments'"
+    ))
+    dropped = []
+    for name in sorted(row[0] for row in result):
+        month = partition_month(name)
+        if month is None or add_months(month, 1) > before:
+            continue
+        if (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name})"))).scalar():
+            continue
+        await conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+
+    if dropped:
+        logger.info(f"Dropped empty payment partitions: {', '.join(dropped)}")
+    return dropped
+
+async def maintain_payment_partitions(engine: AsyncEngine) -> None:
+    """Background task that keeps future payment partitions created ahead of time."""
+    logger.info("Payment partition maintenance started")
+    try:
+        while True:
+            try:
+                async with engine.begin() as conn:
+                    if await payments_are_partitioned(conn):
+                        await ensure_payment_partitions(conn)
+                    else:
+                        logger.warning(f"{UNPARTITIONED_PAYMENTS_WARNING}; skipping partition maintenance")
+            except Exception as e:
+                logger.error(f"Payment partition maintenance failed: {str(e)}")
+            await asyncio.sleep(PAYMENT_PARTITION_CHECK_SECONDS)
+    except asyncio.CancelledError:
+        logger.info("Payment partition maintenance cancelled")
+        raise
@@ -0,0 +1,114 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool
+
+class PoolMetrics:
+    """Collects live connection pool statistics for an engine."""
+
+    def __init__(self, window_seconds: int = 60, wait_samples: int = 1000):
+        self.window_seconds = window_seconds
+        self.connects_total = 0
+        self.checkouts_total = 0
+        self.checked_out = 0
+        self.invalidations_total = 0
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts_total = 0
+        self._connect_times: Deque[float] = deque()
+        self._recent_waits: Deque[float] = deque(maxlen=wait_samples)
+
+    def attach(self, engine: AsyncEngine) -> None:
+        """Register pool event listeners on the given engine."""
+        sync_engine = engine.sync_engine
+        event.listen(sync_engine, "connect", self._on_connect)
+        event.listen(sync_engine, "checkout", self._on_checkout)
+        event.listen(sync_engine, "checkin", self._on_checkin)
+        event.listen(sync_engine, "invalidate", self._on_invalidate)
+        if isinstance(sync_engine.pool, InstrumentedAsyncQueuePool):
+            sync_engine.pool.metrics = self
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        now = time.monotonic()
+        self.connects_total += 1
+        self._connect_times.append(now)
+        self._trim_connect_times(now)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self.checkouts_total += 1
+        self.checked_out += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception) -> None:
+        self.invalidations_total += 1
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        """Record how long a caller waited to get a connection from the pool."""
+        self.wait_count += 1
+        self.wait_time_total += seconds
+        self.wait_time_max = max(self.wait_time_max, seconds)
+        self._recent_waits.append(seconds)
+        if timed_out:
+            self.timeouts_total += 1
+
+    def _trim_connect_times(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._connect_times and self._connect_times[0] < cutoff:
+            self._connect_times.popleft()
+
+    def snapshot(self, pool: Optional[Pool] = None) -> Dict[str, Any]:
+        """Return the current pool statistics as a dictionary."""
+        self._trim_connect_times(time.monotonic())
+        recent = sorted(self._recent_waits)
+        stats: Dict[str, Any] = {
+            "checked_out": self.checked_out,
+            "checkouts_total": self.checkouts_total,
+            "connects_total": self.connects_total,
+            "connects_per_second": round(len(self._connect_times) / self.window_seconds, 3),
+            "invalidations_total": self.invalidations_total,
+            "wait": {
+                "count": self.wait_count,
+                "avg_ms": round(self.wait_time_total / self.wait_count * 1000, 3) if self.wait_count else 0.0,
+                "max_ms": round(self.wait_time_max * 1000, 3),
+                "p95_ms": round(recent[int(len(recent) * 0.95) - 1] * 1000, 3) if recent else 0.0,
+                "timeouts_total": self.timeouts_total
+            }
+        }
+        if pool is not None:
+            stats["pool_class"] = type(pool).__name__
+            if isinstance(pool, AsyncAdaptedQueuePool):
+                stats.update({
+                    "size": pool.size(),
+                    "checked_in": pool.checkedin(),
+                    "overflow": max(pool.overflow(), 0),
+                    "max_overflow": pool._max_overflow
+                })
+        return stats
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Async queue pool that reports checkout wait time to PoolMetrics."""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        if self.metrics is not None:
+            self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
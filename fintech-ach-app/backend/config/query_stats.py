@@ -0,0 +1,125 @@
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Union
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# A fingerprint seen this many times in one request is reported as a likely N+1 query
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "3"))
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<!:):\w+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(statement: str) -> str:
+    """Normalize a SQL statement so that executions differing only in values compare equal."""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PARAMETER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _IN_LIST.sub("(?)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+class QueryStats:
+    """Statement count, DB time and fingerprints collected for one unit of work."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.statements = 0
+        self.total_time = 0.0
+        self.fingerprints: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.statements += 1
+        self.total_time += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold: int = 2) -> Dict[str, int]:
+        """Fingerprints executed at least `threshold` times."""
+        return {fp: count for fp, count in self.fingerprints.items() if count >= threshold}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "db_statements": self.statements,
+            "db_time_ms": round(self.total_time * 1000, 3),
+            "db_repeated_statements": self.repeated(SQL_REPEAT_THRESHOLD)
+        }
+
+current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    start_times = conn.info.get("query_start_time")
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+
+def _handle_error(exception_context) -> None:
+    # A failed statement never reaches after_cursor_execute; record it here so its start time does not leak
+    if exception_context.connection is None or exception_context.statement is None:
+        return
+    _after_cursor_execute(
+        exception_context.connection, None, exception_context.statement,
+        exception_context.parameters, exception_context.execution_context, False
+    )
+
+def instrument_engine(engine: Union[Engine, AsyncEngine]) -> None:
+    """Record every statement executed through the engine into the current QueryStats."""
+    sync_engine = engine.sync_engine if isinstance(engine, AsyncEngine) else engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+@contextmanager
+def track_queries(request_id: Optional[str] = None) -> Iterator[QueryStats]:
+    """Collect statistics for all statements executed inside the block."""
+    stats = QueryStats(request_id)
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+def log_query_stats(stats: QueryStats) -> None:
+    """Log a request's query statistics and warn about likely N+1 patterns."""
+    summary = stats.summary()
+    logger.info(
+        f"Request {stats.request_id} issued {stats.statements} statements in {summary['db_time_ms']}ms",
+        extra=summary
+    )
+    for statement, count in summary["db_repeated_statements"].items():
+        logger.warning(
+            f"Possible N+1 query in request {stats.request_id}: statement repeated {count} times: {statement[:200]}",
+            extra={"request_id": stats.request_id}
+        )
+
+@contextmanager
+def query_budget(max_queries: Optional[int] = None, max_repeats: int = SQL_REPEAT_THRESHOLD - 1) -> Iterator[QueryStats]:
+    """Test helper that fails when the block exceeds its query budget or repeats a statement in a loop."""
+    with track_queries("query-budget") as stats:
+        yield stats
+
+    problems = []
+    if max_queries is not None and stats.statements > max_queries:
+        problems.append(f"{stats.statements} statements executed, budget is {max_queries}")
+    for statement, count in stats.repeated(max_repeats + 1).items():
+        problems.append(f"statement repeated {count} times (max {max_repeats}): {statement}")
+    if problems:
+        raise AssertionError("Query budget exceeded:\n  " + "\n  ".join(problems))
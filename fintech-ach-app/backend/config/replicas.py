@@ -0,0 +1,101 @@
+import hashlib
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncEngine
+from .pool_metrics import PoolMetrics
+
+logger = logging.getLogger(__name__)
+
+class Replica:
+    """A read replica engine together with its health state."""
+
+    def __init__(self, name: str, engine: AsyncEngine, metrics: Optional[PoolMetrics] = None):
+        self.name = name
+        self.engine = engine
+        self.metrics = metrics
+        self.unhealthy_until = 0.0
+        self.failures_total = 0
+        self.last_error: Optional[str] = None
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def checked_out(self) -> int:
+        return self.metrics.checked_out if self.metrics else 0
+
+class ReplicaRouter:
+    """Routes read-only sessions across replicas with health tracking and read-your-writes pinning."""
+
+    def __init__(self, replicas: List[Replica], cooldown_seconds: float = 30, pin_seconds: float = 0):
+        self.replicas = replicas
+        self.cooldown_seconds = cooldown_seconds
+        self.pin_seconds = pin_seconds
+        self.primary_fallbacks_total = 0
+        self._pins: Dict[str, float] = {}
+        self._rotation = itertools.count()
+
+    def choose(self, caller_key: Optional[str] = None) -> Optional[Replica]:
+        """Pick the least busy healthy replica, or None when the primary should be used."""
+        now = time.monotonic()
+        if caller_key and self.is_pinned(caller_key, now):
+            return None
+
+        healthy = [replica for replica in self.replicas if replica.is_healthy(now)]
+        if not healthy:
+            if self.replicas:
+                self.primary_fallbacks_total += 1
+            return None
+
+        # Rotate the starting point so ties are broken round-robin
+        start = next(self._rotation) % len(healthy)
+        rotated = healthy[start:] + healthy[:start]
+        return min(rotated, key=lambda replica: replica.checked_out())
+
+    def mark_unhealthy(self, replica: Replica, error: Exception) -> None:
+        """Take a replica out of rotation for the cooldown period."""
+        replica.unhealthy_until = time.monotonic() + self.cooldown_seconds
+        replica.failures_total += 1
+        replica.last_error = str(error)
+        self.primary_fallbacks_total += 1
+        logger.warning(f"Read replica {replica.name} marked unhealthy for {self.cooldown_seconds}s: {str(error)}")
+
+    def pin(self, caller_key: str) -> None:
+        """Send a caller's reads to the primary for a short time after it writes."""
+        if self.pin_seconds <= 0:
+            return
+        now = time.monotonic()
+        self._pins[caller_key] = now + self.pin_seconds
+        if len(self._pins) > 10000:
+            self._pins = {key: until for key, until in self._pins.items() if until > now}
+
+    def is_pinned(self, caller_key: str, now: Optional[float] = None) -> bool:
+        until = self._pins.get(caller_key)
+        if until is None:
+            return False
+        if until <= (now if now is not None else time.monotonic()):
+            self._pins.pop(caller_key, None)
+            return False
+        return True
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        return [
+            {
+                "name": replica.name,
+                "healthy": replica.is_healthy(now),
+                "failures_total": replica.failures_total,
+                "last_error": replica.last_error,
+                **(replica.metrics.snapshot(replica.engine.sync_engine.pool) if replica.metrics else {})
+            }
+            for replica in self.replicas
+        ]
+
+def caller_key(request: Request) -> str:
+    """Identify the caller of a request for read-your-writes pinning."""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode()).hexdigest()[:32]
+    return request.client.host if request.client else "anonymous"
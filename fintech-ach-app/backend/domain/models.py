@@ -73,4 +73,5 @@ class Payment(BaseModel):
     source_routing_number: str
     destination_routing_number: str
     payment_type: Literal["ach_debit", "ach_credit", "book"]
-    idempotency_key: str
\ No newline at end of file
+    idempotency_key: str
+    organization_id: Optional[UUID] = None
\ No newline at end of file
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, String, Float, ForeignKey, Enum as SQLEnum, DateTime, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Float, ForeignKey, Enum as SQLEnum, DateTime, Index, PrimaryKeyConstraint, func, text
+from sqlalchemy import BigInteger, Identity, Integer, SmallInteger
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from config.base import Base
 import uuid
@@ -102,8 +103,15 @@ class ExternalOrganizationBankAccount(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    # Range-partitioned by month of created_at (see config/partitions.py). Postgres requires
+    # the partition key in every unique constraint, so the table key is (uuid, created_at)
+    # and idempotency keys are enforced in payment_idempotency_keys.
+    __table_args__ = (
+        PrimaryKeyConstraint("uuid", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    uuid = Column(UUID(as_uuid=True), default=uuid.uuid4)
     from_account = Column(UUID(as_uuid=True), nullable=False)  # Can be either internal or external
     to_account = Column(UUID(as_uuid=True), nullable=False)    # Can be either internal or external
     amount = Column(Float, nullable=False)
@@ -112,10 +120,15 @@ class Payment(Base):
     source_routing_number = Column(String, nullable=False)
     destination_routing_number = Column(String, nullable=False)
     payment_type = Column(String, nullable=False)  # ach_debit or ach_credit
-    idempotency_key = Column(String, unique=True, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    idempotency_key = Column(String, nullable=False)
+    # Organization of the external account involved, copied here for tenant-scoped queries
+    organization_id = Column(UUID(as_uuid=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Payments are still identified by uuid alone in the ORM
+    __mapper_args__ = {"primary_key": [uuid]}
+
     # Add relationships without foreign key constraints
     from_internal_account = relationship(
         "InternalOrganizationBankAccount",
@@ -141,4 +154,79 @@ class Payment(Base):
         primaryjoin="Payment.to_account == ExternalOrganizationBankAccount.uuid",
         viewonly=True
     )
-  
\ No newline at end of file
+
+class PaymentIdempotencyKey(Base):
+    """Globally unique idempotency keys, which the partitioned payments table cannot enforce."""
+    __tablename__ = "payment_idempotency_keys"
+
+    idempotency_key = Column(String, primary_key=True)
+    payment_uuid = Column(UUID(as_uuid=True), nullable=False)
+    payment_created_at = Column(DateTime(timezone=True), nullable=False)
+
+class PaymentArchiveEntry(Base):
+    """Location of a payment moved from the hot table to the Parquet archive."""
+    __tablename__ = "payment_archive_index"
+
+    payment_uuid = Column(UUID(as_uuid=True), primary_key=True)
+    organization_id = Column(UUID(as_uuid=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    archive_file = Column(String, nullable=False)  # relative to PAYMENT_ARCHIVE_DIR
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class PaymentOutbox(Base):
+    """Payment waiting to be enqueued, written in the transaction that creates the payment."""
+    __tablename__ = "payment_outbox"
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    payment_uuid = Column(UUID(as_uuid=True), nullable=False)
+    organization_id = Column(UUID(as_uuid=True), nullable=True)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class PaymentQueueMessage(Base):
+    """Message of the Postgres payment queue backend (QUEUE_BACKEND=postgres)."""
+    __tablename__ = "payment_queue_messages"
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    payment_id = Column(String, nullable=False)
+    organization_id = Column(String, nullable=True)
+    priority = Column(String, nullable=False)
+    priority_rank = Column(SmallInteger, nullable=False)  # position in PRIORITY_LANES, lower first
+    body = Column(JSONB, nullable=False)
+    status = Column(String, nullable=False, server_default="queued")  # queued, in_flight or dead
+    retries = Column(Integer, nullable=False, server_default="0")
+    available_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+Index(
+    "ix_payment_queue_messages_ready",
+    PaymentQueueMessage.priority_rank,
+    PaymentQueueMessage.available_at,
+    PaymentQueueMessage.id,
+    postgresql_where=text("status = 'queued'")
+)
+Index(
+    "ix_payment_queue_messages_claimed",
+    PaymentQueueMessage.claimed_at,
+    postgresql_where=text("status = 'in_flight'")
+)
+
+# Indexes for the payment listing and worker hot paths (see migration 4c2a9e7b1d30)
+Index("ix_payments_status_created_at", Payment.status, Payment.created_at.desc(), Payment.uuid.desc())
+Index("ix_payments_created_at_uuid", Payment.created_at.desc(), Payment.uuid.desc())
+Index("ix_payments_from_account_created_at", Payment.from_account, Payment.created_at.desc())
+Index("ix_payments_to_account_created_at", Payment.to_account, Payment.created_at.desc())
+Index("ix_payments_organization_created_at", Payment.organization_id, Payment.created_at.desc(), Payment.uuid.desc())
+Index("ix_payments_amount", Payment.amount, postgresql_include=["status", "created_at"])
+Index(
+    "brin_payments_created_at",
+    Payment.created_at,
+    postgresql_using="brin",
+    postgresql_with={"pages_per_range": 32}
+)
+Index(
+    "ix_payments_in_flight",
+    Payment.created_at,
+    postgresql_where=text("status IN ('PENDING', 'PROCESSING')")
+)
@@ -1,3 +1,4 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -9,14 +10,20 @@ from typing import Callable
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import Response
 from dotenv import load_dotenv
-from config.database import init_db
-from message_queue.redis_queue import RedisQueue
+from config.database import engine, init_db, dispose_engines, get_pool_stats, replica_router
+from config.partitions import maintain_payment_partitions
+from config.replicas import caller_key
+from config.query_stats import QueryStats, current_query_stats, log_query_stats
+from message_queue.backpressure import queue_pressure
+from message_queue.base import init_queue, get_queue, close_queue
+from message_queue.outbox import relay_outbox
 from message_queue.queue_worker import start_background_workers
 from auth.routes import router as auth_router
 from auth.management import router as management_router
 from api.plaid_integration import router as plaid_router
 from api.payments import router as payments_router
 from api.accounts import router as accounts_router
+from api.dlq import router as dlq_router
 
 # Configure logging
 logging.basicConfig(
@@ -33,10 +40,6 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 logger.info("Environment variables loaded")
 
-# Initialize Redis queue
-queue = RedisQueue(os.getenv("REDIS_URL", "redis://localhost:6379"))
-logger.info("Redis queue initialized")
-
 class RequestLoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         start_time = datetime.now()
@@ -58,6 +61,10 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         # Log request
         logger.info("Incoming request", extra={"request": request_details})
         
+        # Collect per-request SQL statistics tagged with the request id
+        query_stats = QueryStats(request_id)
+        query_stats_token = current_query_stats.set(query_stats)
+        
         try:
             # Process request
             response = await call_next(request)
@@ -71,9 +78,12 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
                 extra={
                     "request_id": request_id,
                     "status_code": response.status_code,
-                    "duration": duration
+                    "duration": duration,
+                    "db_statements": query_stats.statements,
+                    "db_time_ms": round(query_stats.total_time * 1000, 3)
                 }
             )
+            log_query_stats(query_stats)
             
             return response
             
@@ -89,6 +99,17 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
                 exc_info=True
             )
             raise
+        finally:
+            current_query_stats.reset(query_stats_token)
+
+class ReadYourWritesMiddleware(BaseHTTPMiddleware):
+    """Pin callers to the primary database for a short time after a successful write."""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        response = await call_next(request)
+        if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+            replica_router.pin(caller_key(request))
+        return response
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -98,7 +119,11 @@ async def lifespan(app: FastAPI):
         logger.info("Starting application initialization")
         await init_db()
         logger.info("Database initialized")
-        workers = start_background_workers()
+        init_queue()
+        workers = start_background_workers() + [
+            asyncio.create_task(maintain_payment_partitions(engine)),
+            asyncio.create_task(relay_outbox(engine, get_queue()))
+        ]
         logger.info("Background workers started")
         yield
         # Shutdown: Clean up resources
@@ -106,6 +131,9 @@ async def lifespan(app: FastAPI):
         for worker in workers:
             if not worker.done():
                 worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await close_queue()
+        await dispose_engines()
         logger.info("Application shutdown complete")
     except Exception as e:
         logger.error(f"Error during application lifecycle: {str(e)}", exc_info=True)
@@ -116,6 +144,10 @@ app = FastAPI(lifespan=lifespan, title="Fintech ACH API")
 # Add request logging middleware
 app.add_middleware(RequestLoggingMiddleware)
 
+# Keep recent writers on the primary when read replicas are configured
+if replica_router.replicas and replica_router.pin_seconds > 0:
+    app.add_middleware(ReadYourWritesMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -131,13 +163,25 @@ logger.info("CORS middleware configured")
 async def get_queue_stats(request: Request):
     """Get current queue statistics."""
     try:
-        stats = await queue.get_queue_stats()
+        stats = await queue_pressure.read_stats(get_queue())
+        stats["backpressure"] = queue_pressure.describe(stats)
         logger.info("Queue stats retrieved successfully")
         return stats
     except Exception as e:
         logger.error(f"Error retrieving queue stats: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error retrieving queue statistics")
 
+@app.get("/db/pool/stats")
+async def get_db_pool_stats(request: Request):
+    """Get current database connection pool statistics."""
+    try:
+        stats = get_pool_stats()
+        logger.info("Database pool stats retrieved successfully")
+        return stats
+    except Exception as e:
+        logger.error(f"Error retrieving database pool stats: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error retrieving database pool statistics")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -155,6 +199,7 @@ app.include_router(management_router, tags=["management"])
 app.include_router(accounts_router, tags=["accounts"])
 app.include_router(payments_router, tags=["payments"])
 app.include_router(plaid_router, tags=["plaid"])
+app.include_router(dlq_router, tags=["dlq"])
 logger.info("API routers configured")
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+import os
+import random
+
+logger = logging.getLogger(__name__)
+
+# Retry n waits min(BASE * 2^(n-1), MAX) seconds, less up to JITTER of that delay at random
+RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("RETRY_BACKOFF_BASE_SECONDS", "2"))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("RETRY_BACKOFF_MAX_SECONDS", "300"))
+RETRY_BACKOFF_JITTER = float(os.getenv("RETRY_BACKOFF_JITTER", "0.5"))
+# Due retries moved back to the ready queue per promoter pass, and the pause between idle passes
+RETRY_PROMOTE_BATCH_SIZE = int(os.getenv("RETRY_PROMOTE_BATCH_SIZE", "100"))
+RETRY_PROMOTE_INTERVAL_SECONDS = float(os.getenv("RETRY_PROMOTE_INTERVAL_SECONDS", "1"))
+# A claimed message not settled within this many seconds is handed out again by the stale sweep
+QUEUE_VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("QUEUE_VISIBILITY_TIMEOUT_SECONDS", "1800"))
+# Expired claims recovered per sweep step
+QUEUE_SWEEP_BATCH_SIZE = int(os.getenv("QUEUE_SWEEP_BATCH_SIZE", "100"))
+
+def retry_delay(
+    retry_count: int,
+    base: float = RETRY_BACKOFF_BASE_SECONDS,
+    cap: float = RETRY_BACKOFF_MAX_SECONDS,
+    jitter: float = RETRY_BACKOFF_JITTER,
+    rng: random.Random = random
+) -> float:
+    """Seconds to wait before retry number retry_count (starting at 1)."""
+    delay = min(cap, base * 2 ** min(retry_count - 1, 32))
+    return delay * (1 - jitter * rng.random())
+
+async def retry_promoter(queue) -> None:
+    """Background task moving scheduled retries whose time has come back to the ready queue."""
+    logger.info("Retry promoter started")
+    try:
+        while True:
+            try:
+                promoted = await queue.promote_due_retries(RETRY_PROMOTE_BATCH_SIZE)
+                if promoted:
+                    logger.info(f"Promoted {promoted} scheduled retries")
+                # A full batch means more may be due already
+                if promoted < RETRY_PROMOTE_BATCH_SIZE:
+                    await asyncio.sleep(RETRY_PROMOTE_INTERVAL_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error promoting scheduled retries: {str(e)}")
+                await asyncio.sleep(RETRY_PROMOTE_INTERVAL_SECONDS)
+    except asyncio.CancelledError:
+        logger.info("Retry promoter cancelled")
+        raise
@@ -0,0 +1,194 @@
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+from .base import PaymentQueue
+from .outbox import outbox_backlog
+
+logger = logging.getLogger(__name__)
+
+# Payment creation is refused once queued payments (depth) or the oldest queued payment's wait (age) reach the
+# high watermark, and accepted again only when both are back under the low watermark; 0 disables a check.
+# Global pressure answers 503, an organization over its own watermarks 429.
+BACKPRESSURE_QUEUE_HIGH_WATERMARK = int(os.getenv("BACKPRESSURE_QUEUE_HIGH_WATERMARK", "10000"))
+BACKPRESSURE_QUEUE_LOW_WATERMARK = int(os.getenv("BACKPRESSURE_QUEUE_LOW_WATERMARK", "8000"))
+BACKPRESSURE_AGE_HIGH_WATERMARK_SECONDS = float(os.getenv("BACKPRESSURE_AGE_HIGH_WATERMARK_SECONDS", "600"))
+BACKPRESSURE_AGE_LOW_WATERMARK_SECONDS = float(os.getenv("BACKPRESSURE_AGE_LOW_WATERMARK_SECONDS", "300"))
+BACKPRESSURE_ORG_QUEUE_HIGH_WATERMARK = int(os.getenv("BACKPRESSURE_ORG_QUEUE_HIGH_WATERMARK", "1000"))
+BACKPRESSURE_ORG_QUEUE_LOW_WATERMARK = int(os.getenv("BACKPRESSURE_ORG_QUEUE_LOW_WATERMARK", "800"))
+BACKPRESSURE_ORG_AGE_HIGH_WATERMARK_SECONDS = float(os.getenv("BACKPRESSURE_ORG_AGE_HIGH_WATERMARK_SECONDS", "600"))
+BACKPRESSURE_ORG_AGE_LOW_WATERMARK_SECONDS = float(os.getenv("BACKPRESSURE_ORG_AGE_LOW_WATERMARK_SECONDS", "300"))
+# Payments created but not yet relayed from the outbox (rows, and the oldest row's wait) count as global pressure too
+BACKPRESSURE_OUTBOX_HIGH_WATERMARK = int(os.getenv("BACKPRESSURE_OUTBOX_HIGH_WATERMARK", "5000"))
+BACKPRESSURE_OUTBOX_LOW_WATERMARK = int(os.getenv("BACKPRESSURE_OUTBOX_LOW_WATERMARK", "4000"))
+BACKPRESSURE_OUTBOX_AGE_HIGH_WATERMARK_SECONDS = float(os.getenv("BACKPRESSURE_OUTBOX_AGE_HIGH_WATERMARK_SECONDS", "120"))
+BACKPRESSURE_OUTBOX_AGE_LOW_WATERMARK_SECONDS = float(os.getenv("BACKPRESSURE_OUTBOX_AGE_LOW_WATERMARK_SECONDS", "60"))
+# Retry-After sent with a refusal, and how long queue statistics are reused between checks
+BACKPRESSURE_RETRY_AFTER_SECONDS = int(os.getenv("BACKPRESSURE_RETRY_AFTER_SECONDS", "30"))
+BACKPRESSURE_STATS_TTL_SECONDS = float(os.getenv("BACKPRESSURE_STATS_TTL_SECONDS", "1"))
+
+class Watermark:
+    """High and low marks of one measurement; a value of 0 for high disables it."""
+
+    def __init__(self, high: float, low: float):
+        self.high = high
+        self.low = min(low, high)
+
+    def exceeded(self, value: Optional[float], engaged: bool) -> bool:
+        """Whether the value is over the mark: the high one when released, the low one while engaged."""
+        if not self.high or value is None:
+            return False
+        return value > self.low if engaged else value >= self.high
+
+class Rejection:
+    """Why a payment was refused, and the response that says so."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class QueuePressure:
+    """Tracks queue depth and age against global and per-organization watermarks.
+
+    Statistics come from the queue's get_queue_stats, plus the outbox backlog
+    when an outbox_backlog source is given, and are cached for stats_ttl
+    seconds, so payment creation adds at most one stats read per interval.
+    A relay that falls behind fills the outbox rather than the queue, so the
+    outbox watermarks engage global pressure like the queue's own. Backends
+    that report no per-organization statistics (streams) are only checked
+    globally, and age is only checked where the backend reports lane ages.
+    """
+
+    def __init__(
+        self,
+        depth: Watermark,
+        age: Watermark,
+        organization_depth: Watermark,
+        organization_age: Watermark,
+        retry_after: int = 30,
+        stats_ttl: float = 1,
+        outbox: Optional[Watermark] = None,
+        outbox_age: Optional[Watermark] = None,
+        outbox_backlog: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None
+    ):
+        self.depth = depth
+        self.age = age
+        self.organization_depth = organization_depth
+        self.organization_age = organization_age
+        self.outbox = outbox or Watermark(0, 0)
+        self.outbox_age = outbox_age or Watermark(0, 0)
+        self.outbox_backlog = outbox_backlog
+        self.retry_after = retry_after
+        self.stats_ttl = stats_ttl
+        self.engaged = False
+        self.engaged_organizations: Set[str] = set()
+        self._stats: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+
+    @staticmethod
+    def _measure(stats: Dict[str, Any]) -> Tuple[int, Optional[float]]:
+        """Queue depth and the oldest queued message's age in seconds, if reported."""
+        ages = [lane["oldest_age_seconds"] for lane in stats.get("lanes", {}).values()]
+        ages = [age for age in ages if age is not None]
+        return stats.get("main_queue_size", 0), max(ages) if ages else None
+
+    @staticmethod
+    def _measure_outbox(stats: Dict[str, Any]) -> Tuple[Optional[int], Optional[float]]:
+        """Outbox rows and the oldest row's age in seconds, if the outbox was read."""
+        outbox = stats.get("outbox", {})
+        return outbox.get("size"), outbox.get("oldest_age_seconds")
+
+    def evaluate(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Update the engaged state from queue statistics and describe the current pressure."""
+        depth, oldest_age = self._measure(stats)
+        outbox_size, outbox_age = self._measure_outbox(stats)
+        self.engaged = (
+            self.depth.exceeded(depth, self.engaged)
+            or self.age.exceeded(oldest_age, self.engaged)
+            or self.outbox.exceeded(outbox_size, self.engaged)
+            or self.outbox_age.exceeded(outbox_age, self.engaged)
+        )
+
+        organizations = stats.get("organizations", {})
+        self.engaged_organizations = {
+            organization_id
+            for organization_id, counts in organizations.items()
+            if self.organization_depth.exceeded(
+                counts.get("queued", 0), organization_id in self.engaged_organizations
+            ) or self.organization_age.exceeded(
+                counts.get("oldest_age_seconds"), organization_id in self.engaged_organizations
+            )
+        }
+        return self.describe(stats)
+
+    def describe(self, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """The pressure shown by queue statistics and the engaged state checks enforce, leaving that state as is."""
+        depth, oldest_age = self._measure(stats)
+        outbox_size, outbox_age = self._measure_outbox(stats)
+        return {
+            "engaged": self.engaged,
+            "depth": depth,
+            "oldest_age_seconds": oldest_age,
+            "outbox_size": outbox_size,
+            "outbox_oldest_age_seconds": outbox_age,
+            "engaged_organizations": sorted(self.engaged_organizations),
+            "watermarks": {
+                "depth": {"high": self.depth.high, "low": self.depth.low},
+                "age_seconds": {"high": self.age.high, "low": self.age.low},
+                "organization_depth": {"high": self.organization_depth.high, "low": self.organization_depth.low},
+                "organization_age_seconds": {"high": self.organization_age.high, "low": self.organization_age.low},
+                "outbox": {"high": self.outbox.high, "low": self.outbox.low},
+                "outbox_age_seconds": {"high": self.outbox_age.high, "low": self.outbox_age.low}
+            }
+        }
+
+    async def read_stats(self, queue: PaymentQueue) -> Dict[str, Any]:
+        """The queue's statistics with the outbox backlog under "outbox", when there is a source for it."""
+        stats = await queue.get_queue_stats()
+        if self.outbox_backlog is not None:
+            stats["outbox"] = await self.outbox_backlog()
+        return stats
+
+    async def refresh(self, queue: PaymentQueue) -> None:
+        """Re-read queue and outbox statistics once the cached ones are older than stats_ttl."""
+        now = time.monotonic()
+        if self._stats is not None and now - self._fetched_at < self.stats_ttl:
+            return
+        self._stats = await self.read_stats(queue)
+        self._fetched_at = now
+        self.evaluate(self._stats)
+
+    async def check(self, queue: PaymentQueue, organization_id: Optional[str] = None) -> Optional[Rejection]:
+        """The reason to refuse a new payment for the organization, or None to accept it.
+
+        Fails open: when statistics cannot be read the payment is accepted,
+        since the outbox holds it until the queue takes it.
+        """
+        try:
+            await self.refresh(queue)
+        except Exception as e:
+            logger.warning(f"Queue backpressure check skipped: {str(e)}")
+            return None
+        if self.engaged:
+            return Rejection(503, "Payment queue is overloaded, retry later", self.retry_after)
+        if organization_id is not None and str(organization_id) in self.engaged_organizations:
+            return Rejection(429, "Too many queued payments for this organization, retry later", self.retry_after)
+        return None
+
+async def read_outbox_backlog() -> Dict[str, Any]:
+    """Outbox backlog of the application database."""
+    from config.database import engine
+    return await outbox_backlog(engine)
+
+queue_pressure = QueuePressure(
+    Watermark(BACKPRESSURE_QUEUE_HIGH_WATERMARK, BACKPRESSURE_QUEUE_LOW_WATERMARK),
+    Watermark(BACKPRESSURE_AGE_HIGH_WATERMARK_SECONDS, BACKPRESSURE_AGE_LOW_WATERMARK_SECONDS),
+    Watermark(BACKPRESSURE_ORG_QUEUE_HIGH_WATERMARK, BACKPRESSURE_ORG_QUEUE_LOW_WATERMARK),
+    Watermark(BACKPRESSURE_ORG_AGE_HIGH_WATERMARK_SECONDS, BACKPRESSURE_ORG_AGE_LOW_WATERMARK_SECONDS),
+    retry_after=BACKPRESSURE_RETRY_AFTER_SECONDS,
+    stats_ttl=BACKPRESSURE_STATS_TTL_SECONDS,
+    outbox=Watermark(BACKPRESSURE_OUTBOX_HIGH_WATERMARK, BACKPRESSURE_OUTBOX_LOW_WATERMARK),
+    outbox_age=Watermark(BACKPRESSURE_OUTBOX_AGE_HIGH_WATERMARK_SECONDS, BACKPRESSURE_OUTBOX_AGE_LOW_WATERMARK_SECONDS),
+    outbox_backlog=read_outbox_backlog
+)
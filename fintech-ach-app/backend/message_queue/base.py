@@ -0,0 +1,157 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Queue implementation: "list" (Redis lists, also "redis"), "streams" (Redis Streams consumer group),
+# "postgres" (SKIP LOCKED table woken by LISTEN/NOTIFY) or "memory" (in-process, single node and tests)
+QUEUE_BACKEND = os.getenv("QUEUE_BACKEND", "list").lower()
+QUEUE_BACKENDS = ("list", "redis", "streams", "postgres", "memory")
+
+class PaymentQueue(ABC):
+    """Contract shared by the payment queue backends.
+
+    A dequeued message is a dict with payment_id, payload, retries and a
+    "receipt" handle. The receipt acknowledges the message (ack_batch),
+    schedules it for a delayed retry (retry_payment) or dead-letters it; a
+    message that is never settled is handed out again by
+    cleanup_stale_processing or the backend's own redelivery. Failures are
+    kept in the message's "attempts" history, which dead letters keep when
+    they are replayed (see dlq).
+    """
+
+    max_retries = 3
+
+    @abstractmethod
+    async def enqueue_payment(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """Add a payment to the queue and return its message id."""
+
+    async def enqueue_batch(self, messages: Sequence[Dict[str, Any]]) -> List[str]:
+        """Add several payments and return their message ids, in order.
+
+        Each message has payment_id and payload, and optionally organization_id
+        and priority. Backends with a network hop override this to add the
+        whole batch in one round trip.
+        """
+        return [
+            await self.enqueue_payment(
+                message["payment_id"], message["payload"], message.get("organization_id"), message.get("priority")
+            )
+            for message in messages
+        ]
+
+    @abstractmethod
+    async def dequeue_batch(self, n: int, max_wait: float = 1) -> List[Dict[str, Any]]:
+        """Claim up to n messages, waiting up to max_wait seconds for the first one."""
+
+    @abstractmethod
+    async def ack_batch(self, receipts: Iterable[str]) -> None:
+        """Acknowledge processed messages, removing them for good."""
+
+    @abstractmethod
+    async def retry_payment(self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None) -> bool:
+        """Schedule a failed message for a delayed retry; False once it was dead-lettered instead."""
+
+    @abstractmethod
+    async def dead_letter_payment(
+        self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None
+    ) -> None:
+        """Move a message to the dead letter queue."""
+
+    @abstractmethod
+    async def list_dead_letters(self, after: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """A page of dead letters, oldest first, after the given id; returns it and the next cursor, None at the end."""
+
+    @abstractmethod
+    async def get_dead_letter(self, dead_letter_id: str) -> Optional[Dict[str, Any]]:
+        """A dead letter by id, as list_dead_letters returns it; None if there is no such dead letter."""
+
+    @abstractmethod
+    async def replay_dead_letter(self, dead_letter_id: str) -> bool:
+        """Put a dead letter back on the queue with its retries reset; False if there is no such dead letter."""
+
+    @abstractmethod
+    async def promote_due_retries(self, limit: int) -> int:
+        """Make scheduled retries whose time has come available again; returns how many."""
+
+    @abstractmethod
+    async def cleanup_stale_processing(self, timeout_minutes: int = 30) -> None:
+        """Hand out again messages claimed longer than timeout_minutes ago."""
+
+    @abstractmethod
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """Queue depth (main_queue_size), in-flight, dead-letter and scheduled-retry counts."""
+
+    async def dequeue_payment(self) -> Optional[Dict[str, Any]]:
+        """Get the next payment from the queue; its "receipt" acknowledges it later."""
+        try:
+            batch = await self.dequeue_batch(1)
+            return batch[0] if batch else None
+        except Exception as e:
+            logger.error(f"Error dequeuing payment: {str(e)}")
+            return None
+
+    async def complete_payment(self, receipt: str) -> None:
+        """Acknowledge a processed message, removing it from the queue for good."""
+        try:
+            await self.ack_batch([receipt])
+        except Exception as e:
+            logger.error(f"Error completing message {receipt}: {str(e)}")
+            raise
+
+    async def close(self) -> None:
+        """Release the backend's connections."""
+
+# The application-wide queue, created and closed by the FastAPI lifespan
+_queue: Optional[PaymentQueue] = None
+
+def create_queue(backend: str = QUEUE_BACKEND) -> PaymentQueue:
+    """Create the queue implementation selected by QUEUE_BACKEND."""
+    if backend in ("list", "redis", "streams"):
+        from .redis_queue import RedisQueue, create_redis_client
+        from .sharded import QUEUE_SHARDS, create_sharded_queue
+        if QUEUE_SHARDS > 1:
+            return create_sharded_queue(backend, QUEUE_SHARDS)
+        if backend == "streams":
+            from .redis_streams import RedisStreamQueue, warn_ignored_scheduling_settings
+            warn_ignored_scheduling_settings()
+            return RedisStreamQueue(create_redis_client())
+        return RedisQueue(create_redis_client())
+    if backend == "postgres":
+        from config.database import engine
+        from .postgres_queue import PostgresQueue
+        return PostgresQueue(engine)
+    if backend == "memory":
+        from .in_process import InProcessQueue
+        return InProcessQueue()
+    raise ValueError(f"Unknown QUEUE_BACKEND {backend!r}; expected one of {', '.join(QUEUE_BACKENDS)}")
+
+def init_queue(backend: str = QUEUE_BACKEND) -> PaymentQueue:
+    """Create the shared queue."""
+    global _queue
+    if _queue is None:
+        _queue = create_queue(backend)
+        logger.info(f"{type(_queue).__name__} initialized ({backend} backend)")
+    return _queue
+
+def get_queue() -> PaymentQueue:
+    """Return the shared queue; usable as a FastAPI dependency."""
+    if _queue is None:
+        raise RuntimeError("Payment queue is not initialized; call init_queue() first")
+    return _queue
+
+async def close_queue() -> None:
+    """Close the shared queue's connections."""
+    global _queue
+    if _queue is not None:
+        await _queue.close()
+        _queue = None
+        logger.info("Payment queue closed")
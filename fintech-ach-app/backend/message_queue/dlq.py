@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+from .base import PaymentQueue
+
+logger = logging.getLogger(__name__)
+
+# Dead letters put back on the queue per second by a replay, and entries read per filtered page
+DLQ_REPLAY_RATE = float(os.getenv("DLQ_REPLAY_RATE", "10"))
+DLQ_SCAN_LIMIT = int(os.getenv("DLQ_SCAN_LIMIT", "1000"))
+# Fields of a dead letter that do not carry over to its replay
+DEAD_LETTER_FIELDS = ("id", "receipt", "retries", "error", "dead_lettered_at")
+
+_sequence = itertools.count()
+
+def with_failed_attempt(payment_data: Dict[str, Any], error: Optional[str]) -> Dict[str, Any]:
+    """Copy of a message without its receipt, with this failure appended to its attempt history."""
+    body = {key: value for key, value in payment_data.items() if key != "receipt"}
+    body["attempts"] = list(body.get("attempts") or []) + [{
+        "retry": int(payment_data.get("retries", 0)),
+        "error": error,
+        "failed_at": datetime.utcnow().isoformat()
+    }]
+    return body
+
+def dead_letter_body(payment_data: Dict[str, Any], error: Optional[str]) -> Dict[str, Any]:
+    """Dead letter of a message: its attempt history including this failure, the failure reason and when."""
+    body = with_failed_attempt(payment_data, error)
+    body["error"] = error
+    body["dead_lettered_at"] = datetime.utcnow().isoformat()
+    return body
+
+def dead_letter_id(message_id: str) -> str:
+    """Dead letter id that sorts by the time of dead-lettering; ties keep this process's order."""
+    return f"{int(time.time() * 1000):013d}-{next(_sequence) % 1000000:06d}-{message_id}"
+
+def replay_message(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """The message that puts a dead letter back on the queue: retries start over, the attempt history stays."""
+    message = {key: value for key, value in entry.items() if key not in DEAD_LETTER_FIELDS}
+    message["replays"] = int(entry.get("replays", 0)) + 1
+    message["timestamp"] = datetime.utcnow().isoformat()
+    return message
+
+class DeadLetterFilter:
+    """Selects dead letters by failure reason (substring), organization, payment type and age in seconds."""
+
+    def __init__(
+        self,
+        reason: Optional[str] = None,
+        organization_id: Optional[str] = None,
+        payment_type: Optional[str] = None,
+        older_than: Optional[float] = None,
+        newer_than: Optional[float] = None
+    ):
+        self.reason = reason.lower() if reason else None
+        self.organization_id = str(organization_id) if organization_id else None
+        self.payment_type = payment_type
+        self.older_than = older_than
+        self.newer_than = newer_than
+
+    def matches(self, entry: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+        if self.reason and self.reason not in str(entry.get("error") or "").lower():
+            return False
+        if self.organization_id and str(entry.get("organization_id")) != self.organization_id:
+            return False
+        if self.payment_type and (entry.get("payload") or {}).get("payment_type") != self.payment_type:
+            return False
+        if self.older_than is not None or self.newer_than is not None:
+            # Dead letters from before failures were recorded only have their enqueue time
+            since = entry.get("dead_lettered_at") or entry.get("timestamp")
+            if not since:
+                return False
+            age = ((now or datetime.utcnow()) - datetime.fromisoformat(since)).total_seconds()
+            if self.older_than is not None and age < self.older_than:
+                return False
+            if self.newer_than is not None and age > self.newer_than:
+                return False
+        return True
+
+async def find_dead_letters(
+    queue: PaymentQueue,
+    dead_letter_filter: Optional[DeadLetterFilter] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
+    scan_limit: int = DLQ_SCAN_LIMIT
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Up to limit matching dead letters, oldest first, after the cursor.
+
+    Reads the DLQ a page at a time and stops after scan_limit entries, so a
+    selective filter never loads the whole queue. Returns the matches and the
+    cursor to continue from, None once the end is reached.
+    """
+    dead_letter_filter = dead_letter_filter or DeadLetterFilter()
+    matches: List[Dict[str, Any]] = []
+    scanned = 0
+    cursor = after
+    while scanned < scan_limit:
+        page, next_cursor = await queue.list_dead_letters(cursor, min(100, scan_limit - scanned))
+        for entry in page:
+            scanned += 1
+            cursor = entry["id"]
+            if dead_letter_filter.matches(entry):
+                matches.append(entry)
+                if len(matches) == limit:
+                    return matches, cursor
+        if next_cursor is None:
+            return matches, None
+        cursor = next_cursor
+    return matches, cursor
+
+async def select_dead_letters(
+    queue: PaymentQueue,
+    dead_letter_filter: Optional[DeadLetterFilter] = None,
+    ids: Optional[Iterable[str]] = None,
+    max_count: Optional[int] = None
+) -> AsyncIterator[Dict[str, Any]]:
+    """The dead letters a replay takes: the given ids, each looked up directly, otherwise every one
+    matching the filter, read page by page; up to max_count."""
+    if max_count is not None and max_count <= 0:
+        return
+    count = 0
+    if ids is not None:
+        for dead_letter in ids:
+            entry = await queue.get_dead_letter(dead_letter)
+            if entry is None:
+                logger.warning(f"Dead letter {dead_letter} not found, skipped")
+                continue
+            yield entry
+            count += 1
+            if count == max_count:
+                return
+        return
+    cursor = None
+    while True:
+        page, cursor = await find_dead_letters(queue, dead_letter_filter, cursor, limit=100)
+        for entry in page:
+            yield entry
+            count += 1
+            if count == max_count:
+                return
+        if cursor is None:
+            return
+
+async def replay_dead_letters(
+    queue: PaymentQueue,
+    dead_letter_filter: Optional[DeadLetterFilter] = None,
+    ids: Optional[Iterable[str]] = None,
+    rate: float = DLQ_REPLAY_RATE,
+    max_count: Optional[int] = None,
+    replayed: Optional[List[str]] = None
+) -> List[str]:
+    """Put dead letters back on the queue, at most rate per second; returns the ids replayed.
+
+    Replays the given ids, otherwise every dead letter matching the filter,
+    up to max_count. Entries are read page by page as the replay goes, and
+    each id is appended to replayed once it is back on the queue.
+    """
+    replayed = replayed if replayed is not None else []
+    interval = 1 / rate if rate > 0 else 0
+    next_at = time.monotonic()
+    async for entry in select_dead_letters(queue, dead_letter_filter, ids, max_count):
+        await asyncio.sleep(max(0, next_at - time.monotonic()))
+        next_at = time.monotonic() + interval
+        if await queue.replay_dead_letter(entry["id"]):
+            replayed.append(entry["id"])
+        else:
+            logger.warning(f"Dead letter {entry['id']} was replayed by someone else, skipped")
+    logger.info(f"Replayed {len(replayed)} dead letters")
+    return replayed
+
+class ReplayJob:
+    """A replay running in the background, polled by its id while replayed grows."""
+
+    def __init__(self):
+        self.id = uuid4().hex
+        self.status = "running"
+        self.replayed: List[str] = []
+        self.error: Optional[str] = None
+        self.started_at = datetime.utcnow().isoformat()
+        self.finished_at: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self, queue: PaymentQueue, *args: Any) -> "ReplayJob":
+        """Run replay_dead_letters(queue, *args) as a task on the running loop."""
+        self.task = asyncio.create_task(self._run(queue, *args))
+        return self
+
+    async def _run(self, queue: PaymentQueue, *args: Any) -> None:
+        try:
+            await replay_dead_letters(queue, *args, replayed=self.replayed)
+            self.status = "completed"
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+            raise
+        except Exception as e:
+            logger.error(f"Replay job {self.id} failed after {len(self.replayed)} dead letters: {str(e)}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = datetime.utcnow().isoformat()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "replayed_count": len(self.replayed),
+            "replayed": list(self.replayed),
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
@@ -0,0 +1,240 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+from .backoff import RETRY_PROMOTE_BATCH_SIZE, retry_delay
+from .base import PaymentQueue
+from .dlq import dead_letter_body, dead_letter_id, replay_message, with_failed_attempt
+from .priority import PRIORITY_LANE_MAX_WAIT_SECONDS, PRIORITY_LANE_WEIGHTS, PRIORITY_LANES, assign_priority
+
+logger = logging.getLogger(__name__)
+
+class InProcessQueue(PaymentQueue):
+    """Payment queue held in process memory, for single-node deployments and tests.
+
+    Follows the Redis queue's priority lanes (weighted, with starvation
+    protection) but not its per-organization scheduling; organizations are
+    only counted in the statistics. Receipts are "<id>@<claim>", so a worker
+    whose claim was recovered by the sweep can no longer settle the message.
+    Messages do not survive a restart.
+    """
+
+    def __init__(self):
+        self.lanes: Dict[str, Deque[Tuple[str, float]]] = {priority: deque() for priority in PRIORITY_LANES}
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.in_flight: Dict[str, Tuple[str, float]] = {}
+        self.scheduled: List[Tuple[float, str]] = []
+        self.dead_letters: Dict[str, Dict[str, Any]] = {}
+        self.lane_weights = dict(PRIORITY_LANE_WEIGHTS)
+        self.lane_max_wait = dict(PRIORITY_LANE_MAX_WAIT_SECONDS)
+        self._lane_credits = {priority: 0 for priority in PRIORITY_LANES}
+        self._wakeup = asyncio.Event()
+
+    async def enqueue_payment(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """Add a payment to its priority lane and return its message id."""
+        priority = priority or assign_priority(payload.get("payment_type"), payload.get("amount"), organization_id)
+        if priority not in PRIORITY_LANES:
+            raise ValueError(f"Unknown priority lane {priority!r}")
+        message_id = self._push({
+            "payment_id": payment_id,
+            "payload": payload,
+            "organization_id": organization_id,
+            "priority": priority,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        logger.info(f"Payment {payment_id} enqueued successfully in the {priority} lane")
+        return message_id
+
+    def _push(self, message: Dict[str, Any]) -> str:
+        message_id = uuid4().hex
+        self.messages[message_id] = message
+        self.lanes[message.get("priority") or "standard"].append((message_id, time.time()))
+        self._wakeup.set()
+        return message_id
+
+    def _next_lane(self) -> Optional[str]:
+        """Most overdue lane past its maximum wait, otherwise smooth weighted round robin over lanes with work."""
+        now = time.time()
+        waiting = [priority for priority in PRIORITY_LANES if self.lanes[priority]]
+        if not waiting:
+            return None
+        overdue = {
+            priority: now - self.lanes[priority][0][1] - self.lane_max_wait[priority] for priority in waiting
+        }
+        most_overdue = max(waiting, key=lambda priority: overdue[priority])
+        if overdue[most_overdue] > 0:
+            return most_overdue
+        for priority in waiting:
+            self._lane_credits[priority] += self.lane_weights[priority]
+        chosen = max(waiting, key=lambda priority: self._lane_credits[priority])
+        self._lane_credits[chosen] -= sum(self.lane_weights[priority] for priority in waiting)
+        return chosen
+
+    def _claim(self, n: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < n:
+            priority = self._next_lane()
+            if priority is None:
+                break
+            message_id, _ = self.lanes[priority].popleft()
+            claim = uuid4().hex
+            self.in_flight[message_id] = (claim, time.time())
+            batch.append({**self.messages[message_id], "receipt": f"{message_id}@{claim}"})
+        return batch
+
+    def _release(self, receipt: str) -> Optional[str]:
+        """End the claim a receipt holds and return its message id, or None when that claim is no longer current."""
+        message_id, _, claim = receipt.rpartition("@")
+        current = self.in_flight.get(message_id)
+        if current is None or current[0] != claim:
+            return None
+        del self.in_flight[message_id]
+        return message_id
+
+    async def dequeue_batch(self, n: int, max_wait: float = 1) -> List[Dict[str, Any]]:
+        """Claim up to n payments in priority order, waiting up to max_wait seconds for the first one."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            batch = self._claim(n)
+            if batch:
+                return batch
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), remaining)
+            except asyncio.TimeoutError:
+                return []
+
+    async def ack_batch(self, receipts: Iterable[str]) -> None:
+        """Acknowledge processed messages, removing them for good."""
+        for receipt in receipts:
+            message_id = self._release(receipt)
+            if message_id is not None:
+                self.messages.pop(message_id, None)
+
+    async def retry_payment(self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None) -> bool:
+        """Schedule a failed payment for a delayed retry if under max retries, otherwise move to DLQ."""
+        payment_id = payment_data.get("payment_id")
+        retry_count = int(payment_data.get("retries", 0)) + 1
+        if retry_count > self.max_retries:
+            await self.dead_letter_payment(receipt, payment_data, error)
+            logger.warning(f"Payment {payment_id} moved to DLQ after {retry_count} retries")
+            return False
+
+        message_id = self._release(receipt)
+        if message_id is None:
+            logger.warning(f"Retry of payment {payment_id} ignored: its claim is no longer current")
+            return False
+        body = with_failed_attempt(payment_data, error)
+        body["retries"] = retry_count
+        body["timestamp"] = datetime.utcnow().isoformat()
+        delay = retry_delay(retry_count)
+        self.messages[message_id] = body
+        heapq.heappush(self.scheduled, (time.time() + delay, message_id))
+        logger.info(f"Payment {payment_id} scheduled for retry {retry_count}/{self.max_retries} in {delay:.1f}s")
+        return True
+
+    async def promote_due_retries(self, limit: int = RETRY_PROMOTE_BATCH_SIZE) -> int:
+        """Move up to limit scheduled retries that are due back to their lane."""
+        promoted = 0
+        now = time.time()
+        while self.scheduled and self.scheduled[0][0] <= now and promoted < limit:
+            _, message_id = heapq.heappop(self.scheduled)
+            if message_id not in self.messages:
+                continue
+            priority = self.messages[message_id].get("priority") or "standard"
+            self.lanes[priority].append((message_id, now))
+            promoted += 1
+        if promoted:
+            self._wakeup.set()
+        return promoted
+
+    async def dead_letter_payment(
+        self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None
+    ) -> None:
+        """Move a message to the dead letter queue."""
+        message_id = self._release(receipt)
+        if message_id is None:
+            payment_id = payment_data.get("payment_id")
+            logger.warning(f"Dead-lettering of payment {payment_id} ignored: its claim is no longer current")
+            return
+        self.dead_letters[dead_letter_id(message_id)] = dead_letter_body(payment_data, error)
+        self.messages.pop(message_id, None)
+
+    async def list_dead_letters(self, after: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """A page of dead letters, oldest first, after the given id."""
+        ids = sorted(self.dead_letters)
+        start = bisect.bisect_right(ids, after) if after else 0
+        page = ids[start:start + limit]
+        next_cursor = page[-1] if start + limit < len(ids) else None
+        return [{"id": entry_id, **self.dead_letters[entry_id]} for entry_id in page], next_cursor
+
+    async def get_dead_letter(self, dead_letter_id: str) -> Optional[Dict[str, Any]]:
+        """A dead letter by id."""
+        entry = self.dead_letters.get(dead_letter_id)
+        return {"id": dead_letter_id, **entry} if entry is not None else None
+
+    async def replay_dead_letter(self, dead_letter_id: str) -> bool:
+        """Put a dead letter back on its lane with its retries reset and its attempt history kept."""
+        entry = self.dead_letters.pop(dead_letter_id, None)
+        if entry is None:
+            return False
+        self._push(replay_message(entry))
+        return True
+
+    async def cleanup_stale_processing(self, timeout_minutes: int = 30) -> None:
+        """Schedule a retry for messages claimed longer than timeout_minutes ago."""
+        cutoff = time.time() - timeout_minutes * 60
+        for message_id, (claim, claimed_at) in list(self.in_flight.items()):
+            if claimed_at < cutoff:
+                await self.retry_payment(f"{message_id}@{claim}", self.messages[message_id], "Visibility timeout expired")
+                logger.info(f"Cleaned up stale message {message_id}")
+
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """Get current queue statistics, per priority lane and per organization."""
+        now = time.time()
+        lanes = {
+            priority: {
+                "depth": len(lane),
+                "oldest_age_seconds": round(now - lane[0][1], 3) if lane else None
+            }
+            for priority, lane in self.lanes.items()
+        }
+        organizations: Dict[str, Dict[str, Any]] = {}
+        for lane in self.lanes.values():
+            for message_id, enqueued_at in lane:
+                organization_id = self.messages[message_id].get("organization_id")
+                if organization_id is None:
+                    continue
+                counts = organizations.setdefault(
+                    organization_id, {"queued": 0, "in_flight": 0, "oldest_age_seconds": None}
+                )
+                counts["queued"] += 1
+                counts["oldest_age_seconds"] = max(counts["oldest_age_seconds"] or 0, round(now - enqueued_at, 3))
+        for message_id in self.in_flight:
+            organization_id = self.messages[message_id].get("organization_id")
+            if organization_id is not None:
+                organizations.setdefault(
+                    organization_id, {"queued": 0, "in_flight": 0, "oldest_age_seconds": None}
+                )["in_flight"] += 1
+        return {
+            "main_queue_size": sum(lane["depth"] for lane in lanes.values()),
+            "processing_queue_size": len(self.in_flight),
+            "dead_letter_queue_size": len(self.dead_letters),
+            "scheduled_retry_size": len(self.scheduled),
+            "lanes": lanes,
+            "organizations": organizations
+        }
@@ -0,0 +1,393 @@
+"""Lua scripts run atomically by the Redis payment queues.
+
+The list queue keeps, under a common key prefix, for every priority lane:
+  <priority>:org:<org>  one list of message ids per organization; payments
+                        without an organization use the organization "-"
+  <priority>:ring       list of organizations with queued messages; the tail
+                        is the one whose turn it is
+  <priority>:active     set mirroring the ring, for O(1) membership checks
+  <priority>:deficits   remaining deficit-round-robin credit of the
+                        organization in turn
+  <priority>:enqueued   sorted set of queued message ids by enqueue time,
+                        for the lane's depth and oldest age
+and shared by all lanes:
+  weights / caps        per-organization quantum and in-flight limit overrides
+  org_in_flight         in-flight message count per organization
+  inflight / deadlines  claim time and visibility deadline of every in-flight
+                        message id; stale claims are found by deadline range
+A receipt is "<message id>@<claim time>". Settling a message checks that
+claim against the in-flight hash, so a worker whose claim was recovered and
+handed to another worker cannot ack, retry or dead-letter it any more. Bare
+message ids, the receipts issued before claims were fenced, match any claim.
+  message_lanes         "<priority>:<org>" of every dequeued message until it
+                        is acknowledged or dead-lettered, so retries return to
+                        their own lane
+Dead letters are kept in a hash by dead letter id, with the ids in a sorted set
+whose members all score 0; the ids start with the time of dead-lettering, so
+ZRANGEBYLEX pages through them oldest first.
+Lane keys are derived inside the scripts, so the queue needs a single Redis
+node rather than a cluster; that holds for every shard (see sharded) too.
+"""
+
+UNASSIGNED_ORGANIZATION = "-"
+
+# Shared by the scripts that put a message id on a lane.
+_PUSH_TO_LANE = """
+local function push_to_lane(prefix, priority, org, id, now, doorbell)
+    redis.call('LPUSH', prefix .. priority .. ':org:' .. org, id)
+    redis.call('ZADD', prefix .. priority .. ':enqueued', now, id)
+    if redis.call('SADD', prefix .. priority .. ':active', org) == 1 then
+        -- New organizations join at the head, the farthest point from the current turn
+        redis.call('LPUSH', prefix .. priority .. ':ring', org)
+    end
+    redis.call('LPUSH', doorbell, 1)
+    redis.call('LTRIM', doorbell, 0, 99)
+end
+"""
+
+# Shared by the scripts that take a message out of flight. Returns the message
+# id, or false when the receipt's claim is no longer the current one.
+_RELEASE = """
+local function release(inflight, deadlines, message_lanes, org_in_flight, receipt)
+    local id, claim = string.match(receipt, '^([^@]*)@?(.*)$')
+    local current = redis.call('HGET', inflight, id)
+    if not current or (claim ~= '' and current ~= claim) then
+        return false
+    end
+    redis.call('HDEL', inflight, id)
+    redis.call('ZREM', deadlines, id)
+    local lane = redis.call('HGET', message_lanes, id)
+    if lane then
+        local org = string.match(lane, ':(.*)$')
+        if redis.call('HINCRBY', org_in_flight, org, -1) <= 0 then
+            redis.call('HDEL', org_in_flight, org)
+        end
+    end
+    return id
+end
+"""
+
+# KEYS: messages hash, doorbell. ARGV: message id, body, priority, organization, now, key prefix.
+ENQUEUE_SCRIPT = _PUSH_TO_LANE + """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+push_to_lane(ARGV[6], ARGV[3], ARGV[4], ARGV[1], ARGV[5], KEYS[2])
+return ARGV[1]
+"""
+
+# Moves up to n entries of a list written by the queue before lanes existed onto
+# the default lane. Entries are message ids, or whole JSON bodies from before
+# receipts, which are stored under a new "legacy-" id first. Returns how many moved.
+# KEYS: legacy list, messages hash, legacy id sequence, doorbell. ARGV: n, default priority, now, key prefix.
+MIGRATE_LEGACY_LIST_SCRIPT = _PUSH_TO_LANE + """
+local moved = 0
+while moved < tonumber(ARGV[1]) do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        break
+    end
+    if string.sub(id, 1, 1) == '{' then
+        local body = id
+        id = 'legacy-' .. redis.call('INCR', KEYS[3])
+        redis.call('HSET', KEYS[2], id, body)
+    end
+    push_to_lane(ARGV[4], ARGV[2], '""" + UNASSIGNED_ORGANIZATION + """', id, ARGV[3], KEYS[4])
+    moved = moved + 1
+end
+return moved
+"""
+
+# Picks a priority lane per message: a lane whose oldest message is past its
+# maximum wait goes first (the most overdue one), otherwise lanes with work
+# are chosen by smooth weighted round robin. Within the lane, organizations
+# are served by deficit round robin: each turn credits the organization with
+# its weight, one message costs one credit, and the turn ends when the credit
+# is spent, the organization's list is drained or it reaches its in-flight
+# cap. Returns a flat list of message id, body pairs.
+# KEYS: weights, caps, org in-flight counts, in-flight hash, messages hash, message lanes hash,
+#       lane credits hash, in-flight deadlines
+# ARGV: now (also the claim written to the in-flight hash), n, default weight, default in-flight cap
+#       (0 = none), key prefix, visibility timeout seconds, then name, weight, max wait seconds of every
+#       priority lane
+DEQUEUE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local prefix = ARGV[5]
+
+local function serve_one(priority, out)
+    local ring = prefix .. priority .. ':ring'
+    local deficits = prefix .. priority .. ':deficits'
+    local idle = 0
+    while true do
+        local ring_size = redis.call('LLEN', ring)
+        if ring_size == 0 or idle >= ring_size then
+            return false
+        end
+        local org = redis.call('LINDEX', ring, -1)
+        local lane = prefix .. priority .. ':org:' .. org
+        local cap = tonumber(redis.call('HGET', KEYS[2], org) or ARGV[4])
+        local in_flight = tonumber(redis.call('HGET', KEYS[3], org) or '0')
+        local deficit = tonumber(redis.call('HGET', deficits, org) or '0')
+        if deficit <= 0 then
+            deficit = tonumber(redis.call('HGET', KEYS[1], org) or ARGV[3])
+        end
+
+        local served = false
+        while cap <= 0 or in_flight < cap do
+            local id = redis.call('RPOP', lane)
+            if not id then
+                break
+            end
+            redis.call('ZREM', prefix .. priority .. ':enqueued', id)
+            local body = redis.call('HGET', KEYS[5], id)
+            if body then
+                redis.call('HSET', KEYS[4], id, ARGV[1])
+                redis.call('ZADD', KEYS[8], now + tonumber(ARGV[6]), id)
+                redis.call('HSET', KEYS[6], id, priority .. ':' .. org)
+                in_flight = in_flight + 1
+                redis.call('HSET', KEYS[3], org, in_flight)
+                deficit = deficit - 1
+                out[#out + 1] = id
+                out[#out + 1] = body
+                served = true
+                break
+            end
+        end
+
+        if redis.call('LLEN', lane) == 0 then
+            -- Drained: leave the ring and forfeit the remaining credit
+            redis.call('RPOP', ring)
+            redis.call('SREM', prefix .. priority .. ':active', org)
+            redis.call('HDEL', deficits, org)
+        elseif served and deficit > 0 then
+            redis.call('HSET', deficits, org, deficit)
+        else
+            redis.call('HDEL', deficits, org)
+            redis.call('RPOPLPUSH', ring, ring)
+        end
+        if served then
+            return true
+        end
+        idle = idle + 1
+    end
+end
+
+local lanes = {}
+for i = 7, #ARGV, 3 do
+    lanes[#lanes + 1] = {name = ARGV[i], weight = tonumber(ARGV[i + 1]), max_wait = tonumber(ARGV[i + 2])}
+end
+
+local wanted = tonumber(ARGV[2]) * 2
+local out = {}
+local exhausted = {}
+while #out < wanted do
+    local chosen
+    local most_overdue = 0
+    for _, lane in ipairs(lanes) do
+        if not exhausted[lane.name] then
+            local oldest = redis.call('ZRANGE', prefix .. lane.name .. ':enqueued', 0, 0, 'WITHSCORES')
+            if oldest[2] and now - tonumber(oldest[2]) - lane.max_wait > most_overdue then
+                chosen = lane.name
+                most_overdue = now - tonumber(oldest[2]) - lane.max_wait
+            end
+        end
+    end
+    if not chosen then
+        local total = 0
+        local best = -math.huge
+        for _, lane in ipairs(lanes) do
+            if not exhausted[lane.name] and redis.call('LLEN', prefix .. lane.name .. ':ring') > 0 then
+                local credit = redis.call('HINCRBY', KEYS[7], lane.name, lane.weight)
+                total = total + lane.weight
+                if credit > best then
+                    best = credit
+                    chosen = lane.name
+                end
+            end
+        end
+        if not chosen then
+            break
+        end
+        redis.call('HINCRBY', KEYS[7], chosen, -total)
+    end
+    if not serve_one(chosen, out) then
+        exhausted[chosen] = true
+    end
+end
+return out
+"""
+
+# KEYS: in-flight hash, message lanes hash, org in-flight counts, messages hash, in-flight deadlines.
+# ARGV: receipts. Returns how many were still current and got acknowledged.
+ACK_SCRIPT = _RELEASE + """
+local acked = 0
+for _, receipt in ipairs(ARGV) do
+    local id = release(KEYS[1], KEYS[5], KEYS[2], KEYS[3], receipt)
+    if id then
+        redis.call('HDEL', KEYS[4], id)
+        redis.call('HDEL', KEYS[2], id)
+        acked = acked + 1
+    end
+end
+return acked
+"""
+
+# KEYS: in-flight hash, message lanes hash, org in-flight counts, messages hash, scheduled-retry set,
+#       in-flight deadlines. ARGV: receipt, updated body, due time. Returns 0 for a stale receipt.
+SCHEDULE_RETRY_SCRIPT = _RELEASE + """
+local id = release(KEYS[1], KEYS[6], KEYS[2], KEYS[3], ARGV[1])
+if not id then
+    return 0
+end
+redis.call('HSET', KEYS[4], id, ARGV[2])
+redis.call('ZADD', KEYS[5], ARGV[3], id)
+return 1
+"""
+
+# KEYS: in-flight hash, message lanes hash, org in-flight counts, messages hash, dead letters hash,
+#       in-flight deadlines, dead letter index. ARGV: receipt, dead-lettered body, dead letter id.
+# Returns 0 for a stale receipt.
+DEAD_LETTER_SCRIPT = _RELEASE + """
+local id = release(KEYS[1], KEYS[6], KEYS[2], KEYS[3], ARGV[1])
+if not id then
+    return 0
+end
+redis.call('HSET', KEYS[5], ARGV[3], ARGV[2])
+redis.call('ZADD', KEYS[7], 0, ARGV[3])
+redis.call('HDEL', KEYS[4], id)
+redis.call('HDEL', KEYS[2], id)
+return 1
+"""
+
+# KEYS: legacy dead letter list, dead letters hash, dead letter index, id sequence. ARGV: limit.
+# Moves dead letters from the list used before the index, oldest first, ahead of every indexed one.
+MIGRATE_DEAD_LETTERS_SCRIPT = """
+local moved = 0
+while moved < tonumber(ARGV[1]) do
+    local body = redis.call('RPOP', KEYS[1])
+    if not body then
+        break
+    end
+    local id = '0000000000000-legacy-' .. string.format('%012d', redis.call('INCR', KEYS[4]))
+    redis.call('HSET', KEYS[2], id, body)
+    redis.call('ZADD', KEYS[3], 0, id)
+    moved = moved + 1
+end
+return moved
+"""
+
+# KEYS: dead letters hash, dead letter index, messages hash, doorbell.
+# ARGV: dead letter id, new message id, body, priority, organization, now, key prefix.
+# Taking the dead letter and queueing its replay in one step keeps concurrent replays from queueing it twice.
+REPLAY_TO_LANE_SCRIPT = _PUSH_TO_LANE + """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[2], ARGV[3])
+push_to_lane(ARGV[7], ARGV[4], ARGV[5], ARGV[2], ARGV[6], KEYS[4])
+return 1
+"""
+
+# KEYS: dead letters hash, dead letter index, stream. ARGV: dead letter id, body.
+REPLAY_TO_STREAM_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('XADD', KEYS[3], '*', 'data', ARGV[2])
+return 1
+"""
+
+# KEYS: scheduled-retry set, message lanes hash, doorbell.
+# ARGV: now, limit, key prefix, default priority.
+# Popping and pushing in one script keeps concurrent promoters from queueing a message twice.
+PROMOTE_TO_LANES_SCRIPT = _PUSH_TO_LANE + """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, id in ipairs(due) do
+    redis.call('ZREM', KEYS[1], id)
+    local priority, org = ARGV[4], '""" + UNASSIGNED_ORGANIZATION + """'
+    local lane = redis.call('HGET', KEYS[2], id)
+    if lane then
+        priority, org = string.match(lane, '^([^:]*):(.*)$')
+    end
+    push_to_lane(ARGV[3], priority, org, id, ARGV[1], KEYS[3])
+end
+return #due
+"""
+
+# KEYS: in-flight deadlines, in-flight hash, messages hash. ARGV: cutoff, limit, next deadline.
+# Pushes expired deadlines forward to the next deadline in one step, so concurrent sweepers never recover a
+# message twice and one that crashes before settling leaves the claim to expire again; settling removes it.
+# Returns the number of entries taken, then a flat list of receipt, body pairs of those still in flight;
+# the body is empty when the message is gone.
+SWEEP_EXPIRED_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local out = {#expired}
+for _, id in ipairs(expired) do
+    local claim = redis.call('HGET', KEYS[2], id)
+    if claim then
+        redis.call('ZADD', KEYS[1], ARGV[3], id)
+        out[#out + 1] = id .. '@' .. claim
+        out[#out + 1] = redis.call('HGET', KEYS[3], id) or ''
+    else
+        redis.call('ZREM', KEYS[1], id)
+    end
+end
+return out
+"""
+
+# KEYS: scheduled-retry sorted set, stream. ARGV: now, limit. Members are message bodies.
+PROMOTE_TO_STREAM_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+    redis.call('ZREM', KEYS[1], member)
+    redis.call('XADD', KEYS[2], '*', 'data', member)
+end
+return #due
+"""
+
+# Shared by the stream scripts that settle an entry: only the consumer that owns the pending entry may,
+# so a consumer whose entry was reclaimed by XAUTOCLAIM cannot ack, retry or dead-letter it any more.
+_OWNS_PENDING = """
+local function owns_pending(stream, group, consumer, id)
+    local pending = redis.call('XPENDING', stream, group, id, id, 1)
+    return pending[1] ~= nil and pending[1][2] == consumer
+end
+"""
+
+# KEYS: stream. ARGV: group, consumer, entry ids. Returns how many entries were acknowledged.
+STREAM_ACK_SCRIPT = _OWNS_PENDING + """
+local acked = 0
+for i = 3, #ARGV do
+    if owns_pending(KEYS[1], ARGV[1], ARGV[2], ARGV[i]) then
+        redis.call('XACK', KEYS[1], ARGV[1], ARGV[i])
+        redis.call('XDEL', KEYS[1], ARGV[i])
+        acked = acked + 1
+    end
+end
+return acked
+"""
+
+# KEYS: stream, scheduled-retry set. ARGV: group, consumer, entry id, retried body, due time.
+# Returns 0 when the entry is no longer this consumer's.
+STREAM_SCHEDULE_RETRY_SCRIPT = _OWNS_PENDING + """
+if not owns_pending(KEYS[1], ARGV[1], ARGV[2], ARGV[3]) then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[5], ARGV[4])
+redis.call('XACK', KEYS[1], ARGV[1], ARGV[3])
+redis.call('XDEL', KEYS[1], ARGV[3])
+return 1
+"""
+
+# KEYS: stream, dead letters hash, dead letter index. ARGV: group, consumer, entry id, dead-lettered body,
+# dead letter id. Returns 0 when the entry is no longer this consumer's.
+STREAM_DEAD_LETTER_SCRIPT = _OWNS_PENDING + """
+if not owns_pending(KEYS[1], ARGV[1], ARGV[2], ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[5], ARGV[4])
+redis.call('ZADD', KEYS[3], 0, ARGV[5])
+redis.call('XACK', KEYS[1], ARGV[1], ARGV[3])
+redis.call('XDEL', KEYS[1], ARGV[3])
+return 1
+"""
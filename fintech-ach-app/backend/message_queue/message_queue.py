@@ -1,17 +1,20 @@
-import asyncio
-from typing import Optional
-from uuid import UUID
+from typing import Any, Dict, Optional
+from .base import get_queue
 
-# Create an async queue for payments
-payment_queue: asyncio.Queue[str] = asyncio.Queue()
-
-async def enqueue_payment(payment_id: str) -> None:
-    """Add a payment to the processing queue."""
-    await payment_queue.put(payment_id)
+async def enqueue_payment(payment_id: str, payload: Optional[Dict[str, Any]] = None) -> str:
+    """Add a payment to the processing queue of the configured backend."""
+    return await get_queue().enqueue_payment(payment_id, payload or {})
 
 async def dequeue_payment() -> Optional[str]:
-    """Get the next payment from the queue."""
-    try:
-        return await payment_queue.get()
-    except asyncio.QueueEmpty:
-        return None 
\ No newline at end of file
+    """Get the next payment id from the queue.
+
+    The message is acknowledged on the spot, like the asyncio.Queue this
+    replaced; workers that need retries use the queue's dequeue_batch and
+    ack_batch instead.
+    """
+    queue = get_queue()
+    payment_data = await queue.dequeue_payment()
+    if not payment_data:
+        return None
+    await queue.complete_payment(payment_data["receipt"])
+    return payment_data["payment_id"]
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+from typing import Any, Dict, Optional
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from domain.sql_models import Payment, PaymentOutbox
+from .base import PaymentQueue
+
+logger = logging.getLogger(__name__)
+
+# Outbox rows moved to the queue per transaction
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+# The relay polls this often in case a notification was missed (e.g. while reconnecting)
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+
+OUTBOX_CHANNEL = "payment_outbox"
+
+# Inserts into payment_outbox notify the relay once the creating transaction commits
+OUTBOX_NOTIFY_DDL = (
+    "CREATE OR REPLACE FUNCTION notify_payment_outbox() RETURNS trigger AS $$ "
+    f"BEGIN PERFORM pg_notify('{OUTBOX_CHANNEL}', ''); RETURN NULL; END; $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS payment_outbox_notify ON payment_outbox",
+    "CREATE TRIGGER payment_outbox_notify AFTER INSERT ON payment_outbox "
+    "FOR EACH STATEMENT EXECUTE FUNCTION notify_payment_outbox()"
+)
+
+def outbox_entry(payment: Payment) -> PaymentOutbox:
+    """Outbox row carrying the queue message of a new payment."""
+    return PaymentOutbox(
+        payment_uuid=payment.uuid,
+        organization_id=payment.organization_id,
+        payload={
+            "payment_id": str(payment.uuid),
+            "amount": payment.amount,
+            "from_account": str(payment.from_account),
+            "to_account": str(payment.to_account),
+            "payment_type": payment.payment_type
+        }
+    )
+
+async def install_outbox_trigger(conn: AsyncConnection) -> None:
+    for statement in OUTBOX_NOTIFY_DDL:
+        await conn.execute(text(statement))
+
+async def relay_outbox_batch(engine: AsyncEngine, queue: PaymentQueue, batch_size: int = OUTBOX_BATCH_SIZE) -> int:
+    """Enqueue up to batch_size outbox rows and delete them in the same transaction.
+
+    Rows are locked with SKIP LOCKED so several relays can run. The batch
+    goes to the queue in one enqueue_batch round trip, so the row locks are
+    held for three statements and one queue call. A failure rolls the
+    deletes back and the rows are relayed again, so delivery is at least
+    once; the worker skips payments that are already completed.
+    """
+    async with engine.begin() as conn:
+        rows = (await conn.execute(
+            select(PaymentOutbox)
+            .order_by(PaymentOutbox.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )).all()
+        if rows:
+            await queue.enqueue_batch([
+                {
+                    "payment_id": str(row.payment_uuid),
+                    "payload": row.payload,
+                    "organization_id": str(row.organization_id) if row.organization_id else None
+                }
+                for row in rows
+            ])
+            await conn.execute(delete(PaymentOutbox).where(PaymentOutbox.id.in_([row.id for row in rows])))
+    return len(rows)
+
+async def outbox_backlog(engine: AsyncEngine) -> Dict[str, Any]:
+    """Rows waiting in the outbox and the age in seconds of the oldest one, if any."""
+    async with engine.connect() as conn:
+        size, oldest_age = (await conn.execute(
+            select(func.count(), func.extract("epoch", func.now() - func.min(PaymentOutbox.created_at)))
+        )).one()
+    return {"size": size, "oldest_age_seconds": round(float(oldest_age), 3) if oldest_age is not None else None}
+
+async def relay_outbox(engine: AsyncEngine, queue: PaymentQueue) -> None:
+    """Background task draining the outbox to the queue, woken by NOTIFY."""
+    logger.info("Payment outbox relay started")
+    wakeup = asyncio.Event()
+    listen_connection: Optional[AsyncConnection] = None
+
+    def notified(*args: Any) -> None:
+        wakeup.set()
+
+    try:
+        while True:
+            try:
+                if listen_connection is None:
+                    listen_connection = await engine.connect()
+                    raw = await listen_connection.get_raw_connection()
+                    await raw.driver_connection.add_listener(OUTBOX_CHANNEL, notified)
+                wakeup.clear()
+                relayed = await relay_outbox_batch(engine, queue)
+                if relayed:
+                    logger.info(f"Relayed {relayed} payments from the outbox")
+                # A full batch means more rows may be waiting already
+                if relayed < OUTBOX_BATCH_SIZE:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), OUTBOX_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error relaying payment outbox: {str(e)}")
+                if listen_connection is not None:
+                    await listen_connection.invalidate()
+                    listen_connection = None
+                await asyncio.sleep(OUTBOX_POLL_SECONDS)
+    except asyncio.CancelledError:
+        logger.info("Payment outbox relay cancelled")
+        raise
+    finally:
+        if listen_connection is not None:
+            raw = await listen_connection.get_raw_connection()
+            await raw.driver_connection.remove_listener(OUTBOX_CHANNEL, notified)
+            await listen_connection.close()
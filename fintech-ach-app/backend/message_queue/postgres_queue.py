@@ -0,0 +1,443 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, delete, func, insert, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from domain.sql_models import PaymentQueueMessage
+from .backoff import QUEUE_SWEEP_BATCH_SIZE, QUEUE_VISIBILITY_TIMEOUT_SECONDS, RETRY_PROMOTE_BATCH_SIZE, retry_delay
+from .base import PaymentQueue
+from .dlq import dead_letter_body, replay_message, with_failed_attempt
+from .priority import PRIORITY_LANES, assign_priority
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "payment_queue"
+# How often an idle consumer polls while its LISTEN connection is down
+POSTGRES_QUEUE_POLL_INTERVAL_SECONDS = float(os.getenv("POSTGRES_QUEUE_POLL_INTERVAL_SECONDS", "1"))
+
+class PostgresQueue(PaymentQueue):
+    """Payment queue on the payment_queue_messages table.
+
+    Consumers claim rows with SELECT ... FOR UPDATE SKIP LOCKED, so
+    concurrent workers never wait on each other's claims, and an idle
+    consumer sleeps on LISTEN until an enqueue sends NOTIFY (polling while
+    the LISTEN connection is down). Rows are served
+    by priority lane, then in order of availability; delayed retries are rows
+    whose available_at lies in the future. There is no per-organization
+    scheduling. A receipt is "<row id>@<claimed_at>", and settling only
+    touches the row while it is still in flight under that claim, so a worker
+    whose claim was recovered by the stale sweep cannot settle it any more.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self._wakeup = asyncio.Event()
+        self._listen_connection: Optional[AsyncConnection] = None
+        self.visibility_timeout = QUEUE_VISIBILITY_TIMEOUT_SECONDS
+
+    async def enqueue_payment(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """Insert a payment message and wake listening consumers when the transaction commits."""
+        try:
+            row = self._row(payment_id, payload, organization_id, priority)
+            async with self.engine.begin() as conn:
+                message_id = (await conn.execute(
+                    insert(PaymentQueueMessage).values(**row).returning(PaymentQueueMessage.id)
+                )).scalar_one()
+                await conn.execute(text(f"NOTIFY {NOTIFY_CHANNEL}"))
+            logger.info(f"Payment {payment_id} enqueued successfully in the {row['priority']} lane")
+            return str(message_id)
+        except Exception as e:
+            logger.error(f"Error enqueueing payment {payment_id}: {str(e)}")
+            raise
+
+    @staticmethod
+    def _row(
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str],
+        priority: Optional[str]
+    ) -> Dict[str, Any]:
+        """Column values of a new message row."""
+        priority = priority or assign_priority(payload.get("payment_type"), payload.get("amount"), organization_id)
+        if priority not in PRIORITY_LANES:
+            raise ValueError(f"Unknown priority lane {priority!r}")
+        return {
+            "payment_id": payment_id,
+            "organization_id": organization_id,
+            "priority": priority,
+            "priority_rank": PRIORITY_LANES.index(priority),
+            "body": {
+                "payment_id": payment_id,
+                "payload": payload,
+                "organization_id": organization_id,
+                "priority": priority,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+        }
+
+    async def enqueue_batch(self, messages: Sequence[Dict[str, Any]]) -> List[str]:
+        """Insert several payment messages with one multi-row INSERT and a single NOTIFY.
+
+        The rows go out as one insertmanyvalues statement, ids returned in the order given.
+        """
+        rows = [
+            self._row(message["payment_id"], message["payload"], message.get("organization_id"), message.get("priority"))
+            for message in messages
+        ]
+        if not rows:
+            return []
+        async with self.engine.begin() as conn:
+            message_ids = (await conn.execute(
+                insert(PaymentQueueMessage).returning(PaymentQueueMessage.id, sort_by_parameter_order=True),
+                rows
+            )).scalars().all()
+            await conn.execute(text(f"NOTIFY {NOTIFY_CHANNEL}"))
+        logger.info(f"Enqueued {len(rows)} payments")
+        return [str(message_id) for message_id in message_ids]
+
+    async def _listen(self) -> bool:
+        """Hold a connection subscribed to the queue channel; notifications wake waiting consumers.
+
+        A dropped connection is replaced on the next call. Returns False when
+        no connection could be subscribed, so the caller polls instead.
+        """
+        if self._listen_connection is not None:
+            raw = await self._listen_connection.get_raw_connection()
+            if not raw.driver_connection.is_closed():
+                return True
+            logger.warning("Queue LISTEN connection lost, reconnecting")
+            await self._listen_connection.invalidate()
+            await self._listen_connection.close()
+            self._listen_connection = None
+        try:
+            connection = await self.engine.connect()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.add_listener(NOTIFY_CHANNEL, self._notified)
+        except Exception as e:
+            logger.warning(f"Could not LISTEN for queue notifications, polling instead: {str(e)}")
+            return False
+        self._listen_connection = connection
+        return True
+
+    def _notified(self, *args: Any) -> None:
+        self._wakeup.set()
+
+    @staticmethod
+    def _claimed(receipt: str):
+        """Condition matching the row of a receipt while it is in flight under the receipt's claim.
+
+        Bare row ids, the receipts issued before claims were fenced, match any claim.
+        """
+        row_id, _, claimed_at = receipt.partition("@")
+        condition = and_(PaymentQueueMessage.id == int(row_id), PaymentQueueMessage.status == "in_flight")
+        if claimed_at:
+            condition = and_(condition, PaymentQueueMessage.claimed_at == datetime.fromisoformat(claimed_at))
+        return condition
+
+    async def dequeue_batch(self, n: int, max_wait: float = 1) -> List[Dict[str, Any]]:
+        """Claim up to n ready messages, waiting up to max_wait seconds for a NOTIFY when there are none."""
+        try:
+            deadline = time.monotonic() + max_wait
+            while True:
+                self._wakeup.clear()
+                ready = (
+                    select(PaymentQueueMessage.id)
+                    .where(PaymentQueueMessage.status == "queued", PaymentQueueMessage.available_at <= func.now())
+                    .order_by(PaymentQueueMessage.priority_rank, PaymentQueueMessage.available_at, PaymentQueueMessage.id)
+                    .limit(n)
+                    .with_for_update(skip_locked=True)
+                )
+                async with self.engine.begin() as conn:
+                    rows = (await conn.execute(
+                        update(PaymentQueueMessage)
+                        .where(PaymentQueueMessage.id.in_(ready.scalar_subquery()))
+                        .values(status="in_flight", claimed_at=func.now())
+                        .returning(
+                            PaymentQueueMessage.id,
+                            PaymentQueueMessage.body,
+                            PaymentQueueMessage.retries,
+                            PaymentQueueMessage.priority_rank,
+                            PaymentQueueMessage.claimed_at
+                        )
+                    )).all()
+                if rows:
+                    return [
+                        {**row.body, "retries": row.retries, "receipt": f"{row.id}@{row.claimed_at.isoformat()}"}
+                        for row in sorted(rows, key=lambda row: (row.priority_rank, row.id))
+                    ]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                if not await self._listen():
+                    remaining = min(remaining, POSTGRES_QUEUE_POLL_INTERVAL_SECONDS)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            logger.error(f"Error dequeuing payment batch: {str(e)}")
+            raise
+
+    async def ack_batch(self, receipts: Iterable[str]) -> None:
+        """Delete processed messages still claimed under their receipts."""
+        receipts = list(receipts)
+        if not receipts:
+            return
+        try:
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    delete(PaymentQueueMessage).where(or_(*(self._claimed(receipt) for receipt in receipts)))
+                )
+            logger.info(f"{result.rowcount} messages completed successfully")
+            if result.rowcount < len(receipts):
+                logger.warning(
+                    f"{len(receipts) - result.rowcount} acks ignored: their claims were recovered by the stale sweep"
+                )
+        except Exception as e:
+            logger.error(f"Error completing {len(receipts)} messages: {str(e)}")
+            raise
+
+    async def retry_payment(self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None) -> bool:
+        """Make a failed payment claimable again after its backoff delay, or dead-letter it after max retries."""
+        payment_id = payment_data.get("payment_id")
+        try:
+            retry_count = int(payment_data.get("retries", 0)) + 1
+            if retry_count > self.max_retries:
+                await self.dead_letter_payment(receipt, payment_data, error)
+                logger.warning(f"Payment {payment_id} moved to DLQ after {retry_count} retries")
+                return False
+
+            body = with_failed_attempt(payment_data, error)
+            body.pop("retries", None)
+            body["timestamp"] = datetime.utcnow().isoformat()
+            delay = retry_delay(retry_count)
+            async with self.engine.begin() as conn:
+                result = await conn.execute(
+                    update(PaymentQueueMessage)
+                    .where(self._claimed(receipt))
+                    .values(
+                        status="queued",
+                        retries=retry_count,
+                        body=body,
+                        available_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                        claimed_at=None
+                    )
+                )
+            if not result.rowcount:
+                logger.warning(f"Retry of payment {payment_id} ignored: its claim was recovered by the stale sweep")
+                return False
+            logger.info(f"Payment {payment_id} scheduled for retry {retry_count}/{self.max_retries} in {delay:.1f}s")
+            return True
+        except Exception as e:
+            logger.error(f"Error retrying payment {payment_id}: {str(e)}")
+            raise
+
+    async def dead_letter_payment(
+        self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None
+    ) -> None:
+        """Keep the message as a dead letter row."""
+        async with self.engine.begin() as conn:
+            moved = await self._dead_letter(conn, self._claimed(receipt), payment_data, error)
+        if not moved:
+            logger.warning(
+                f"Dead-lettering of payment {payment_data.get('payment_id')} ignored: "
+                f"its claim was recovered by the stale sweep"
+            )
+
+    async def _dead_letter(
+        self, conn: AsyncConnection, condition, payment_data: Dict[str, Any], error: Optional[str]
+    ) -> bool:
+        """Turn the row matching condition into a dead letter with its failure reason and time."""
+        body = dead_letter_body(payment_data, error)
+        retries = body.pop("retries", 0)
+        result = await conn.execute(
+            update(PaymentQueueMessage)
+            .where(condition)
+            .values(status="dead", body=body, retries=retries, claimed_at=None)
+        )
+        return bool(result.rowcount)
+
+    async def list_dead_letters(self, after: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """A page of dead letter rows, oldest first, after the given row id."""
+        query = (
+            select(PaymentQueueMessage.id, PaymentQueueMessage.body, PaymentQueueMessage.retries)
+            .where(PaymentQueueMessage.status == "dead")
+            .order_by(PaymentQueueMessage.id)
+            .limit(limit)
+        )
+        if after:
+            query = query.where(PaymentQueueMessage.id > int(after))
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(query)).all()
+        entries = [{**row.body, "retries": row.retries, "id": str(row.id)} for row in rows]
+        return entries, entries[-1]["id"] if len(entries) == limit else None
+
+    async def get_dead_letter(self, dead_letter_id: str) -> Optional[Dict[str, Any]]:
+        """A dead letter row by id."""
+        if not dead_letter_id.isdigit():
+            return None
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(PaymentQueueMessage.body, PaymentQueueMessage.retries)
+                .where(PaymentQueueMessage.id == int(dead_letter_id), PaymentQueueMessage.status == "dead")
+            )).one_or_none()
+        return {**row.body, "retries": row.retries, "id": dead_letter_id} if row else None
+
+    async def replay_dead_letter(self, dead_letter_id: str) -> bool:
+        """Make a dead letter row claimable again with its retries reset and its attempt history kept."""
+        if not dead_letter_id.isdigit():
+            return False
+        async with self.engine.begin() as conn:
+            row = (await conn.execute(
+                select(PaymentQueueMessage.body)
+                .where(PaymentQueueMessage.id == int(dead_letter_id), PaymentQueueMessage.status == "dead")
+                .with_for_update()
+            )).one_or_none()
+            if row is None:
+                return False
+            await conn.execute(
+                update(PaymentQueueMessage)
+                .where(PaymentQueueMessage.id == int(dead_letter_id))
+                .values(
+                    status="queued",
+                    retries=0,
+                    body=replay_message(row.body),
+                    available_at=func.now(),
+                    claimed_at=None
+                )
+            )
+            await conn.execute(text(f"NOTIFY {NOTIFY_CHANNEL}"))
+        return True
+
+    async def promote_due_retries(self, limit: int = RETRY_PROMOTE_BATCH_SIZE) -> int:
+        """Delayed retries become claimable by themselves once available_at passes; nothing to move."""
+        return 0
+
+    async def cleanup_stale_processing(self, timeout_minutes: Optional[int] = None) -> None:
+        """Requeue messages claimed longer than the visibility timeout ago (or timeout_minutes), counting it as a retry.
+
+        Requeued messages wait out the same backoff as retry_payment's, and
+        messages out of retries are dead-lettered the same way as by
+        dead_letter_payment, with the expired claim as their failure. Stale
+        rows are taken QUEUE_SWEEP_BATCH_SIZE at a time, one transaction each.
+        """
+        error = "Visibility timeout expired"
+        timeout = self.visibility_timeout if timeout_minutes is None else timeout_minutes * 60
+        recovered = 0
+        try:
+            while True:
+                async with self.engine.begin() as conn:
+                    stale = (await conn.execute(
+                        select(PaymentQueueMessage.id, PaymentQueueMessage.body, PaymentQueueMessage.retries)
+                        .where(
+                            PaymentQueueMessage.status == "in_flight",
+                            PaymentQueueMessage.claimed_at < func.now() - timedelta(seconds=timeout)
+                        )
+                        .order_by(PaymentQueueMessage.claimed_at)
+                        .limit(QUEUE_SWEEP_BATCH_SIZE)
+                        .with_for_update(skip_locked=True)
+                    )).all()
+                    for row in stale:
+                        payment_data = {**row.body, "retries": row.retries}
+                        if row.retries + 1 > self.max_retries:
+                            await self._dead_letter(conn, PaymentQueueMessage.id == row.id, payment_data, error)
+                            continue
+                        body = with_failed_attempt(payment_data, error)
+                        body.pop("retries", None)
+                        await conn.execute(
+                            update(PaymentQueueMessage)
+                            .where(PaymentQueueMessage.id == row.id)
+                            .values(
+                                status="queued",
+                                retries=row.retries + 1,
+                                body=body,
+                                available_at=datetime.now(timezone.utc) + timedelta(seconds=retry_delay(row.retries + 1)),
+                                claimed_at=None
+                            )
+                        )
+                recovered += len(stale)
+                if len(stale) < QUEUE_SWEEP_BATCH_SIZE:
+                    break
+            if recovered:
+                logger.info(f"Cleaned up {recovered} stale messages")
+        except Exception as e:
+            logger.error(f"Error cleaning up stale processing: {str(e)}")
+            raise
+
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """Get current queue statistics, per priority lane and per organization."""
+        try:
+            scheduled = PaymentQueueMessage.available_at > func.now()
+            async with self.engine.connect() as conn:
+                rows = (await conn.execute(
+                    select(
+                        PaymentQueueMessage.status,
+                        PaymentQueueMessage.priority,
+                        scheduled.label("scheduled"),
+                        func.count().label("count"),
+                        func.extract("epoch", func.now() - func.min(PaymentQueueMessage.available_at)).label("oldest_age")
+                    ).group_by(PaymentQueueMessage.status, PaymentQueueMessage.priority, scheduled)
+                )).all()
+                organization_rows = (await conn.execute(
+                    select(
+                        PaymentQueueMessage.organization_id,
+                        PaymentQueueMessage.status,
+                        func.count().label("count"),
+                        func.extract("epoch", func.now() - func.min(PaymentQueueMessage.available_at)).label("oldest_age")
+                    ).where(
+                        PaymentQueueMessage.organization_id.isnot(None),
+                        or_(
+                            PaymentQueueMessage.status == "in_flight",
+                            and_(PaymentQueueMessage.status == "queued", ~scheduled)
+                        )
+                    ).group_by(PaymentQueueMessage.organization_id, PaymentQueueMessage.status)
+                )).all()
+
+            lanes = {priority: {"depth": 0, "oldest_age_seconds": None} for priority in PRIORITY_LANES}
+            counts = {"queued": 0, "in_flight": 0, "dead": 0, "scheduled": 0}
+            for row in rows:
+                if row.status == "queued" and row.scheduled:
+                    counts["scheduled"] += row.count
+                    continue
+                counts[row.status] = counts.get(row.status, 0) + row.count
+                if row.status == "queued" and row.priority in lanes:
+                    lanes[row.priority] = {"depth": row.count, "oldest_age_seconds": round(float(row.oldest_age), 3)}
+            organizations: Dict[str, Dict[str, Any]] = {}
+            for row in organization_rows:
+                organization = organizations.setdefault(
+                    str(row.organization_id), {"queued": 0, "in_flight": 0, "oldest_age_seconds": None}
+                )
+                if row.status == "queued":
+                    organization["queued"] = row.count
+                    organization["oldest_age_seconds"] = round(float(row.oldest_age), 3)
+                else:
+                    organization["in_flight"] = row.count
+            return {
+                "main_queue_size": counts["queued"],
+                "processing_queue_size": counts["in_flight"],
+                "dead_letter_queue_size": counts["dead"],
+                "scheduled_retry_size": counts["scheduled"],
+                "lanes": lanes,
+                "organizations": organizations
+            }
+        except Exception as e:
+            logger.error(f"Error getting queue stats: {str(e)}")
+            raise
+
+    async def close(self) -> None:
+        """Release the LISTEN connection; the engine is disposed with the application's."""
+        if self._listen_connection is not None:
+            # The connection goes back to the pool, so it must stop listening first
+            raw = await self._listen_connection.get_raw_connection()
+            await raw.driver_connection.remove_listener(NOTIFY_CHANNEL, self._notified)
+            await self._listen_connection.close()
+            self._listen_connection = None
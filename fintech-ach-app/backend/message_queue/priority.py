@@ -0,0 +1,52 @@
+import os
+from typing import Dict, Optional
+
+# Queue priority lanes, highest first
+PRIORITY_LANES = ("same_day", "high_value", "standard", "bulk")
+DEFAULT_PRIORITY = "standard"
+
+def parse_lane_settings(value: str) -> Dict[str, float]:
+    """Parse "lane:number,lane:number" into a mapping, ignoring unknown lanes."""
+    settings = {}
+    for item in value.split(","):
+        lane, _, number = item.partition(":")
+        if lane.strip() in PRIORITY_LANES and number.strip():
+            settings[lane.strip()] = float(number)
+    return settings
+
+def parse_names(value: str) -> frozenset:
+    return frozenset(name.strip() for name in value.split(",") if name.strip())
+
+# Lane assignment rules, checked in this order; anything else is standard
+PRIORITY_SAME_DAY_PAYMENT_TYPES = parse_names(
+    os.getenv("PRIORITY_SAME_DAY_PAYMENT_TYPES", "same_day_ach_debit,same_day_ach_credit")
+)
+PRIORITY_HIGH_VALUE_AMOUNT = float(os.getenv("PRIORITY_HIGH_VALUE_AMOUNT", "100000"))
+PRIORITY_BULK_ORGANIZATIONS = parse_names(os.getenv("PRIORITY_BULK_ORGANIZATIONS", ""))
+# Share of dequeues each lane gets while all have work
+PRIORITY_LANE_WEIGHTS = {
+    "same_day": 8, "high_value": 4, "standard": 2, "bulk": 1,
+    **parse_lane_settings(os.getenv("PRIORITY_LANE_WEIGHTS", ""))
+}
+# A lane whose oldest message has waited longer than this is served ahead of the weights
+PRIORITY_LANE_MAX_WAIT_SECONDS = {
+    "same_day": 60, "high_value": 300, "standard": 900, "bulk": 3600,
+    **parse_lane_settings(os.getenv("PRIORITY_LANE_MAX_WAIT_SECONDS", ""))
+}
+
+def assign_priority(
+    payment_type: Optional[str],
+    amount: Optional[float],
+    organization_id: Optional[str],
+    same_day_payment_types: frozenset = PRIORITY_SAME_DAY_PAYMENT_TYPES,
+    high_value_amount: float = PRIORITY_HIGH_VALUE_AMOUNT,
+    bulk_organizations: frozenset = PRIORITY_BULK_ORGANIZATIONS
+) -> str:
+    """Priority lane of a payment: same-day type, then high value, then bulk organization, else standard."""
+    if payment_type in same_day_payment_types:
+        return "same_day"
+    if amount is not None and float(amount) >= high_value_amount:
+        return "high_value"
+    if organization_id and organization_id in bulk_organizations:
+        return "bulk"
+    return DEFAULT_PRIORITY
@@ -1,6 +1,7 @@
 import asyncio
 import logging
-from typing import Optional
+import os
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from domain.sql_models import (
@@ -9,34 +10,50 @@ from domain.sql_models import (
     InternalOrganizationBankAccount,
     ExternalOrganizationBankAccount
 )
-from config.database import get_db
-from .redis_queue import RedisQueue
+from config.database import async_session
+from .backoff import retry_promoter
+from .base import get_queue
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Redis queue
-queue = RedisQueue()
+# Messages pulled per round trip, and how long an idle worker waits for the first one
+QUEUE_BATCH_SIZE = int(os.getenv("QUEUE_BATCH_SIZE", "10"))
+QUEUE_BATCH_MAX_WAIT = float(os.getenv("QUEUE_BATCH_MAX_WAIT", "1"))
+# Pause between stale-claim sweeps
+QUEUE_STALE_SWEEP_INTERVAL_SECONDS = float(os.getenv("QUEUE_STALE_SWEEP_INTERVAL_SECONDS", "30"))
 
-async def process_payment(payment: Payment, session: AsyncSession) -> bool:
-    """Process a single payment."""
+async def process_payment(payment: Payment, session: AsyncSession) -> Optional[str]:
+    """Process a single payment, already locked by the caller; returns why it failed, or None once it succeeded.
+
+    Both accounts are re-read with SELECT ... FOR UPDATE, so a balance is never
+    updated from a stale read; they are locked in a fixed order so two payments
+    between the same accounts cannot deadlock.
+    """
     try:
-        # Get accounts
-        from_account = await session.get(ExternalOrganizationBankAccount, payment.from_account)
-        to_account = await session.get(InternalOrganizationBankAccount, payment.to_account)
+        # Get accounts, locked in uuid order
+        accounts = [
+            (ExternalOrganizationBankAccount, payment.from_account),
+            (InternalOrganizationBankAccount, payment.to_account)
+        ]
+        locked = {}
+        for model, account_id in sorted(accounts, key=lambda account: str(account[1])):
+            locked[model] = await session.get(model, account_id, with_for_update=True, populate_existing=True)
+        from_account = locked[ExternalOrganizationBankAccount]
+        to_account = locked[InternalOrganizationBankAccount]
             
         if not from_account or not to_account:
             logger.error(f"Account not found for payment {payment.uuid}")
             payment.status = PaymentStatus.FAILED
             await session.commit()
-            return False
+            return "Account not found"
             
         # Check sufficient funds
         if from_account.balance < payment.amount:
             logger.error(f"Insufficient funds for payment {payment.uuid}")
             payment.status = PaymentStatus.FAILED
             await session.commit()
-            return False
+            return "Insufficient funds"
             
         # Process payment
         from_account.balance -= payment.amount
@@ -45,46 +62,68 @@ async def process_payment(payment: Payment, session: AsyncSession) -> bool:
         
         await session.commit()
         logger.info(f"Successfully processed payment {payment.uuid}")
-        return True
+        return None
         
     except Exception as e:
         logger.error(f"Error processing payment {payment.uuid}: {str(e)}")
-        payment.status = PaymentStatus.FAILED
-        await session.commit()
-        return False
+        # The failed transaction must be rolled back before anything else is written; that releases
+        # the payment's lock, so it is taken again and a concurrent delivery's completion is kept
+        await session.rollback()
+        try:
+            payment = await session.get(Payment, payment.uuid, with_for_update=True, populate_existing=True)
+            if payment is not None and payment.status != PaymentStatus.COMPLETED:
+                payment.status = PaymentStatus.FAILED
+            await session.commit()
+        except Exception as mark_error:
+            await session.rollback()
+            logger.error(f"Could not mark payment {payment.uuid} failed: {str(mark_error)}")
+        return str(e)
+
+async def process_payment_batch(queue, batch: List[Dict[str, Any]]) -> None:
+    """Process a batch of dequeued payments, each in its own session, and acknowledge the successful ones together.
+
+    Completed payments are acknowledged even when a later one raises.
+    """
+    completed = []
+    try:
+        for payment_data in batch:
+            payment_id = payment_data["payment_id"]
+            async with async_session() as session:
+                # Lock the payment before looking at its status, so a second delivery of it waits for
+                # the first to commit and then sees it completed
+                payment = await session.get(Payment, UUID(payment_id), with_for_update=True, populate_existing=True)
+                if not payment:
+                    logger.error(f"Payment {payment_id} not found in database")
+                    continue
+                if payment.status == PaymentStatus.COMPLETED:
+                    # Delivered again, e.g. relayed twice from the outbox
+                    logger.info(f"Payment {payment_id} already completed, skipping")
+                    completed.append(payment_data["receipt"])
+                    continue
+
+                # Process payment; it commits before returning
+                failure = await process_payment(payment, session)
+            if failure is None:
+                completed.append(payment_data["receipt"])
+            else:
+                # Retry failed payment, recording why it failed
+                retry_success = await queue.retry_payment(payment_data["receipt"], payment_data, failure)
+                if not retry_success:
+                    logger.error(f"Payment {payment_id} failed after max retries")
+    finally:
+        await queue.ack_batch(completed)
 
 async def process_payment_queue() -> None:
     """Process payments from the queue."""
+    queue = get_queue()
     try:
         while True:
             try:
-                # Get next payment from queue
-                payment_data = await queue.dequeue_payment()
-                if not payment_data:
-                    await asyncio.sleep(1)  # Wait before checking again
-                    continue
+                # Blocks up to QUEUE_BATCH_MAX_WAIT when the queue is empty
+                batch = await queue.dequeue_batch(QUEUE_BATCH_SIZE, QUEUE_BATCH_MAX_WAIT)
+                if batch:
+                    await process_payment_batch(queue, batch)
 
-                payment_id = payment_data["payment_id"]
-                
-                # Get DB session
-                async for session in get_db():
-                    # Get payment from DB
-                    payment = await session.get(Payment, UUID(payment_id))
-                    if not payment:
-                        logger.error(f"Payment {payment_id} not found in database")
-                        continue
-                        
-                    # Process payment
-                    success = await process_payment(payment, session)
-                    
-                    if success:
-                        await queue.complete_payment(payment_id)
-                    else:
-                        # Retry failed payment
-                        retry_success = await queue.retry_payment(payment_id, payment_data)
-                        if not retry_success:
-                            logger.error(f"Payment {payment_id} failed after max retries")
-                
             except asyncio.CancelledError:
                 raise
             except Exception as e:
@@ -97,11 +136,12 @@ async def process_payment_queue() -> None:
 
 async def cleanup_worker() -> None:
     """Periodically clean up stale processing items."""
+    queue = get_queue()
     try:
         while True:
             try:
                 await queue.cleanup_stale_processing()
-                await asyncio.sleep(300)  # Run every 5 minutes
+                await asyncio.sleep(QUEUE_STALE_SWEEP_INTERVAL_SECONDS)
             except asyncio.CancelledError:
                 raise
             except Exception as e:
@@ -113,6 +153,7 @@ async def cleanup_worker() -> None:
 
 async def monitor_worker() -> None:
     """Periodically log queue statistics."""
+    queue = get_queue()
     try:
         while True:
             try:
@@ -136,6 +177,7 @@ async def start_worker() -> None:
         await asyncio.gather(
             process_payment_queue(),
             cleanup_worker(),
+            retry_promoter(get_queue()),
             monitor_worker()
         )
     except asyncio.CancelledError:
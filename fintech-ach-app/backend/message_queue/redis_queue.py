@@ -1,119 +1,505 @@
 import json
 import logging
-from typing import Optional, Dict, Any
-import redis
-from datetime import datetime, timedelta
+import os
+import time
+from typing import Optional, Dict, Any, Iterable, List, Sequence, Tuple
+import redis.asyncio as redis
+from datetime import datetime
+from uuid import uuid4
+from .backoff import QUEUE_SWEEP_BATCH_SIZE, QUEUE_VISIBILITY_TIMEOUT_SECONDS, RETRY_PROMOTE_BATCH_SIZE, retry_delay
+from .base import PaymentQueue
+from .codec import decode_message, encode_message
+from .dlq import dead_letter_body, dead_letter_id, replay_message, with_failed_attempt
+from .lua_scripts import (
+    ACK_SCRIPT,
+    DEAD_LETTER_SCRIPT,
+    DEQUEUE_SCRIPT,
+    ENQUEUE_SCRIPT,
+    MIGRATE_DEAD_LETTERS_SCRIPT,
+    MIGRATE_LEGACY_LIST_SCRIPT,
+    PROMOTE_TO_LANES_SCRIPT,
+    REPLAY_TO_LANE_SCRIPT,
+    SCHEDULE_RETRY_SCRIPT,
+    SWEEP_EXPIRED_SCRIPT,
+    UNASSIGNED_ORGANIZATION
+)
+from .priority import (
+    DEFAULT_PRIORITY,
+    PRIORITY_LANE_MAX_WAIT_SECONDS,
+    PRIORITY_LANE_WEIGHTS,
+    PRIORITY_LANES,
+    assign_priority
+)
 
 logger = logging.getLogger(__name__)
 
-class RedisQueue:
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
-        self.redis = redis.from_url(redis_url, decode_responses=True)
-        self.main_queue = "payment_queue"
-        self.processing_queue = "payment_processing"
-        self.dead_letter_queue = "payment_dlq"
-        self.retry_count_hash = "payment_retry_count"
-        self.max_retries = 3
-
-    async def enqueue_payment(self, payment_id: str, payload: Dict[str, Any]) -> None:
-        """Add a payment to the processing queue."""
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+# Shared connection pool settings; callers wait up to REDIS_POOL_TIMEOUT for a free connection
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))
+# Must stay above the blocking dequeue timeout
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "10"))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", "30"))
+# Fair scheduling defaults: messages per organization per round-robin turn, and in-flight cap (0 = none)
+ORG_QUEUE_DEFAULT_WEIGHT = int(os.getenv("ORG_QUEUE_DEFAULT_WEIGHT", "1"))
+ORG_QUEUE_MAX_IN_FLIGHT = int(os.getenv("ORG_QUEUE_MAX_IN_FLIGHT", "100"))
+
+def create_redis_client(redis_url: str = REDIS_URL) -> redis.Redis:
+    """Create an asyncio Redis client backed by a sized, blocking connection pool."""
+    pool = redis.BlockingConnectionPool.from_url(
+        redis_url,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        decode_responses=True,
+        # Binary message bodies (see codec) come back as str and encode back to the same bytes
+        encoding_errors="surrogateescape"
+    )
+    return redis.Redis.from_pool(pool)
+
+class RedisQueueMixin:
+    """Client, dead letter store and pool statistics shared by the list and stream queues.
+
+    Dead letters are JSON bodies in a hash by dead letter id, with the ids in
+    a sorted set paged by ZRANGEBYLEX (see lua_scripts); the list used for
+    them before is drained into the hash when they are listed.
+    """
+
+    def __init__(self, client: redis.Redis, namespace: str = ""):
+        self.redis = client
+        # Prepended to every key, so several queues (see sharded) can share one Redis
+        self.namespace = namespace
+        # Dead letters by id and their time-ordered index; the list used before is drained into them
+        self.dead_letters_hash = f"{namespace}payment_dead_letters"
+        self.dead_letter_index = f"{namespace}payment_dead_letter_index"
+        self.dead_letter_queue = f"{namespace}payment_dlq"
+        # Numbers the ids given to entries of the lists used before (dead letters, and queued JSON bodies)
+        self.legacy_sequence = f"{namespace}payment_queue:legacy_sequence"
+        self._migrate_dead_letters = client.register_script(MIGRATE_DEAD_LETTERS_SCRIPT)
+
+    async def list_dead_letters(self, after: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """A page of dead letters, oldest first, after the given id; one range read of the index."""
+        await self._migrate_dead_letters(
+            keys=[self.dead_letter_queue, self.dead_letters_hash, self.dead_letter_index, self.legacy_sequence],
+            args=[10000]
+        )
+        ids = await self.redis.zrangebylex(
+            self.dead_letter_index, f"({after}" if after else "-", "+", start=0, num=limit
+        )
+        bodies = await self.redis.hmget(self.dead_letters_hash, ids) if ids else []
+        entries = [{**json.loads(body), "id": entry_id} for entry_id, body in zip(ids, bodies) if body is not None]
+        return entries, ids[-1] if len(ids) == limit else None
+
+    async def get_dead_letter(self, dead_letter_id: str) -> Optional[Dict[str, Any]]:
+        """A dead letter by id; one hash read."""
+        body = await self.redis.hget(self.dead_letters_hash, dead_letter_id)
+        return {**json.loads(body), "id": dead_letter_id} if body is not None else None
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Connections of the shared pool currently in use and idle."""
+        pool = self.redis.connection_pool
+        return {
+            "max_connections": pool.max_connections,
+            "in_use": len(pool._in_use_connections),
+            "idle": len(pool._available_connections)
+        }
+
+    async def close(self) -> None:
+        """Close the client and disconnect every pooled connection."""
+        await self.redis.aclose()
+
+class RedisQueue(RedisQueueMixin, PaymentQueue):
+    """Reliable payment queue with priority lanes and per-organization fair scheduling.
+
+    Message bodies live in a hash keyed by message id and the lists only carry
+    ids. Payments are assigned a priority lane by rule (see priority) and
+    within it queued on one list per organization. Dequeue picks lanes by
+    weight, serving any lane whose oldest message waited past its limit
+    first, and serves a lane's organizations by deficit round robin: each
+    organization takes up to its weight in messages per turn and no more than
+    its in-flight cap at once, so one tenant's burst cannot hold up the
+    others. A dequeued id is registered in the in-flight hash with its claim
+    time and in a deadline index scored by its visibility deadline; the id
+    together with the claim time is the receipt handle used to ack, retry or
+    dead-letter the message, and the stale sweep only reads the expired end of
+    the index. Failed messages wait in a sorted set scored by their due time
+    until promote_due_retries puts them back on their lane. Every state change
+    is a single Lua script (see lua_scripts) run with EVALSHA, and settling
+    checks the receipt's claim, so a recovered message is never settled twice.
+    """
+
+    def __init__(self, client: redis.Redis, namespace: str = ""):
+        super().__init__(client, namespace)
+        # Pre-lane queue list; messages left in it are moved to the default lane by migrate_legacy_lists
+        self.main_queue = f"{namespace}payment_queue"
+        # Prefix of the per-lane keys described in lua_scripts
+        self.key_prefix = f"{namespace}payment_queue:"
+        self.lane_credits = f"{namespace}payment_queue:lane_credits"
+        self.org_weights = f"{namespace}payment_queue:weights"
+        self.org_caps = f"{namespace}payment_queue:in_flight_caps"
+        self.org_in_flight = f"{namespace}payment_queue:in_flight"
+        self.doorbell = f"{namespace}payment_queue:doorbell"
+        # Only written by the dequeue used before lanes; migrate_legacy_lists recovers leftovers
+        self.handoff_queue = f"{namespace}payment_handoff"
+        self.inflight_hash = f"{namespace}payment_inflight"
+        self.deadlines_zset = f"{namespace}payment_inflight_deadlines"
+        self.messages_hash = f"{namespace}payment_messages"
+        self.message_lanes_hash = f"{namespace}payment_message_lanes"
+        self.retry_zset = f"{namespace}payment_retry_scheduled"
+        # Pre-receipt list of in-flight JSON messages, drained by migrate_legacy_lists
+        self.legacy_processing_queue = f"{namespace}payment_processing"
+        self.default_weight = ORG_QUEUE_DEFAULT_WEIGHT
+        self.default_in_flight_cap = ORG_QUEUE_MAX_IN_FLIGHT
+        self.lane_weights = dict(PRIORITY_LANE_WEIGHTS)
+        self.lane_max_wait = dict(PRIORITY_LANE_MAX_WAIT_SECONDS)
+        self.visibility_timeout = QUEUE_VISIBILITY_TIMEOUT_SECONDS
+        self._deadlines_backfilled = False
+        self._enqueue = client.register_script(ENQUEUE_SCRIPT)
+        self._dequeue = client.register_script(DEQUEUE_SCRIPT)
+        self._ack = client.register_script(ACK_SCRIPT)
+        self._schedule_retry = client.register_script(SCHEDULE_RETRY_SCRIPT)
+        self._dead_letter = client.register_script(DEAD_LETTER_SCRIPT)
+        self._promote_retries = client.register_script(PROMOTE_TO_LANES_SCRIPT)
+        self._sweep_expired = client.register_script(SWEEP_EXPIRED_SCRIPT)
+        self._migrate_legacy_list = client.register_script(MIGRATE_LEGACY_LIST_SCRIPT)
+        self._replay_dead_letter = client.register_script(REPLAY_TO_LANE_SCRIPT)
+
+    @staticmethod
+    def message_id(receipt: str) -> str:
+        """The message id a receipt ("<message id>@<claim time>") refers to."""
+        return receipt.partition("@")[0]
+
+    def lane(self, priority: str, organization_id: Optional[str]) -> str:
+        """List holding the queued message ids of an organization in a priority lane."""
+        return f"{self.key_prefix}{priority}:org:{organization_id or UNASSIGNED_ORGANIZATION}"
+
+    async def enqueue_payment(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """Add a payment to its priority lane and return its message id.
+
+        Without an explicit priority the lane follows from the payload's
+        payment_type and amount and the organization.
+        """
         try:
-            self.redis.lpush(self.main_queue, json.dumps({
-                "payment_id": payment_id,
-                "payload": payload,
-                "timestamp": datetime.utcnow().isoformat()
-            }))
-            logger.info(f"Payment {payment_id} enqueued successfully")
+            message_id, args = self._enqueue_args(payment_id, payload, organization_id, priority)
+            await self._enqueue(keys=[self.messages_hash, self.doorbell], args=args)
+            logger.info(f"Payment {payment_id} enqueued successfully in the {args[2]} lane")
+            return message_id
         except Exception as e:
             logger.error(f"Error enqueueing payment {payment_id}: {str(e)}")
             raise
 
-    async def dequeue_payment(self) -> Optional[Dict[str, Any]]:
-        """Get the next payment from the queue with visibility timeout."""
+    def _enqueue_args(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str],
+        priority: Optional[str]
+    ) -> Tuple[str, List[Any]]:
+        """New message id and the enqueue script's arguments for a payment."""
+        priority = priority or assign_priority(payload.get("payment_type"), payload.get("amount"), organization_id)
+        if priority not in PRIORITY_LANES:
+            raise ValueError(f"Unknown priority lane {priority!r}")
+        message_id = uuid4().hex
+        body = encode_message({
+            "payment_id": payment_id,
+            "payload": payload,
+            "organization_id": organization_id,
+            "priority": priority,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+        return message_id, [
+            message_id, body, priority, organization_id or UNASSIGNED_ORGANIZATION, time.time(), self.key_prefix
+        ]
+
+    async def enqueue_batch(self, messages: Sequence[Dict[str, Any]]) -> List[str]:
+        """Add several payments to their lanes with one pipelined round trip."""
+        prepared = [
+            self._enqueue_args(
+                message["payment_id"], message["payload"], message.get("organization_id"), message.get("priority")
+            )
+            for message in messages
+        ]
+        if not prepared:
+            return []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for _, args in prepared:
+                await self._enqueue(keys=[self.messages_hash, self.doorbell], args=args, client=pipe)
+            await pipe.execute()
+        logger.info(f"Enqueued {len(prepared)} payments")
+        return [message_id for message_id, _ in prepared]
+
+    async def dequeue_batch(self, n: int, max_wait: float = 1) -> List[Dict[str, Any]]:
+        """Claim up to n payments in priority and fair order, waiting up to max_wait seconds for the first one.
+
+        A batch is one script call; an empty queue is waited on with a blocking
+        pop of the doorbell list that every enqueue rings.
+        """
         try:
-            # Move item from main queue to processing queue
-            data = self.redis.brpoplpush(self.main_queue, self.processing_queue, timeout=1)
-            if not data:
-                return None
-
-            payment_data = json.loads(data)
-            payment_id = payment_data["payment_id"]
-            
-            # Set initial retry count if not exists
-            self.redis.hsetnx(self.retry_count_hash, payment_id, 0)
-            
-            return payment_data
+            deadline = time.monotonic() + max_wait
+            while True:
+                claim = repr(time.time())
+                claimed = await self._dequeue(
+                    keys=[
+                        self.org_weights, self.org_caps, self.org_in_flight, self.inflight_hash,
+                        self.messages_hash, self.message_lanes_hash, self.lane_credits, self.deadlines_zset
+                    ],
+                    args=[
+                        claim, n, self.default_weight, self.default_in_flight_cap, self.key_prefix,
+                        self.visibility_timeout, *self._lane_settings()
+                    ]
+                )
+                if claimed:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                await self.redis.brpop(self.doorbell, timeout=remaining)
+
+            batch = []
+            for message_id, body in zip(claimed[::2], claimed[1::2]):
+                payment_data = decode_message(body)
+                payment_data["receipt"] = f"{message_id}@{claim}"
+                batch.append(payment_data)
+            return batch
         except Exception as e:
-            logger.error(f"Error dequeuing payment: {str(e)}")
-            return None
+            logger.error(f"Error dequeuing payment batch: {str(e)}")
+            raise
 
-    async def complete_payment(self, payment_id: str) -> None:
-        """Mark a payment as completed and remove from processing queue."""
+    async def ack_batch(self, receipts: Iterable[str]) -> None:
+        """Acknowledge several processed messages in one round trip."""
+        receipts = list(receipts)
+        if not receipts:
+            return
         try:
-            # Find and remove the payment from processing queue
-            processing_items = self.redis.lrange(self.processing_queue, 0, -1)
-            for item in processing_items:
-                data = json.loads(item)
-                if data["payment_id"] == payment_id:
-                    self.redis.lrem(self.processing_queue, 1, item)
-                    self.redis.hdel(self.retry_count_hash, payment_id)
-                    logger.info(f"Payment {payment_id} completed successfully")
-                    return
+            acked = await self._ack(
+                keys=[
+                    self.inflight_hash, self.message_lanes_hash, self.org_in_flight,
+                    self.messages_hash, self.deadlines_zset
+                ],
+                args=receipts
+            )
+            logger.info(f"{acked} messages completed successfully")
+            if acked < len(receipts):
+                logger.warning(f"{len(receipts) - acked} acks ignored: their claims were recovered by the stale sweep")
         except Exception as e:
-            logger.error(f"Error completing payment {payment_id}: {str(e)}")
+            logger.error(f"Error completing {len(receipts)} messages: {str(e)}")
             raise
 
-    async def retry_payment(self, payment_id: str, payment_data: Dict[str, Any]) -> bool:
-        """Retry a failed payment if under max retries, otherwise move to DLQ."""
+    async def retry_payment(self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None) -> bool:
+        """Schedule a failed payment for a delayed retry if under max retries, otherwise move to DLQ."""
+        payment_id = payment_data.get("payment_id")
         try:
-            retry_count = int(self.redis.hget(self.retry_count_hash, payment_id) or 0)
-            retry_count += 1
-            
-            if retry_count <= self.max_retries:
-                # Update retry count and re-queue
-                self.redis.hset(self.retry_count_hash, payment_id, retry_count)
-                payment_data["retries"] = retry_count
-                payment_data["timestamp"] = datetime.utcnow().isoformat()
-                self.redis.lpush(self.main_queue, json.dumps(payment_data))
-                logger.info(f"Payment {payment_id} requeued for retry {retry_count}/{self.max_retries}")
-                return True
-            else:
-                # Move to dead letter queue
-                self.redis.lpush(self.dead_letter_queue, json.dumps(payment_data))
-                self.redis.hdel(self.retry_count_hash, payment_id)
+            retry_count = int(payment_data.get("retries", 0)) + 1
+            if retry_count > self.max_retries:
+                await self.dead_letter_payment(receipt, payment_data, error)
                 logger.warning(f"Payment {payment_id} moved to DLQ after {retry_count} retries")
                 return False
+
+            body = with_failed_attempt(payment_data, error)
+            body["retries"] = retry_count
+            body["timestamp"] = datetime.utcnow().isoformat()
+            delay = retry_delay(retry_count)
+            scheduled = await self._schedule_retry(
+                keys=[
+                    self.inflight_hash, self.message_lanes_hash, self.org_in_flight,
+                    self.messages_hash, self.retry_zset, self.deadlines_zset
+                ],
+                args=[receipt, encode_message(body), time.time() + delay]
+            )
+            if not scheduled:
+                logger.warning(f"Retry of payment {payment_id} ignored: its claim was recovered by the stale sweep")
+                return False
+            logger.info(f"Payment {payment_id} scheduled for retry {retry_count}/{self.max_retries} in {delay:.1f}s")
+            return True
         except Exception as e:
             logger.error(f"Error retrying payment {payment_id}: {str(e)}")
             raise
 
-    async def get_queue_stats(self) -> Dict[str, int]:
-        """Get current queue statistics."""
+    async def promote_due_retries(self, limit: int = RETRY_PROMOTE_BATCH_SIZE) -> int:
+        """Move up to limit scheduled retries that are due back to their lane."""
+        return await self._promote_retries(
+            keys=[self.retry_zset, self.message_lanes_hash, self.doorbell],
+            args=[time.time(), limit, self.key_prefix, DEFAULT_PRIORITY]
+        )
+
+    async def dead_letter_payment(
+        self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None
+    ) -> None:
+        """Move a message to the dead letter queue; dead letters stay JSON for operators to read."""
+        body = dead_letter_body(payment_data, error)
+        moved = await self._dead_letter(
+            keys=[
+                self.inflight_hash, self.message_lanes_hash, self.org_in_flight, self.messages_hash,
+                self.dead_letters_hash, self.deadlines_zset, self.dead_letter_index
+            ],
+            args=[receipt, json.dumps(body), dead_letter_id(self.message_id(receipt))]
+        )
+        if not moved:
+            logger.warning(
+                f"Dead-lettering of payment {payment_data.get('payment_id')} ignored: "
+                f"its claim was recovered by the stale sweep"
+            )
+
+    async def replay_dead_letter(self, dead_letter_id: str) -> bool:
+        """Put a dead letter back on its lane with its retries reset and its attempt history kept."""
+        body = await self.redis.hget(self.dead_letters_hash, dead_letter_id)
+        if body is None:
+            return False
+        message = replay_message(json.loads(body))
+        priority = message.get("priority") if message.get("priority") in PRIORITY_LANES else DEFAULT_PRIORITY
+        message["priority"] = priority
+        return bool(await self._replay_dead_letter(
+            keys=[self.dead_letters_hash, self.dead_letter_index, self.messages_hash, self.doorbell],
+            args=[
+                dead_letter_id, uuid4().hex, encode_message(message), priority,
+                message.get("organization_id") or UNASSIGNED_ORGANIZATION, time.time(), self.key_prefix
+            ]
+        ))
+
+    def _lane_settings(self) -> List[Any]:
+        settings = []
+        for priority in PRIORITY_LANES:
+            settings += [priority, int(self.lane_weights[priority]), self.lane_max_wait[priority]]
+        return settings
+
+    async def set_organization_weight(self, organization_id: str, weight: Optional[int]) -> None:
+        """Messages an organization may take per round-robin turn in each lane; None restores the default."""
+        if weight is None:
+            await self.redis.hdel(self.org_weights, organization_id)
+        else:
+            await self.redis.hset(self.org_weights, organization_id, max(1, int(weight)))
+
+    async def set_organization_in_flight_cap(self, organization_id: str, cap: Optional[int]) -> None:
+        """Most messages of an organization in flight at once across lanes (0 = no cap); None restores the default."""
+        if cap is None:
+            await self.redis.hdel(self.org_caps, organization_id)
+        else:
+            await self.redis.hset(self.org_caps, organization_id, max(0, int(cap)))
+
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """Get current queue statistics, per priority lane and per organization."""
         try:
+            now = time.time()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for priority in PRIORITY_LANES:
+                    pipe.zcard(f"{self.key_prefix}{priority}:enqueued")
+                    pipe.zrange(f"{self.key_prefix}{priority}:enqueued", 0, 0, withscores=True)
+                    pipe.smembers(f"{self.key_prefix}{priority}:active")
+                pipe.hgetall(self.org_in_flight)
+                pipe.hlen(self.inflight_hash)
+                pipe.zcard(self.dead_letter_index)
+                pipe.llen(self.dead_letter_queue)
+                pipe.zcard(self.retry_zset)
+                results = await pipe.execute()
+            lane_results = [results[index:index + 3] for index in range(0, 3 * len(PRIORITY_LANES), 3)]
+            org_in_flight, inflight_size, dlq_size, legacy_dlq_size, scheduled_size = results[-5:]
+
+            lanes = {}
+            organization_lanes = []
+            for priority, (depth, oldest, organizations) in zip(PRIORITY_LANES, lane_results):
+                lanes[priority] = {
+                    "depth": depth,
+                    "oldest_age_seconds": round(now - oldest[0][1], 3) if oldest else None
+                }
+                organization_lanes += [(organization_id, priority) for organization_id in organizations]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for organization_id, priority in organization_lanes:
+                    pipe.llen(self.lane(priority, organization_id))
+                    # Lanes are pushed on the left and served from the right, so the tail is the oldest
+                    pipe.lindex(self.lane(priority, organization_id), -1)
+                lane_results = await pipe.execute()
+            lane_sizes, lane_tails = lane_results[0::2], lane_results[1::2]
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for (_, priority), message_id in zip(organization_lanes, lane_tails):
+                    pipe.zscore(f"{self.key_prefix}{priority}:enqueued", message_id or "")
+                enqueued_at = await pipe.execute()
+
+            per_organization = {
+                organization_id: {"queued": 0, "in_flight": int(in_flight), "oldest_age_seconds": None}
+                for organization_id, in_flight in org_in_flight.items()
+            }
+            for (organization_id, _), queued, since in zip(organization_lanes, lane_sizes, enqueued_at):
+                counts = per_organization.setdefault(
+                    organization_id, {"queued": 0, "in_flight": 0, "oldest_age_seconds": None}
+                )
+                counts["queued"] += queued
+                if since is not None:
+                    counts["oldest_age_seconds"] = max(counts["oldest_age_seconds"] or 0, round(now - since, 3))
             return {
-                "main_queue_size": self.redis.llen(self.main_queue),
-                "processing_queue_size": self.redis.llen(self.processing_queue),
-                "dead_letter_queue_size": self.redis.llen(self.dead_letter_queue)
+                "main_queue_size": sum(lane["depth"] for lane in lanes.values()),
+                "processing_queue_size": inflight_size,
+                "dead_letter_queue_size": dlq_size + legacy_dlq_size,
+                "scheduled_retry_size": scheduled_size,
+                "lanes": lanes,
+                "organizations": per_organization,
+                "connection_pool": self.pool_stats()
             }
         except Exception as e:
             logger.error(f"Error getting queue stats: {str(e)}")
             raise
 
-    async def cleanup_stale_processing(self, timeout_minutes: int = 30) -> None:
-        """Clean up stale items in processing queue."""
+    async def _backfill_deadlines(self) -> None:
+        """Index in-flight messages claimed before the deadline index existed; once per process."""
+        if self._deadlines_backfilled:
+            return
+        async for message_id, claimed_at in self.redis.hscan_iter(self.inflight_hash):
+            await self.redis.zadd(self.deadlines_zset, {message_id: float(claimed_at) + self.visibility_timeout}, nx=True)
+        self._deadlines_backfilled = True
+
+    async def cleanup_stale_processing(self, timeout_minutes: Optional[int] = None) -> None:
+        """Schedule a retry for claims past their visibility deadline.
+
+        With timeout_minutes, claims older than that are recovered instead.
+        Only expired entries of the deadline index are read, however many
+        messages are in flight.
+        """
         try:
-            cutoff_time = datetime.utcnow() - timedelta(minutes=timeout_minutes)
-            processing_items = self.redis.lrange(self.processing_queue, 0, -1)
-            
-            for item in processing_items:
-                data = json.loads(item)
-                timestamp = datetime.fromisoformat(data["timestamp"])
-                
-                if timestamp < cutoff_time:
-                    # Retry stale payment
-                    self.redis.lrem(self.processing_queue, 1, item)
-                    await self.retry_payment(data["payment_id"], data)
-                    logger.info(f"Cleaned up stale payment {data['payment_id']}")
+            await self._backfill_deadlines()
+            cutoff = time.time()
+            if timeout_minutes is not None:
+                cutoff += self.visibility_timeout - timeout_minutes * 60
+            while True:
+                taken, *expired = await self._sweep_expired(
+                    keys=[self.deadlines_zset, self.inflight_hash, self.messages_hash],
+                    args=[cutoff, QUEUE_SWEEP_BATCH_SIZE, max(cutoff, time.time()) + self.visibility_timeout]
+                )
+                for receipt, body in zip(expired[::2], expired[1::2]):
+                    if not body:
+                        await self.ack_batch([receipt])
+                        continue
+                    # The receipt carries the expired claim, so a worker settling it at the same time wins or loses cleanly
+                    await self.retry_payment(receipt, decode_message(body), "Visibility timeout expired")
+                    logger.info(f"Cleaned up stale message {self.message_id(receipt)}")
+                if taken < QUEUE_SWEEP_BATCH_SIZE:
+                    break
         except Exception as e:
             logger.error(f"Error cleaning up stale processing: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+    async def migrate_legacy_lists(self, batch_size: int = 1000) -> int:
+        """Move messages left in the lists used before lanes and receipts onto the default lane.
+
+        The pre-receipt in-flight list and the pre-lane handoff list hold
+        messages their workers may still be processing, so this must only run
+        once every such worker has stopped (see scripts.migrate_legacy_queue).
+        Returns how many messages were moved.
+        """
+        moved = 0
+        for source in (self.legacy_processing_queue, self.handoff_queue, self.main_queue):
+            while True:
+                taken = await self._migrate_legacy_list(
+                    keys=[source, self.messages_hash, self.legacy_sequence, self.doorbell],
+                    args=[batch_size, DEFAULT_PRIORITY, time.time(), self.key_prefix]
+                )
+                moved += taken
+                if taken < batch_size:
+                    break
+        return moved
@@ -0,0 +1,307 @@
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+from uuid import uuid4
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+from .backoff import QUEUE_VISIBILITY_TIMEOUT_SECONDS, RETRY_PROMOTE_BATCH_SIZE, retry_delay
+from .base import PaymentQueue
+from .codec import decode_message, encode_message
+from .dlq import dead_letter_body, dead_letter_id, replay_message, with_failed_attempt
+from .lua_scripts import (
+    PROMOTE_TO_STREAM_SCRIPT,
+    REPLAY_TO_STREAM_SCRIPT,
+    STREAM_ACK_SCRIPT,
+    STREAM_DEAD_LETTER_SCRIPT,
+    STREAM_SCHEDULE_RETRY_SCRIPT
+)
+from .redis_queue import RedisQueueMixin
+
+logger = logging.getLogger(__name__)
+
+# Messages left unacknowledged this long (failed or crashed consumer) are claimed by another consumer;
+# defaults to the list queue's visibility timeout, and must exceed the time a batch takes
+PAYMENT_STREAM_CLAIM_IDLE_MS = int(
+    os.getenv("PAYMENT_STREAM_CLAIM_IDLE_MS", str(int(QUEUE_VISIBILITY_TIMEOUT_SECONDS * 1000)))
+)
+PAYMENT_STREAM_BLOCK_MS = int(os.getenv("PAYMENT_STREAM_BLOCK_MS", "1000"))
+
+# Settings of the list queue's priority lanes and fair scheduling, which a single FIFO stream cannot apply
+LIST_QUEUE_SCHEDULING_SETTINGS = (
+    "ORG_QUEUE_DEFAULT_WEIGHT",
+    "ORG_QUEUE_MAX_IN_FLIGHT",
+    "PRIORITY_SAME_DAY_PAYMENT_TYPES",
+    "PRIORITY_HIGH_VALUE_AMOUNT",
+    "PRIORITY_BULK_ORGANIZATIONS",
+    "PRIORITY_LANE_WEIGHTS",
+    "PRIORITY_LANE_MAX_WAIT_SECONDS"
+)
+
+def warn_ignored_scheduling_settings() -> List[str]:
+    """Warn about priority and fairness settings in the environment, which streams ignore; returns their names."""
+    ignored = [name for name in LIST_QUEUE_SCHEDULING_SETTINGS if os.getenv(name)]
+    if ignored:
+        logger.warning(
+            f"QUEUE_BACKEND=streams serves payments in FIFO order and ignores {', '.join(ignored)}; "
+            f"use the list backend for priority lanes and per-organization fairness"
+        )
+    return ignored
+
+class RedisStreamQueue(RedisQueueMixin, PaymentQueue):
+    """Payment queue on a Redis stream with a consumer group.
+
+    XREADGROUP hands each message to one consumer and keeps it in that
+    consumer's pending list until XACK. Messages of a crashed consumer are
+    redelivered by XAUTOCLAIM once idle for PAYMENT_STREAM_CLAIM_IDLE_MS, and
+    the pending list's delivery count tells how often that happened. A failed
+    message is acknowledged and its body waits in a sorted set scored by its
+    due time until promote_due_retries appends it to the stream again. The
+    receipt handle is the stream entry id. Settling checks that the entry is
+    still pending for this consumer, so once another consumer has reclaimed
+    it the first one can no longer ack, retry or dead-letter it. There are no
+    priority lanes or per-organization scheduling (see
+    warn_ignored_scheduling_settings); dead letters are stored like the list
+    queue's (see RedisQueueMixin).
+    """
+
+    def __init__(self, client: redis.Redis, consumer: Optional[str] = None, namespace: str = ""):
+        super().__init__(client, namespace)
+        self.stream = f"{namespace}payment_stream"
+        self.group = "payment_workers"
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+        self.claim_idle_ms = PAYMENT_STREAM_CLAIM_IDLE_MS
+        self.block_ms = PAYMENT_STREAM_BLOCK_MS
+        self._group_ready = False
+        # Holds message bodies rather than ids, since failed entries leave the stream
+        self.retry_zset = f"{namespace}payment_stream_retry"
+        self._promote_retries = client.register_script(PROMOTE_TO_STREAM_SCRIPT)
+        self._replay_to_stream = client.register_script(REPLAY_TO_STREAM_SCRIPT)
+        self._ack = client.register_script(STREAM_ACK_SCRIPT)
+        self._schedule_retry = client.register_script(STREAM_SCHEDULE_RETRY_SCRIPT)
+        self._dead_letter = client.register_script(STREAM_DEAD_LETTER_SCRIPT)
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def enqueue_payment(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """Append a payment to the stream and return its entry id; the stream is served in FIFO order."""
+        try:
+            await self._ensure_group()
+            message_id = await self.redis.xadd(self.stream, {"data": self._entry(payment_id, payload, organization_id)})
+            logger.info(f"Payment {payment_id} enqueued successfully")
+            return message_id
+        except Exception as e:
+            logger.error(f"Error enqueueing payment {payment_id}: {str(e)}")
+            raise
+
+    @staticmethod
+    def _entry(payment_id: str, payload: Dict[str, Any], organization_id: Optional[str]) -> Union[bytes, str]:
+        return encode_message({
+            "payment_id": payment_id,
+            "payload": payload,
+            "organization_id": organization_id,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    async def enqueue_batch(self, messages: Sequence[Dict[str, Any]]) -> List[str]:
+        """Append several payments to the stream with one pipelined round trip."""
+        if not messages:
+            return []
+        await self._ensure_group()
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for message in messages:
+                pipe.xadd(self.stream, {
+                    "data": self._entry(message["payment_id"], message["payload"], message.get("organization_id"))
+                })
+            message_ids = await pipe.execute()
+        logger.info(f"Enqueued {len(message_ids)} payments")
+        return message_ids
+
+    async def dequeue_payment(self) -> Optional[Dict[str, Any]]:
+        """Claim a message abandoned by its consumer, or read the next new one."""
+        try:
+            batch = await self.dequeue_batch(1, self.block_ms / 1000)
+            return batch[0] if batch else None
+        except Exception as e:
+            logger.error(f"Error dequeuing payment: {str(e)}")
+            return None
+
+    async def dequeue_batch(self, n: int, max_wait: float = 1) -> List[Dict[str, Any]]:
+        """Claim up to n idle pending messages, then fill the batch with new ones.
+
+        Blocks up to max_wait seconds only when nothing could be reclaimed.
+        """
+        try:
+            await self._ensure_group()
+            batch = []
+            start_id = "0-0"
+            while len(batch) < n:
+                # Walk the pending list with the returned cursor so entries claimed here are not claimed twice
+                start_id, claimed, _ = await self.redis.xautoclaim(
+                    self.stream, self.group, self.consumer,
+                    min_idle_time=self.claim_idle_ms, start_id=start_id, count=n - len(batch)
+                )
+                if not claimed:
+                    break
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for message_id, _ in claimed:
+                        pipe.xpending_range(self.stream, self.group, min=message_id, max=message_id, count=1)
+                    pending = await pipe.execute()
+                for (message_id, fields), entry in zip(claimed, pending):
+                    deliveries = entry[0]["times_delivered"] if entry else 1
+                    payment_data = decode_message(fields["data"])
+                    # Scheduled retries so far plus redeliveries of this entry; the first delivery is not a retry
+                    retries = int(payment_data.get("retries", 0)) + deliveries - 1
+                    if retries > self.max_retries:
+                        await self.dead_letter_payment(
+                            message_id, payment_data, f"Delivered {deliveries} times without an ack"
+                        )
+                        logger.warning(f"Payment {payment_data.get('payment_id')} moved to DLQ after {retries} retries")
+                        continue
+                    payment_data["receipt"] = message_id
+                    payment_data["retries"] = retries
+                    batch.append(payment_data)
+                if start_id == "0-0":
+                    break
+
+            if len(batch) < n:
+                # BLOCK 0 would wait forever, so a zero max_wait reads without blocking
+                block = int(max_wait * 1000) if not batch and max_wait > 0 else None
+                entries = await self.redis.xreadgroup(
+                    self.group, self.consumer, {self.stream: ">"}, count=n - len(batch), block=block
+                )
+                for message_id, fields in (entries[0][1] if entries else []):
+                    payment_data = decode_message(fields["data"])
+                    payment_data["receipt"] = message_id
+                    payment_data.setdefault("retries", 0)
+                    batch.append(payment_data)
+            return batch
+        except Exception as e:
+            logger.error(f"Error dequeuing payment batch: {str(e)}")
+            raise
+
+    async def ack_batch(self, receipts: Iterable[str]) -> None:
+        """Acknowledge several messages and delete them from the stream in one round trip."""
+        receipts = list(receipts)
+        if not receipts:
+            return
+        try:
+            acked = await self._ack(keys=[self.stream], args=[self.group, self.consumer, *receipts])
+            logger.info(f"{acked} messages completed successfully")
+            if acked < len(receipts):
+                logger.warning(
+                    f"{len(receipts) - acked} acks ignored: their entries were reclaimed by another consumer"
+                )
+        except Exception as e:
+            logger.error(f"Error completing {len(receipts)} messages: {str(e)}")
+            raise
+
+    async def retry_payment(self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None) -> bool:
+        """Schedule a failed payment for a delayed retry if under max retries, otherwise move to DLQ."""
+        payment_id = payment_data.get("payment_id")
+        try:
+            retry_count = int(payment_data.get("retries", 0)) + 1
+            if retry_count > self.max_retries:
+                await self.dead_letter_payment(receipt, payment_data, error)
+                logger.warning(f"Payment {payment_id} moved to DLQ after {retry_count} retries")
+                return False
+
+            body = with_failed_attempt(payment_data, error)
+            body["retries"] = retry_count
+            body["timestamp"] = datetime.utcnow().isoformat()
+            delay = retry_delay(retry_count)
+            scheduled = await self._schedule_retry(
+                keys=[self.stream, self.retry_zset],
+                args=[self.group, self.consumer, receipt, encode_message(body), time.time() + delay]
+            )
+            if not scheduled:
+                logger.warning(f"Retry of payment {payment_id} ignored: its entry was reclaimed by another consumer")
+                return False
+            logger.info(f"Payment {payment_id} scheduled for retry {retry_count}/{self.max_retries} in {delay:.1f}s")
+            return True
+        except Exception as e:
+            logger.error(f"Error retrying payment {payment_id}: {str(e)}")
+            raise
+
+    async def promote_due_retries(self, limit: int = RETRY_PROMOTE_BATCH_SIZE) -> int:
+        """Append up to limit scheduled retries that are due to the stream."""
+        await self._ensure_group()
+        return await self._promote_retries(keys=[self.retry_zset, self.stream], args=[time.time(), limit])
+
+    async def dead_letter_payment(
+        self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None
+    ) -> None:
+        """Move a message from the stream to the dead letter queue, as JSON like the list queue's."""
+        body = dead_letter_body(payment_data, error)
+        moved = await self._dead_letter(
+            keys=[self.stream, self.dead_letters_hash, self.dead_letter_index],
+            args=[self.group, self.consumer, receipt, json.dumps(body), dead_letter_id(receipt)]
+        )
+        if not moved:
+            logger.warning(
+                f"Dead-lettering of payment {payment_data.get('payment_id')} ignored: "
+                f"its entry was reclaimed by another consumer"
+            )
+
+    async def replay_dead_letter(self, dead_letter_id: str) -> bool:
+        """Append a dead letter to the stream again with its retries reset and its attempt history kept."""
+        body = await self.redis.hget(self.dead_letters_hash, dead_letter_id)
+        if body is None:
+            return False
+        await self._ensure_group()
+        return bool(await self._replay_to_stream(
+            keys=[self.dead_letters_hash, self.dead_letter_index, self.stream],
+            args=[dead_letter_id, encode_message(replay_message(json.loads(body)))]
+        ))
+
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """Get current queue statistics."""
+        try:
+            await self._ensure_group()
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.xlen(self.stream)
+                pipe.xpending(self.stream, self.group)
+                pipe.zcard(self.dead_letter_index)
+                pipe.llen(self.dead_letter_queue)
+                pipe.zcard(self.retry_zset)
+                stream_size, pending, dlq_size, legacy_dlq_size, scheduled_size = await pipe.execute()
+            return {
+                "main_queue_size": stream_size - pending["pending"],
+                "processing_queue_size": pending["pending"],
+                "dead_letter_queue_size": dlq_size + legacy_dlq_size,
+                "scheduled_retry_size": scheduled_size,
+                "consumers": {consumer["name"]: consumer["pending"] for consumer in pending["consumers"]},
+                "connection_pool": self.pool_stats()
+            }
+        except Exception as e:
+            logger.error(f"Error getting queue stats: {str(e)}")
+            raise
+
+    async def cleanup_stale_processing(self, timeout_minutes: int = 30) -> None:
+        """Stuck messages are reclaimed with XAUTOCLAIM by dequeue_payment; only dead consumers are removed."""
+        try:
+            await self._ensure_group()
+            for consumer in await self.redis.xinfo_consumers(self.stream, self.group):
+                if consumer["pending"] == 0 and consumer["idle"] > timeout_minutes * 60 * 1000:
+                    await self.redis.xgroup_delconsumer(self.stream, self.group, consumer["name"])
+                    logger.info(f"Removed idle stream consumer {consumer['name']}")
+        except Exception as e:
+            logger.error(f"Error cleaning up stale processing: {str(e)}")
+            raise
@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import time
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .base import PaymentQueue
+
+logger = logging.getLogger(__name__)
+
+# Number of Redis queue shards (1 = unsharded), the message field they are picked by ("payment_id" spreads
+# evenly; "organization_id" keeps an organization on one shard, so its fair share and in-flight cap stay exact),
+# and the Redis URLs they live on (comma-separated; shard i uses URL i mod count, default REDIS_URL)
+QUEUE_SHARDS = int(os.getenv("QUEUE_SHARDS", "1"))
+QUEUE_SHARD_KEY = os.getenv("QUEUE_SHARD_KEY", "payment_id").lower()
+QUEUE_SHARD_REDIS_URLS = [url.strip() for url in os.getenv("QUEUE_SHARD_REDIS_URLS", "").split(",") if url.strip()]
+# Shards this worker serves (comma-separated indexes, default all); it steals from the others when they are empty
+QUEUE_WORKER_SHARDS = os.getenv("QUEUE_WORKER_SHARDS", "")
+# Longest a worker waiting on its own empty shards goes without checking the others
+QUEUE_SHARD_STEAL_INTERVAL_SECONDS = float(os.getenv("QUEUE_SHARD_STEAL_INTERVAL_SECONDS", "0.5"))
+QUEUE_SHARD_KEYS = ("payment_id", "organization_id")
+
+def shard_namespace(index: int) -> str:
+    """Key prefix that keeps a shard's keys apart from the other shards' on a shared Redis node.
+
+    Shard 0 keeps the unsharded key names, so payments queued before sharding
+    was turned on are still served. Like the unsharded queue, shards need
+    single Redis nodes, not a cluster: the scripts derive lane keys they do not
+    declare, and shard 0's keys carry no hash tag.
+    """
+    return f"{{shard{index}}}:" if index else ""
+
+def parse_worker_shards(value: str, count: int) -> List[int]:
+    """Shard indexes listed in QUEUE_WORKER_SHARDS; all shards when empty."""
+    if not value.strip():
+        return list(range(count))
+    shards = [int(index) for index in value.split(",") if index.strip()]
+    unknown = [index for index in shards if not 0 <= index < count]
+    if unknown:
+        raise ValueError(f"QUEUE_WORKER_SHARDS {unknown} out of range for {count} shards")
+    return shards
+
+def merge_stats(shard_stats: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Queue statistics of the shards combined: counts add up, ages take the oldest."""
+    merged: Dict[str, Any] = {}
+    lanes: Dict[str, Dict[str, Any]] = {}
+    organizations: Dict[str, Dict[str, Any]] = {}
+    consumers: Dict[str, int] = defaultdict(int)
+    for stats in shard_stats:
+        for key in ("main_queue_size", "processing_queue_size", "dead_letter_queue_size", "scheduled_retry_size"):
+            merged[key] = merged.get(key, 0) + stats.get(key, 0)
+        for priority, lane in stats.get("lanes", {}).items():
+            merged_lane = lanes.setdefault(priority, {"depth": 0, "oldest_age_seconds": None})
+            merged_lane["depth"] += lane["depth"]
+            merged_lane["oldest_age_seconds"] = _oldest(merged_lane["oldest_age_seconds"], lane["oldest_age_seconds"])
+        for organization_id, counts in stats.get("organizations", {}).items():
+            merged_counts = organizations.setdefault(
+                organization_id, {"queued": 0, "in_flight": 0, "oldest_age_seconds": None}
+            )
+            merged_counts["queued"] += counts.get("queued", 0)
+            merged_counts["in_flight"] += counts.get("in_flight", 0)
+            merged_counts["oldest_age_seconds"] = _oldest(
+                merged_counts["oldest_age_seconds"], counts.get("oldest_age_seconds")
+            )
+        for consumer, pending in stats.get("consumers", {}).items():
+            consumers[consumer] += pending
+    if lanes:
+        merged["lanes"] = lanes
+    if organizations or any("organizations" in stats for stats in shard_stats):
+        merged["organizations"] = organizations
+    if consumers:
+        merged["consumers"] = dict(consumers)
+    return merged
+
+def _oldest(first: Optional[float], second: Optional[float]) -> Optional[float]:
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return max(first, second)
+
+class ShardedQueue(PaymentQueue):
+    """Payment queue spread over several queues, e.g. Redis queues on their own keys or instances.
+
+    A payment goes to the shard picked by the CRC32 of its shard key, so one
+    Redis core no longer carries every enqueue and dequeue. Message ids,
+    receipts and dead letter ids are prefixed with their shard ("<shard>:<id>")
+    and settled on it. A worker serves its own shards first and, when they
+    are empty, steals from the others; while everything is empty it waits on
+    its own shards in turn for at most steal_interval seconds at a time.
+    Statistics are the shards' combined, with each shard's under "shards".
+    """
+
+    def __init__(
+        self,
+        shards: Sequence[PaymentQueue],
+        shard_key: str = "payment_id",
+        worker_shards: Optional[Iterable[int]] = None,
+        steal_interval: float = 0.5
+    ):
+        if not shards:
+            raise ValueError("A sharded queue needs at least one shard")
+        if shard_key not in QUEUE_SHARD_KEYS:
+            raise ValueError(f"Unknown QUEUE_SHARD_KEY {shard_key!r}; expected one of {', '.join(QUEUE_SHARD_KEYS)}")
+        self.shards = list(shards)
+        self.shard_key = shard_key
+        self.worker_shards = list(worker_shards) if worker_shards is not None else list(range(len(self.shards)))
+        self.other_shards = [index for index in range(len(self.shards)) if index not in self.worker_shards]
+        self.steal_interval = steal_interval
+        self.max_retries = self.shards[0].max_retries
+        self._turn = 0
+
+    def shard_for(self, payment_id: str, organization_id: Optional[str] = None) -> int:
+        """Index of the shard a payment belongs to; payments without an organization go by payment id."""
+        key = organization_id if self.shard_key == "organization_id" and organization_id else payment_id
+        return zlib.crc32(str(key).encode()) % len(self.shards)
+
+    def _route(self, qualified: str) -> Tuple[int, str]:
+        """The shard a prefixed id or receipt belongs to, and the id as that shard knows it."""
+        index, _, local = qualified.partition(":")
+        if not index.isdigit() or int(index) >= len(self.shards):
+            raise ValueError(f"{qualified!r} does not name a shard")
+        return int(index), local
+
+    def _rotated(self, indexes: List[int]) -> List[int]:
+        """The indexes starting at a different one each call, so workers do not all start at the same shard."""
+        if not indexes:
+            return []
+        start = self._turn % len(indexes)
+        return indexes[start:] + indexes[:start]
+
+    async def enqueue_payment(
+        self,
+        payment_id: str,
+        payload: Dict[str, Any],
+        organization_id: Optional[str] = None,
+        priority: Optional[str] = None
+    ) -> str:
+        """Add a payment to its shard and return its prefixed message id."""
+        index = self.shard_for(payment_id, organization_id)
+        message_id = await self.shards[index].enqueue_payment(payment_id, payload, organization_id, priority)
+        return f"{index}:{message_id}"
+
+    async def enqueue_batch(self, messages: Sequence[Dict[str, Any]]) -> List[str]:
+        """Add several payments with one batch per shard, the shards' batches sent concurrently."""
+        by_shard: Dict[int, List[int]] = defaultdict(list)
+        for position, message in enumerate(messages):
+            by_shard[self.shard_for(message["payment_id"], message.get("organization_id"))].append(position)
+        shard_ids = await asyncio.gather(*(
+            self.shards[index].enqueue_batch([messages[position] for position in positions])
+            for index, positions in by_shard.items()
+        ))
+        message_ids: List[str] = [""] * len(messages)
+        for (index, positions), ids in zip(by_shard.items(), shard_ids):
+            for position, message_id in zip(positions, ids):
+                message_ids[position] = f"{index}:{message_id}"
+        return message_ids
+
+    async def _take(self, indexes: List[int], n: int, batch: List[Dict[str, Any]]) -> None:
+        for index in indexes:
+            if len(batch) >= n:
+                return
+            for payment_data in await self.shards[index].dequeue_batch(n - len(batch), max_wait=0):
+                payment_data["receipt"] = f"{index}:{payment_data['receipt']}"
+                batch.append(payment_data)
+
+    async def dequeue_batch(self, n: int, max_wait: float = 1) -> List[Dict[str, Any]]:
+        """Claim up to n messages from this worker's shards, or from the others when those are empty."""
+        deadline = time.monotonic() + max_wait
+        while True:
+            self._turn += 1
+            batch: List[Dict[str, Any]] = []
+            await self._take(self._rotated(self.worker_shards), n, batch)
+            if not batch and self.other_shards:
+                await self._take(self._rotated(self.other_shards), n, batch)
+                if batch:
+                    logger.debug(f"Stole {len(batch)} messages from other shards")
+            if batch:
+                return batch
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            # Wait on one of our shards; it returns as soon as that shard gets a message
+            index = self._rotated(self.worker_shards or self.other_shards)[0]
+            waited = await self.shards[index].dequeue_batch(n, max_wait=min(remaining, self.steal_interval))
+            for payment_data in waited:
+                payment_data["receipt"] = f"{index}:{payment_data['receipt']}"
+            if waited:
+                return waited
+
+    async def ack_batch(self, receipts: Iterable[str]) -> None:
+        """Acknowledge messages, one batch per shard, the shards concurrently."""
+        by_shard: Dict[int, List[str]] = defaultdict(list)
+        for receipt in receipts:
+            index, local = self._route(receipt)
+            by_shard[index].append(local)
+        await asyncio.gather(*(self.shards[index].ack_batch(local) for index, local in by_shard.items()))
+
+    async def retry_payment(self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None) -> bool:
+        """Schedule a failed message for a delayed retry on its shard."""
+        index, local = self._route(receipt)
+        return await self.shards[index].retry_payment(local, {**payment_data, "receipt": local}, error)
+
+    async def dead_letter_payment(
+        self, receipt: str, payment_data: Dict[str, Any], error: Optional[str] = None
+    ) -> None:
+        """Move a message to its shard's dead letter queue."""
+        index, local = self._route(receipt)
+        await self.shards[index].dead_letter_payment(local, {**payment_data, "receipt": local}, error)
+
+    async def list_dead_letters(self, after: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """A page of every shard's dead letters merged oldest first.
+
+        Dead letter ids start with the time of dead-lettering, so the shards'
+        pages after the same id merge into one ordered page.
+        """
+        local_after = after.partition(":")[2] if after else None
+        pages = await asyncio.gather(*(shard.list_dead_letters(local_after, limit) for shard in self.shards))
+        entries = []
+        more = False
+        for index, (page, next_cursor) in enumerate(pages):
+            more = more or next_cursor is not None
+            entries += [(entry["id"], index, entry) for entry in page]
+        entries.sort(key=lambda item: item[0])
+        more = more or len(entries) > limit
+        merged = [{**entry, "id": f"{index}:{entry_id}"} for entry_id, index, entry in entries[:limit]]
+        return merged, merged[-1]["id"] if more and merged else None
+
+    async def get_dead_letter(self, dead_letter_id: str) -> Optional[Dict[str, Any]]:
+        """A dead letter from its shard."""
+        try:
+            index, local = self._route(dead_letter_id)
+        except ValueError:
+            return None
+        entry = await self.shards[index].get_dead_letter(local)
+        return {**entry, "id": dead_letter_id} if entry is not None else None
+
+    async def replay_dead_letter(self, dead_letter_id: str) -> bool:
+        """Put a dead letter back on its shard's queue."""
+        try:
+            index, local = self._route(dead_letter_id)
+        except ValueError:
+            return False
+        return await self.shards[index].replay_dead_letter(local)
+
+    async def promote_due_retries(self, limit: int) -> int:
+        """Promote due retries on every shard."""
+        return sum(await asyncio.gather(*(shard.promote_due_retries(limit) for shard in self.shards)))
+
+    async def cleanup_stale_processing(self, timeout_minutes: Optional[int] = None) -> None:
+        """Recover stale claims on every shard, so a shard whose workers are gone is still swept."""
+        for shard in self.shards:
+            if timeout_minutes is None:
+                await shard.cleanup_stale_processing()
+            else:
+                await shard.cleanup_stale_processing(timeout_minutes)
+
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """The shards' statistics combined, plus each shard's own."""
+        shard_stats = await asyncio.gather(*(shard.get_queue_stats() for shard in self.shards))
+        stats = merge_stats(shard_stats)
+        stats["shards"] = list(shard_stats)
+        stats["worker_shards"] = self.worker_shards
+        return stats
+
+    async def close(self) -> None:
+        """Close every shard's connections."""
+        for shard in self.shards:
+            await shard.close()
+
+def create_sharded_queue(backend: str, shards: int = QUEUE_SHARDS) -> ShardedQueue:
+    """Redis list or stream queues, one per shard, with one client per distinct Redis URL."""
+    from .redis_queue import REDIS_URL, RedisQueue, create_redis_client
+    from .redis_streams import RedisStreamQueue, warn_ignored_scheduling_settings
+    if backend == "streams":
+        warn_ignored_scheduling_settings()
+    urls = QUEUE_SHARD_REDIS_URLS or [REDIS_URL]
+    clients = {url: create_redis_client(url) for url in urls}
+    queues: List[PaymentQueue] = []
+    for index in range(shards):
+        client = clients[urls[index % len(urls)]]
+        if backend == "streams":
+            queues.append(RedisStreamQueue(client, namespace=shard_namespace(index)))
+        else:
+            queues.append(RedisQueue(client, namespace=shard_namespace(index)))
+    return ShardedQueue(
+        queues,
+        shard_key=QUEUE_SHARD_KEY,
+        worker_shards=parse_worker_shards(QUEUE_WORKER_SHARDS, shards),
+        steal_interval=QUEUE_SHARD_STEAL_INTERVAL_SECONDS
+    )
@@ -0,0 +1,83 @@
+"""add payment hot path indexes
+
+Revision ID: 4c2a9e7b1d30
+Revises: add_test_data_rev
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2a9e7b1d30'
+down_revision = 'add_test_data_rev'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so each
+    # index is built in autocommit mode without blocking writes to payments.
+    # If a build fails it leaves an INVALID index behind; drop it and re-run.
+    with op.get_context().autocommit_block():
+        # Status filter with the default created_at ordering (uuid breaks ties)
+        op.create_index(
+            'ix_payments_status_created_at', 'payments',
+            ['status', sa.text('created_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True
+        )
+        # Unfiltered listing ordered by created_at
+        op.create_index(
+            'ix_payments_created_at_uuid', 'payments',
+            [sa.text('created_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True
+        )
+        # Organization filtering on either side of the payment
+        op.create_index(
+            'ix_payments_from_account_created_at', 'payments',
+            ['from_account', sa.text('created_at DESC')],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_payments_to_account_created_at', 'payments',
+            ['to_account', sa.text('created_at DESC')],
+            postgresql_concurrently=True
+        )
+        # Amount range filter, covering status and created_at for index-only counts
+        op.create_index(
+            'ix_payments_amount', 'payments',
+            ['amount'],
+            postgresql_include=['status', 'created_at'],
+            postgresql_concurrently=True
+        )
+        # Compact date-range index for very large, append-mostly tables
+        op.create_index(
+            'brin_payments_created_at', 'payments',
+            ['created_at'],
+            postgresql_using='brin',
+            postgresql_with={'pages_per_range': 32},
+            postgresql_concurrently=True
+        )
+        # Worker scans only the small set of in-flight payments
+        op.create_index(
+            'ix_payments_in_flight', 'payments',
+            ['created_at'],
+            postgresql_where=sa.text("status IN ('PENDING', 'PROCESSING')"),
+            postgresql_concurrently=True
+        )
+    op.execute("ANALYZE payments")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for index_name in (
+            'ix_payments_in_flight',
+            'brin_payments_created_at',
+            'ix_payments_amount',
+            'ix_payments_to_account_created_at',
+            'ix_payments_from_account_created_at',
+            'ix_payments_created_at_uuid',
+            'ix_payments_status_created_at',
+        ):
+            op.drop_index(index_name, table_name='payments', postgresql_concurrently=True)
@@ -0,0 +1,32 @@
+"""add payment archive index
+
+Revision ID: 5a7c3e9f2b18
+Revises: e3b8f51c7a02
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a7c3e9f2b18'
+down_revision = 'e3b8f51c7a02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'payment_archive_index',
+        sa.Column('payment_uuid', sa.UUID(), nullable=False),
+        sa.Column('organization_id', sa.UUID(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('archive_file', sa.String(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('payment_uuid')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('payment_archive_index')
@@ -0,0 +1,74 @@
+"""add organization_id to payments
+
+Revision ID: 9d41c7e2a6b5
+Revises: 4c2a9e7b1d30
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9d41c7e2a6b5'
+down_revision = '4c2a9e7b1d30'
+branch_labels = None
+depends_on = None
+
+# Rows updated per backfill transaction, so row locks are held only briefly
+BACKFILL_BATCH_SIZE = 5000
+
+# A payment's organization owns its external account: the source of a debit, the destination
+# otherwise, as create_payment assigns it
+EXTERNAL_ACCOUNT = "CASE WHEN {p}.payment_type = 'ach_debit' THEN {p}.from_account ELSE {p}.to_account END"
+
+BACKFILL_ALL = f"""
+    UPDATE payments AS p
+    SET organization_id = e.organization_id
+    FROM external_organization_bank_accounts AS e
+    WHERE e.uuid = {EXTERNAL_ACCOUNT.format(p='p')}
+      AND p.organization_id IS NULL
+"""
+
+BACKFILL_BATCH = sa.text(f"""
+    UPDATE payments AS p
+    SET organization_id = e.organization_id
+    FROM external_organization_bank_accounts AS e
+    WHERE e.uuid = {EXTERNAL_ACCOUNT.format(p='p')}
+      AND p.uuid IN (
+          SELECT p2.uuid
+          FROM payments AS p2
+          JOIN external_organization_bank_accounts AS e2 ON e2.uuid = {EXTERNAL_ACCOUNT.format(p='p2')}
+          WHERE p2.organization_id IS NULL
+          LIMIT :batch_size
+      )
+""").bindparams(batch_size=BACKFILL_BATCH_SIZE)
+
+
+def upgrade() -> None:
+    # Nullable without a default, so adding the column does not rewrite the table
+    op.add_column('payments', sa.Column('organization_id', postgresql.UUID(as_uuid=True), nullable=True))
+
+    with op.get_context().autocommit_block():
+        if op.get_context().as_sql:
+            # Offline SQL scripts cannot loop, so backfill in one statement
+            op.execute(BACKFILL_ALL)
+        else:
+            # Each batch commits on its own; stops once no payment is left to backfill
+            bind = op.get_bind()
+            while bind.execute(BACKFILL_BATCH).rowcount:
+                pass
+
+        op.create_index(
+            'ix_payments_organization_created_at', 'payments',
+            ['organization_id', sa.text('created_at DESC'), sa.text('uuid DESC')],
+            postgresql_concurrently=True
+        )
+    op.execute("ANALYZE payments")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_payments_organization_created_at', table_name='payments', postgresql_concurrently=True)
+    op.drop_column('payments', 'organization_id')
@@ -0,0 +1,53 @@
+"""add payment queue messages
+
+Revision ID: b7e2d4f9c163
+Revises: 5a7c3e9f2b18
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d4f9c163'
+down_revision = '5a7c3e9f2b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'payment_queue_messages',
+        sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column('payment_id', sa.String(), nullable=False),
+        sa.Column('organization_id', sa.String(), nullable=True),
+        sa.Column('priority', sa.String(), nullable=False),
+        sa.Column('priority_rank', sa.SmallInteger(), nullable=False),
+        sa.Column('body', postgresql.JSONB(), nullable=False),
+        sa.Column('status', sa.String(), server_default='queued', nullable=False),
+        sa.Column('retries', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('available_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_payment_queue_messages_ready',
+        'payment_queue_messages',
+        ['priority_rank', 'available_at', 'id'],
+        postgresql_where=sa.text("status = 'queued'")
+    )
+    op.create_index(
+        'ix_payment_queue_messages_claimed',
+        'payment_queue_messages',
+        ['claimed_at'],
+        postgresql_where=sa.text("status = 'in_flight'")
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payment_queue_messages_claimed', table_name='payment_queue_messages')
+    op.drop_index('ix_payment_queue_messages_ready', table_name='payment_queue_messages')
+    op.drop_table('payment_queue_messages')
@@ -0,0 +1,45 @@
+"""add payment outbox
+
+Revision ID: d1f6a8b3e275
+Revises: b7e2d4f9c163
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f6a8b3e275'
+down_revision = 'b7e2d4f9c163'
+branch_labels = None
+depends_on = None
+
+# Same statements as message_queue.outbox.OUTBOX_NOTIFY_DDL, frozen for this revision
+NOTIFY_DDL = (
+    "CREATE OR REPLACE FUNCTION notify_payment_outbox() RETURNS trigger AS $$ "
+    "BEGIN PERFORM pg_notify('payment_outbox', ''); RETURN NULL; END; $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS payment_outbox_notify ON payment_outbox",
+    "CREATE TRIGGER payment_outbox_notify AFTER INSERT ON payment_outbox "
+    "FOR EACH STATEMENT EXECUTE FUNCTION notify_payment_outbox()"
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        'payment_outbox',
+        sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column('payment_uuid', sa.UUID(), nullable=False),
+        sa.Column('organization_id', sa.UUID(), nullable=True),
+        sa.Column('payload', postgresql.JSONB(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    for statement in NOTIFY_DDL:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    op.drop_table('payment_outbox')
+    op.execute("DROP FUNCTION IF EXISTS notify_payment_outbox()")
@@ -0,0 +1,159 @@
+"""partition payments by month of created_at
+
+Revision ID: e3b8f51c7a02
+Revises: 9d41c7e2a6b5
+Create Date: 2026-10-17 12:00:00.000000
+
+Rebuilds payments as a table range-partitioned by created_at, with one
+partition per month from the oldest payment up to three months ahead plus a
+default partition. Rows are copied in a single transaction that holds an
+ACCESS EXCLUSIVE lock on payments, so run it in a maintenance window. Later
+months are created by config.partitions.maintain_payment_partitions.
+
+A unique constraint on a partitioned table must include the partition key,
+so the primary key becomes (uuid, created_at) and idempotency keys move to
+the payment_idempotency_keys table.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b8f51c7a02'
+down_revision = '9d41c7e2a6b5'
+branch_labels = None
+depends_on = None
+
+PAYMENT_COLUMNS = (
+    "uuid, from_account, to_account, amount, status, description, source_routing_number, "
+    "destination_routing_number, payment_type, idempotency_key, organization_id, created_at, updated_at"
+)
+
+# Indexes from migrations 4c2a9e7b1d30 and 9d41c7e2a6b5, rebuilt on the new table
+PAYMENT_INDEXES = [
+    ('ix_payments_status_created_at', ['status', sa.text('created_at DESC'), sa.text('uuid DESC')], {}),
+    ('ix_payments_created_at_uuid', [sa.text('created_at DESC'), sa.text('uuid DESC')], {}),
+    ('ix_payments_from_account_created_at', ['from_account', sa.text('created_at DESC')], {}),
+    ('ix_payments_to_account_created_at', ['to_account', sa.text('created_at DESC')], {}),
+    ('ix_payments_amount', ['amount'], {'postgresql_include': ['status', 'created_at']}),
+    ('brin_payments_created_at', ['created_at'], {
+        'postgresql_using': 'brin',
+        'postgresql_with': {'pages_per_range': 32}
+    }),
+    ('ix_payments_in_flight', ['created_at'], {
+        'postgresql_where': sa.text("status IN ('PENDING', 'PROCESSING')")
+    }),
+    ('ix_payments_organization_created_at', ['organization_id', sa.text('created_at DESC'), sa.text('uuid DESC')], {}),
+]
+
+
+def payment_columns(partitioned: bool) -> list:
+    return [
+        sa.Column('uuid', sa.UUID(), nullable=False),
+        sa.Column('from_account', sa.UUID(), nullable=False),
+        sa.Column('to_account', sa.UUID(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('status', postgresql.ENUM(name='paymentstatus', create_type=False), nullable=False),
+        sa.Column('description', sa.String(), nullable=True),
+        sa.Column('source_routing_number', sa.String(), nullable=False),
+        sa.Column('destination_routing_number', sa.String(), nullable=False),
+        sa.Column('payment_type', sa.String(), nullable=False),
+        sa.Column('idempotency_key', sa.String(), nullable=False),
+        sa.Column('organization_id', sa.UUID(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=not partitioned),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    ]
+
+
+def drop_payment_indexes(table_name: str) -> None:
+    for name, _, _ in PAYMENT_INDEXES:
+        op.drop_index(name, table_name=table_name, if_exists=True)
+
+
+def create_payment_indexes() -> None:
+    for name, columns, kwargs in PAYMENT_INDEXES:
+        op.create_index(name, 'payments', columns, **kwargs)
+
+
+def upgrade() -> None:
+    # Move the old table aside, freeing the names its key and indexes use
+    op.rename_table('payments', 'payments_unpartitioned')
+    op.execute("ALTER TABLE payments_unpartitioned RENAME CONSTRAINT payments_pkey TO payments_unpartitioned_pkey")
+    drop_payment_indexes('payments_unpartitioned')
+
+    op.create_table(
+        'payments',
+        *payment_columns(partitioned=True),
+        sa.PrimaryKeyConstraint('uuid', 'created_at', name='payments_pkey'),
+        postgresql_partition_by='RANGE (created_at)'
+    )
+    op.execute("CREATE TABLE payments_default PARTITION OF payments DEFAULT")
+    # One partition per month (UTC) from the oldest payment to three months ahead
+    op.execute("""
+        DO $$
+        DECLARE
+            month date;
+        BEGIN
+            FOR month IN
+                SELECT generate_series(
+                    date_trunc('month', COALESCE(MIN(created_at), now()) AT TIME ZONE 'UTC'),
+                    date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+                    interval '1 month'
+                )::date
+                FROM payments_unpartitioned
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF payments FOR VALUES FROM (%L) TO (%L)',
+                    'payments_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM'),
+                    month::text || ' 00:00:00+00',
+                    (month + interval '1 month')::date::text || ' 00:00:00+00'
+                );
+            END LOOP;
+        END $$
+    """)
+
+    # The partition key cannot be NULL in the primary key, so legacy rows without created_at get one
+    op.execute(f"""
+        INSERT INTO payments ({PAYMENT_COLUMNS})
+        SELECT uuid, from_account, to_account, amount, status, description, source_routing_number,
+               destination_routing_number, payment_type, idempotency_key, organization_id,
+               COALESCE(created_at, updated_at, now()), updated_at
+        FROM payments_unpartitioned
+    """)
+
+    op.create_table(
+        'payment_idempotency_keys',
+        sa.Column('idempotency_key', sa.String(), nullable=False),
+        sa.Column('payment_uuid', sa.UUID(), nullable=False),
+        sa.Column('payment_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('idempotency_key')
+    )
+    op.execute("""
+        INSERT INTO payment_idempotency_keys (idempotency_key, payment_uuid, payment_created_at)
+        SELECT idempotency_key, uuid, created_at FROM payments
+    """)
+
+    op.drop_table('payments_unpartitioned')
+    create_payment_indexes()
+    op.execute("ANALYZE payments")
+
+
+def downgrade() -> None:
+    op.rename_table('payments', 'payments_partitioned')
+    op.execute("ALTER TABLE payments_partitioned RENAME CONSTRAINT payments_pkey TO payments_partitioned_pkey")
+    drop_payment_indexes('payments_partitioned')
+
+    op.create_table(
+        'payments',
+        *payment_columns(partitioned=False),
+        sa.PrimaryKeyConstraint('uuid', name='payments_pkey'),
+        sa.UniqueConstraint('idempotency_key', name='payments_idempotency_key_key')
+    )
+    op.execute(f"INSERT INTO payments ({PAYMENT_COLUMNS}) SELECT {PAYMENT_COLUMNS} FROM payments_partitioned")
+
+    # Dropping the parent drops all of its partitions
+    op.drop_table('payments_partitioned')
+    op.drop_table('payment_idempotency_keys')
+    create_payment_indexes()
+    op.execute("ANALYZE payments")
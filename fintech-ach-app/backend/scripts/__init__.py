@@ -0,0 +1 @@
+"""Operational and benchmark scripts for the backend."""
@@ -0,0 +1,49 @@
+"""Move settled payments out of the hot payments table into the Parquet archive.
+
+Usage:
+    python -m scripts.archive_payments [--older-than-days 90] [--batch-size 5000] [--max-batches N]
+
+COMPLETED, FAILED and CANCELLED payments created more than --older-than-days
+ago are written to PAYMENT_ARCHIVE_DIR as zstd-compressed Parquet files, one
+directory per organization and month, then deleted from payments. Monthly
+partitions left empty are dropped afterwards. Safe to run from cron; batches
+lock their rows with SKIP LOCKED so concurrent runs do not collide.
+"""
+import argparse
+import asyncio
+import logging
+from datetime import timezone
+from archive.payment_archive import PAYMENT_ARCHIVE_AFTER_DAYS, archive_payments, hot_window_start
+from config.database import async_session, dispose_engines, engine
+from config.partitions import drop_empty_payment_partitions, month_start
+
+async def run(older_than_days: int, batch_size: int, max_batches: int) -> None:
+    total = 0
+    batches = 0
+    try:
+        while not max_batches or batches < max_batches:
+            async with async_session() as session:
+                moved = await archive_payments(session, older_than_days=older_than_days, batch_size=batch_size)
+            if not moved:
+                break
+            total += moved
+            batches += 1
+
+        cutoff = hot_window_start(after_days=older_than_days)
+        async with engine.begin() as conn:
+            dropped = await drop_empty_payment_partitions(conn, month_start(cutoff.astimezone(timezone.utc).date()))
+        print(f"Archived {total} payments in {batches} batches; dropped {len(dropped)} empty partitions")
+    finally:
+        await dispose_engines()
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--older-than-days", type=int, default=PAYMENT_ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--max-batches", type=int, default=0, help="Stop after this many batches (0 = until done)")
+    args = parser.parse_args()
+    asyncio.run(run(args.older_than_days, args.batch_size, args.max_batches))
+
+if __name__ == "__main__":
+    main()
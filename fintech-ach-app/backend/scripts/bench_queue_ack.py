@@ -0,0 +1,110 @@
+"""Measure payment queue acknowledgement cost against the number of in-flight messages.
+
+Usage:
+    python -m scripts.bench_queue_ack [--redis-url URL | --fake] [--sizes 10,1000,10000,100000] [--samples 200]
+
+For every size the queue is filled with that many in-flight messages, then
+--samples messages are enqueued, dequeued and acknowledged one by one and the
+median ack latency is reported. The same is measured for the previous
+list-scan acknowledgement (LRANGE of the processing list followed by LREM) for
+comparison. Keys are prefixed with "bench:" and deleted afterwards, but run
+it against a scratch Redis database.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+import redis.asyncio as redis
+from message_queue.redis_queue import REDIS_URL, RedisQueue
+
+async def fill_in_flight(queue: RedisQueue, count: int) -> None:
+    """Register `count` messages as in flight, the state dequeue_payment leaves them in."""
+    claimed_at = time.time()
+    for start in range(0, count, 10000):
+        async with queue.redis.pipeline(transaction=False) as pipe:
+            for i in range(start, min(start + 10000, count)):
+                message_id = f"filler{i}"
+                pipe.hset(queue.messages_hash, message_id, json.dumps({"payment_id": message_id, "payload": {}}))
+                pipe.hset(queue.inflight_hash, message_id, claimed_at)
+                pipe.zadd(queue.deadlines_zset, {message_id: claimed_at + queue.visibility_timeout})
+            await pipe.execute()
+
+async def receipt_ack_latency(queue: RedisQueue, samples: int) -> List[float]:
+    timings = []
+    for i in range(samples):
+        await queue.enqueue_payment(f"sample{i}", {})
+        message = await queue.dequeue_payment()
+        started = time.perf_counter()
+        await queue.complete_payment(message["receipt"])
+        timings.append(time.perf_counter() - started)
+    return timings
+
+async def list_scan_ack_latency(client: redis.Redis, count: int, samples: int) -> List[float]:
+    """The acknowledgement used before receipt handles: scan the processing list for the payment."""
+    processing = "bench:legacy_processing"
+    for start in range(0, count, 10000):
+        await client.lpush(processing, *[
+            json.dumps({"payment_id": f"filler{i}", "payload": {}}) for i in range(start, min(start + 10000, count))
+        ])
+    timings = []
+    for i in range(samples):
+        payment_id = f"sample{i}"
+        await client.lpush(processing, json.dumps({"payment_id": payment_id, "payload": {}}))
+        started = time.perf_counter()
+        for item in await client.lrange(processing, 0, -1):
+            if json.loads(item)["payment_id"] == payment_id:
+                await client.lrem(processing, 1, item)
+                break
+        timings.append(time.perf_counter() - started)
+    await client.delete(processing)
+    return timings
+
+def bench_queue(client: redis.Redis) -> RedisQueue:
+    queue = RedisQueue(client)
+    # Every key name (and the lane prefix) is a string attribute
+    for attribute, value in list(vars(queue).items()):
+        if isinstance(value, str):
+            setattr(queue, attribute, "bench:" + value)
+    return queue
+
+async def run(client: redis.Redis, sizes: List[int], samples: int, legacy_max: int) -> None:
+    print(f"{'in flight':>10}  {'receipt ack':>14}  {'list-scan ack':>14}")
+    try:
+        for size in sizes:
+            queue = bench_queue(client)
+            await client.delete(queue.inflight_hash, queue.deadlines_zset, queue.messages_hash)
+            await fill_in_flight(queue, size)
+            receipt = statistics.median(await receipt_ack_latency(queue, samples)) * 1e6
+
+            legacy = "skipped"
+            if size <= legacy_max:
+                # Each list-scan ack reads the whole list, so large sizes get fewer samples
+                legacy_samples = min(samples, max(5, 100000 // max(size, 1)))
+                legacy = f"{statistics.median(await list_scan_ack_latency(client, size, legacy_samples)) * 1e6:11.1f} us"
+            print(f"{size:>10,}  {receipt:11.1f} us  {legacy:>14}")
+    finally:
+        queue = bench_queue(client)
+        await client.delete(*[value for value in vars(queue).values() if isinstance(value, str)])
+        await client.aclose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument("--fake", action="store_true", help="Use an in-process fakeredis server")
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--legacy-max", type=int, default=100000, help="Largest size to run the list-scan ack at")
+    args = parser.parse_args()
+
+    if args.fake:
+        from fakeredis import FakeAsyncRedis
+        client = FakeAsyncRedis(decode_responses=True, encoding_errors="surrogateescape")
+    else:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True, encoding_errors="surrogateescape")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    asyncio.run(run(client, sizes, args.samples, args.legacy_max))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Compare the JSON and version 1 (msgpack) queue message formats.
+
+Usage:
+    python -m scripts.bench_queue_codec [--redis-url URL | --fake] [--messages 100000] [--sample 100000]
+
+Reports encode and decode throughput of --messages typical payment messages
+in each format, then stores --sample messages of each format in a Redis hash
+shaped like the queue's message hash and extrapolates its memory to one
+million queued payments. Memory comes from MEMORY USAGE; servers without it
+(--fake) report the stored body bytes instead. Keys are prefixed with
+"bench:" and deleted afterwards, but run it against a scratch Redis database.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+from uuid import uuid4
+import redis.asyncio as redis
+from redis.exceptions import ResponseError
+from message_queue.codec import decode_message, encode_message
+from message_queue.redis_queue import REDIS_URL
+
+FORMATS = ("json", "msgpack")
+
+def sample_messages(count: int) -> List[Dict[str, Any]]:
+    """Messages as the outbox relay enqueues them."""
+    messages = []
+    for _ in range(count):
+        payment_id = str(uuid4())
+        messages.append({
+            "payment_id": payment_id,
+            "payload": {
+                "payment_id": payment_id,
+                "amount": 1250.75,
+                "from_account": str(uuid4()),
+                "to_account": str(uuid4()),
+                "payment_type": "ach_debit"
+            },
+            "organization_id": str(uuid4()),
+            "priority": "standard",
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    return messages
+
+def per_second(function: Callable, items: List[Any]) -> float:
+    started = time.perf_counter()
+    for item in items:
+        function(item)
+    return len(items) / (time.perf_counter() - started)
+
+async def memory_per_million(client: redis.Redis, bodies: List[Any]) -> str:
+    key = "bench:payment_messages"
+    await client.delete(key)
+    try:
+        for start in range(0, len(bodies), 10000):
+            await client.hset(key, mapping={uuid4().hex: body for body in bodies[start:start + 10000]})
+        try:
+            used = await client.memory_usage(key, samples=0)
+            label = "MiB"
+        except ResponseError:
+            used = sum(len(body if isinstance(body, bytes) else body.encode()) for body in bodies)
+            label = "MiB of bodies"
+        return f"{used * 1_000_000 / len(bodies) / 2**20:8.1f} {label}"
+    finally:
+        await client.delete(key)
+
+async def run(client: redis.Redis, count: int, sample: int) -> None:
+    messages = sample_messages(count)
+    print(f"{'format':>8}  {'bytes/msg':>9}  {'encode/s':>10}  {'decode/s':>10}  {'per 1M queued':>20}")
+    try:
+        for message_format in FORMATS:
+            bodies = [encode_message(message, message_format=message_format) for message in messages]
+            size = sum(len(body) for body in bodies) / len(bodies)
+            encode_rate = per_second(lambda message: encode_message(message, message_format=message_format), messages)
+            decode_rate = per_second(decode_message, bodies)
+            memory = await memory_per_million(client, bodies[:sample])
+            print(f"{message_format:>8}  {size:9.1f}  {encode_rate:10,.0f}  {decode_rate:10,.0f}  {memory:>20}")
+    finally:
+        await client.aclose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument("--fake", action="store_true", help="Use an in-process fakeredis server")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=100000, help="Messages stored to measure Redis memory")
+    args = parser.parse_args()
+
+    if args.fake:
+        from fakeredis import FakeAsyncRedis
+        client = FakeAsyncRedis(decode_responses=True, encoding_errors="surrogateescape")
+    else:
+        client = redis.Redis.from_url(args.redis_url, decode_responses=True, encoding_errors="surrogateescape")
+    asyncio.run(run(client, args.messages, min(args.sample, args.messages)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Inspect and replay the payment dead letter queue.
+
+Usage:
+    python -m scripts.dlq list [filters] [--cursor ID] [--limit 50]
+    python -m scripts.dlq replay [filters | --id ID ...] [--rate 10] [--max-count N] [--dry-run]
+
+Filters: --reason TEXT (substring of the failure reason), --organization-id ID,
+--payment-type TYPE, --older-than SECONDS, --newer-than SECONDS.
+
+list prints one JSON dead letter per line, oldest first, followed by the
+cursor of the next page if there is one. replay puts the selected dead letters
+back on the queue at --rate per second with their retries reset; their attempt
+history is kept. --dry-run lists what a replay would take instead. The queue
+is the one QUEUE_BACKEND selects, as for the API.
+"""
+import argparse
+import asyncio
+import json
+from message_queue.base import QUEUE_BACKEND, create_queue
+from message_queue.dlq import (
+    DLQ_REPLAY_RATE,
+    DeadLetterFilter,
+    find_dead_letters,
+    replay_dead_letters,
+    select_dead_letters
+)
+
+def dead_letter_filter(args: argparse.Namespace) -> DeadLetterFilter:
+    return DeadLetterFilter(args.reason, args.organization_id, args.payment_type, args.older_than, args.newer_than)
+
+async def run(args: argparse.Namespace) -> None:
+    queue = create_queue(args.backend)
+    try:
+        if args.command == "list":
+            dead_letters, cursor = await find_dead_letters(queue, dead_letter_filter(args), args.cursor, args.limit)
+            for entry in dead_letters:
+                print(json.dumps(entry))
+            if cursor:
+                print(f"next cursor: {cursor}")
+        elif args.dry_run:
+            async for entry in select_dead_letters(queue, dead_letter_filter(args), args.ids, args.max_count):
+                print(json.dumps(entry))
+        else:
+            replayed = await replay_dead_letters(
+                queue, dead_letter_filter(args), args.ids, args.rate, args.max_count
+            )
+            print(f"Replayed {len(replayed)} dead letters")
+    finally:
+        await queue.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=QUEUE_BACKEND)
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list")
+    replay_parser = commands.add_parser("replay")
+    for command in (list_parser, replay_parser):
+        command.add_argument("--reason")
+        command.add_argument("--organization-id")
+        command.add_argument("--payment-type")
+        command.add_argument("--older-than", type=float, help="Seconds since dead-lettering")
+        command.add_argument("--newer-than", type=float, help="Seconds since dead-lettering")
+    list_parser.add_argument("--cursor")
+    list_parser.add_argument("--limit", type=int, default=50)
+    replay_parser.add_argument("--id", dest="ids", action="append", help="Dead letter id; repeat for several")
+    replay_parser.add_argument("--rate", type=float, default=DLQ_REPLAY_RATE, help="Replays per second")
+    replay_parser.add_argument("--max-count", type=int)
+    replay_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Move payments left in the Redis lists of the queue before lanes and receipts onto the lanes.
+
+Usage:
+    python -m scripts.migrate_legacy_queue [--redis-url URL] [--batch-size 1000]
+
+Run it once, after every worker from before receipts has stopped: the
+payment_processing list holds the messages those workers are still
+processing, and moving it earlier would deliver them twice. The pre-lane
+payment_queue and payment_handoff lists are drained in the same pass. The
+legacy lists only ever existed under the unsharded keys, so only those are
+read. Running it again moves nothing.
+"""
+import argparse
+import asyncio
+from message_queue.redis_queue import REDIS_URL, RedisQueue, create_redis_client
+
+async def run(args: argparse.Namespace) -> None:
+    queue = RedisQueue(create_redis_client(args.redis_url))
+    try:
+        moved = await queue.migrate_legacy_lists(args.batch_size)
+        print(f"Moved {moved} legacy messages onto the default lane")
+    finally:
+        await queue.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=REDIS_URL)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Messages moved per script call")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
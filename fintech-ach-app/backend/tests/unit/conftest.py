@@ -0,0 +1,62 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.dialects import postgresql
+
+@pytest.fixture(autouse=True)
+def mock_queue_worker():
+    """Unit tests exercise components directly and do not need the queue worker mock."""
+    return None
+
+@pytest_asyncio.fixture
+async def fake_redis():
+    """In-memory asyncio Redis client standing in for the shared queue connection pool."""
+    from fakeredis import FakeAsyncRedis
+    client = FakeAsyncRedis(decode_responses=True, encoding_errors="surrogateescape")
+    yield client
+    await client.flushall()
+    await client.aclose()
+
+class RecordedResult:
+    """Result of a recorded statement over canned rows."""
+
+    def __init__(self, rows):
+        self.rows = list(rows or [])
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def all(self):
+        return self.rows
+
+    def scalar(self):
+        return self.rows[0][0] if self.rows else 0
+
+    def scalar_one_or_none(self):
+        return self.rows[0][0] if self.rows else None
+
+    def scalars(self):
+        return RecordedResult([(row[0],) for row in self.rows])
+
+class RecordingSession:
+    """AsyncSession or AsyncConnection stand-in that records the Postgres SQL of each statement.
+
+    rows is either the canned rows every statement returns or a function of
+    the SQL and its parameters returning them.
+    """
+
+    def __init__(self, rows=None):
+        self.rows = rows
+        self.statements = []
+        self.params = []
+
+    async def execute(self, statement, params=None):
+        compiled = statement.compile(dialect=postgresql.dialect())
+        self.statements.append(str(compiled))
+        self.params.append({**compiled.params, **(params or {})})
+        rows = self.rows(self.statements[-1], self.params[-1]) if callable(self.rows) else self.rows
+        return RecordedResult(rows)
+
+@pytest.fixture
+def recording_session():
+    """Builds RecordingSession stand-ins for code that takes a session or connection."""
+    return RecordingSession
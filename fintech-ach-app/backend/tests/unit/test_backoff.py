@@ -0,0 +1,14 @@
+import random
+from message_queue.backoff import retry_delay
+
+def test_retry_delay_grows_exponentially_up_to_cap():
+    """Without jitter each retry doubles the delay until the cap."""
+    assert [retry_delay(n, base=2, cap=30, jitter=0) for n in range(1, 6)] == [2, 4, 8, 16, 30]
+    assert retry_delay(1000, base=2, cap=30, jitter=0) == 30
+
+def test_retry_delay_jitter_stays_within_bounds():
+    """Jitter removes at most its fraction of the delay and spreads retries out."""
+    rng = random.Random(7)
+    delays = [retry_delay(3, base=2, cap=30, jitter=0.5, rng=rng) for _ in range(200)]
+    assert all(4 <= delay <= 8 for delay in delays)
+    assert len({round(delay, 3) for delay in delays}) > 100
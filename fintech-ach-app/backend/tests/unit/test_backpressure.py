@@ -0,0 +1,109 @@
+import pytest
+from message_queue.backpressure import QueuePressure, Watermark
+from message_queue.in_process import InProcessQueue
+
+def pressure(**watermarks) -> QueuePressure:
+    return QueuePressure(
+        watermarks.get("depth", Watermark(0, 0)),
+        watermarks.get("age", Watermark(0, 0)),
+        watermarks.get("organization_depth", Watermark(0, 0)),
+        watermarks.get("organization_age", Watermark(0, 0)),
+        retry_after=15,
+        stats_ttl=0
+    )
+
+def lane_stats(depth, oldest_age=None, organizations=None):
+    return {
+        "main_queue_size": depth,
+        "lanes": {"standard": {"depth": depth, "oldest_age_seconds": oldest_age}},
+        "organizations": organizations or {}
+    }
+
+def test_watermarks_have_hysteresis():
+    """Pressure engages at the high watermark and releases only under the low one."""
+    queue_pressure = pressure(depth=Watermark(100, 50))
+    assert [queue_pressure.evaluate(lane_stats(depth))["engaged"] for depth in (99, 100, 75, 51, 50, 99)] == [
+        False, True, True, True, False, False
+    ]
+
+def test_describing_stats_leaves_the_engaged_state_alone():
+    """Reporting pressure shows the current measurements without moving the hysteresis."""
+    queue_pressure = pressure(depth=Watermark(100, 50))
+    queue_pressure.evaluate(lane_stats(100))
+    described = queue_pressure.describe(lane_stats(10, oldest_age=3))
+    assert (described["engaged"], described["depth"], described["oldest_age_seconds"]) == (True, 10, 3)
+    assert queue_pressure.engaged
+    assert queue_pressure.evaluate(lane_stats(75))["engaged"]
+
+def test_oldest_age_and_organizations_are_checked():
+    """The oldest lane's age counts globally; organizations are judged on their own depth and age."""
+    queue_pressure = pressure(age=Watermark(60, 30), organization_depth=Watermark(10, 5), organization_age=Watermark(60, 30))
+    assert queue_pressure.evaluate(lane_stats(1, oldest_age=61))["engaged"]
+
+    state = queue_pressure.evaluate(lane_stats(20, oldest_age=5, organizations={
+        "busy": {"queued": 10, "in_flight": 0, "oldest_age_seconds": 5},
+        "slow": {"queued": 1, "in_flight": 0, "oldest_age_seconds": 90},
+        "calm": {"queued": 9, "in_flight": 0, "oldest_age_seconds": None}
+    }))
+    assert not state["engaged"]
+    assert state["engaged_organizations"] == ["busy", "slow"]
+
+@pytest.mark.asyncio
+async def test_check_refuses_with_retry_after():
+    """An overloaded organization gets 429, a globally overloaded queue 503, both with Retry-After."""
+    queue = InProcessQueue()
+    queue_pressure = pressure(depth=Watermark(5, 2), organization_depth=Watermark(3, 1))
+    for i in range(3):
+        await queue.enqueue_payment(f"p{i}", {}, organization_id="busy")
+
+    assert await queue_pressure.check(queue, "quiet") is None
+    rejection = await queue_pressure.check(queue, "busy")
+    assert (rejection.status_code, rejection.retry_after) == (429, 15)
+
+    for i in range(2):
+        await queue.enqueue_payment(f"q{i}", {}, organization_id="quiet")
+    assert (await queue_pressure.check(queue, "quiet")).status_code == 503
+
+    await queue.ack_batch(message["receipt"] for message in await queue.dequeue_batch(4, max_wait=0))
+    assert await queue_pressure.check(queue, "busy") is None
+
+@pytest.mark.asyncio
+async def test_check_caches_stats_and_fails_open():
+    """Stats are read once per ttl, and an unreadable queue does not block payment creation."""
+    class BrokenQueue(InProcessQueue):
+        async def get_queue_stats(self):
+            raise ConnectionError("queue down")
+
+    assert await pressure(depth=Watermark(1, 1)).check(BrokenQueue()) is None
+
+    cached = pressure(depth=Watermark(1, 1))
+    cached.stats_ttl = 60
+    healthy = InProcessQueue()
+    assert await cached.check(healthy) is None
+    await healthy.enqueue_payment("p", {})
+    assert await cached.check(healthy) is None
+
+@pytest.mark.asyncio
+async def test_outbox_backlog_engages_global_pressure():
+    """A relay falling behind fills the outbox; its size and oldest row's age are checked and reported."""
+    backlog = {"size": 0, "oldest_age_seconds": None}
+
+    async def read_backlog():
+        return dict(backlog)
+
+    queue_pressure = pressure()
+    queue_pressure.outbox = Watermark(100, 50)
+    queue_pressure.outbox_age = Watermark(60, 30)
+    queue_pressure.outbox_backlog = read_backlog
+    queue = InProcessQueue()
+    assert await queue_pressure.check(queue, "any") is None
+
+    backlog.update(size=100, oldest_age_seconds=5)
+    assert (await queue_pressure.check(queue, "any")).status_code == 503
+    backlog.update(size=10, oldest_age_seconds=45)
+    stats = await queue_pressure.read_stats(queue)
+    assert stats["outbox"] == {"size": 10, "oldest_age_seconds": 45}
+    described = queue_pressure.evaluate(stats)
+    assert (described["engaged"], described["outbox_size"], described["outbox_oldest_age_seconds"]) == (True, 10, 45)
+    backlog.update(oldest_age_seconds=10)
+    assert await queue_pressure.check(queue, "any") is None
@@ -0,0 +1,66 @@
+import json
+from uuid import uuid4
+import pytest
+from message_queue.codec import decode_message, encode_message
+from message_queue.redis_queue import RedisQueue
+
+def payment_message(**fields):
+    payment_id = str(uuid4())
+    return {
+        "payment_id": payment_id,
+        "payload": {
+            "payment_id": payment_id,
+            "amount": 1250.5,
+            "from_account": str(uuid4()),
+            "to_account": str(uuid4()),
+            "payment_type": "ach_debit"
+        },
+        "organization_id": str(uuid4()),
+        "priority": "standard",
+        "timestamp": "2024-03-01T12:30:45.123000",
+        **fields
+    }
+
+def test_round_trip_is_smaller_than_json():
+    """Version 1 restores the message exactly, at well under half the JSON size."""
+    message = payment_message(retries=2, note="manual")
+    body = encode_message(message)
+    assert body[:1] == b"\x01"
+    assert decode_message(body) == message
+    assert len(body) * 2 < len(json.dumps(message))
+
+def test_non_uuid_ids_and_missing_fields():
+    """Ids that are not canonical UUIDs stay strings, and absent fields decode as before."""
+    message = {"payment_id": "p1", "payload": {}, "organization_id": None, "priority": None, "timestamp": None}
+    assert decode_message(encode_message(message)) == message
+    upper = payment_message(payment_id="6F9619FF-8B86-D011-B42D-00C04FC964FF")
+    assert decode_message(encode_message(upper)) == upper
+
+def test_legacy_json_and_unknown_versions():
+    """Pre-versioning JSON bodies are still read, from bytes or str; unknown versions are refused."""
+    message = payment_message()
+    assert decode_message(json.dumps(message)) == message
+    assert decode_message(encode_message(message, message_format="json").encode()) == message
+    with pytest.raises(ValueError):
+        decode_message(b"\x07abc")
+    with pytest.raises(ValueError):
+        encode_message(message, message_format="xml")
+
+@pytest.mark.asyncio
+async def test_queue_serves_legacy_and_versioned_bodies(fake_redis):
+    """A queue holding JSON bodies from before the upgrade serves them alongside binary ones."""
+    queue = RedisQueue(fake_redis)
+    legacy_id = await queue.enqueue_payment("legacy", {"amount": 1})
+    await fake_redis.hset(queue.messages_hash, legacy_id, json.dumps({
+        "payment_id": "legacy", "payload": {"amount": 1}, "organization_id": None,
+        "priority": "standard", "timestamp": "2024-03-01T12:30:45"
+    }))
+    message = payment_message()
+    await queue.enqueue_payment(message["payment_id"], message["payload"], organization_id=message["organization_id"])
+
+    legacy, current = await queue.dequeue_batch(2, max_wait=0)
+    assert legacy["payment_id"] == "legacy"
+    assert (current["payload"], current["organization_id"]) == (message["payload"], message["organization_id"])
+    await queue.retry_payment(current["receipt"], current)
+    stored = decode_message(await fake_redis.hget(queue.messages_hash, queue.message_id(current["receipt"])))
+    assert (stored["payload"], stored["retries"]) == (message["payload"], 1)
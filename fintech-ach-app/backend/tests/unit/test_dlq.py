@@ -0,0 +1,108 @@
+import json
+import time
+from datetime import datetime, timedelta
+import pytest
+from message_queue.dlq import DeadLetterFilter, ReplayJob, find_dead_letters, replay_dead_letters, select_dead_letters
+from message_queue.in_process import InProcessQueue
+from message_queue.redis_queue import RedisQueue
+
+async def dead_letter(queue, payment_id, error, organization_id="org", payment_type="ach_debit"):
+    await queue.enqueue_payment(payment_id, {"payment_type": payment_type}, organization_id=organization_id)
+    message = (await queue.dequeue_batch(1, max_wait=0))[0]
+    await queue.dead_letter_payment(message["receipt"], message, error)
+
+def test_filter_matches_reason_organization_type_and_age():
+    """Reasons match case-insensitively by substring; ages count from dead-lettering."""
+    now = datetime.utcnow()
+    entry = {
+        "error": "Insufficient funds",
+        "organization_id": "org",
+        "payload": {"payment_type": "ach_debit"},
+        "dead_lettered_at": (now - timedelta(hours=2)).isoformat()
+    }
+    assert DeadLetterFilter().matches(entry, now)
+    assert DeadLetterFilter(reason="insufficient", organization_id="org", payment_type="ach_debit").matches(entry, now)
+    assert not DeadLetterFilter(reason="not found").matches(entry, now)
+    assert not DeadLetterFilter(organization_id="other").matches(entry, now)
+    assert not DeadLetterFilter(payment_type="ach_credit").matches(entry, now)
+    assert DeadLetterFilter(older_than=3600, newer_than=3 * 3600).matches(entry, now)
+    assert not DeadLetterFilter(older_than=3 * 3600).matches(entry, now)
+    assert not DeadLetterFilter(newer_than=3600).matches(entry, now)
+
+@pytest.mark.asyncio
+async def test_filtered_pages_follow_the_cursor():
+    """Pages of matches continue where the last one stopped, even as earlier entries are replayed."""
+    queue = InProcessQueue()
+    for i in range(6):
+        await dead_letter(queue, f"p{i}", "Insufficient funds" if i % 2 else "Account not found")
+
+    only_funds = DeadLetterFilter(reason="funds")
+    first, cursor = await find_dead_letters(queue, only_funds, limit=2)
+    assert [entry["payment_id"] for entry in first] == ["p1", "p3"]
+    await queue.replay_dead_letter(first[0]["id"])
+    rest, cursor = await find_dead_letters(queue, only_funds, cursor, limit=2)
+    assert [entry["payment_id"] for entry in rest] == ["p5"]
+    assert cursor is None
+
+    # The scan limit bounds the entries read for one page, not the matches
+    page, cursor = await find_dead_letters(queue, DeadLetterFilter(reason="none"), limit=2, scan_limit=3)
+    assert page == [] and cursor is not None
+
+@pytest.mark.asyncio
+async def test_replay_is_paced_and_keeps_attempts(fake_redis):
+    """Replays go out at the given rate, up to max_count, with the failure history attached."""
+    queue = RedisQueue(fake_redis)
+    for i in range(4):
+        await dead_letter(queue, f"p{i}", "Insufficient funds", organization_id=f"org{i % 2}")
+
+    started = time.monotonic()
+    replayed = await replay_dead_letters(queue, DeadLetterFilter(organization_id="org0"), rate=20, max_count=5)
+    assert len(replayed) == 2
+    assert time.monotonic() - started >= 0.05
+    assert (await queue.get_queue_stats())["dead_letter_queue_size"] == 2
+
+    batch = await queue.dequeue_batch(10, max_wait=0)
+    assert sorted(message["payment_id"] for message in batch) == ["p0", "p2"]
+    assert all(message["attempts"][0]["error"] == "Insufficient funds" for message in batch)
+
+    assert await replay_dead_letters(queue, ids=["missing"], rate=100) == []
+
+@pytest.mark.asyncio
+async def test_ids_are_looked_up_directly_and_replayed_in_the_background():
+    """Selecting by id does not scan the queue, and a replay job reports its progress until it finishes."""
+    queue = InProcessQueue()
+    for i in range(5):
+        await dead_letter(queue, f"p{i}", "Insufficient funds")
+    dead_letters, _ = await queue.list_dead_letters(None, 10)
+    wanted = [dead_letters[4]["id"], "missing", dead_letters[3]["id"]]
+
+    async def no_scan(after, limit):
+        raise AssertionError("ids must not be found by listing")
+    queue.list_dead_letters = no_scan
+    selected = [entry async for entry in select_dead_letters(queue, ids=wanted)]
+    assert [entry["payment_id"] for entry in selected] == ["p4", "p3"]
+
+    job = ReplayJob().start(queue, None, wanted, 20, None)
+    assert job.to_dict()["status"] == "running"
+    await job.task
+    status = job.to_dict()
+    assert (status["status"], status["replayed"], status["error"]) == ("completed", [wanted[0], wanted[2]], None)
+    assert status["finished_at"]
+    assert (await queue.get_queue_stats())["dead_letter_queue_size"] == 3
+
+@pytest.mark.asyncio
+async def test_legacy_dead_letter_list_is_migrated(fake_redis):
+    """Dead letters from the list used before the index come first, oldest first, and can be replayed."""
+    queue = RedisQueue(fake_redis)
+    await fake_redis.lpush(queue.dead_letter_queue, json.dumps({"payment_id": "old1", "payload": {}, "retries": 4}))
+    await fake_redis.lpush(queue.dead_letter_queue, json.dumps({"payment_id": "old2", "payload": {}, "retries": 4}))
+    await dead_letter(queue, "new", "Account not found")
+    assert (await queue.get_queue_stats())["dead_letter_queue_size"] == 3
+
+    dead_letters, _ = await queue.list_dead_letters(None, 10)
+    assert [entry["payment_id"] for entry in dead_letters] == ["old1", "old2", "new"]
+    assert await fake_redis.llen(queue.dead_letter_queue) == 0
+
+    assert await queue.replay_dead_letter(dead_letters[0]["id"]) is True
+    message = (await queue.dequeue_batch(1, max_wait=0))[0]
+    assert (message["payment_id"], message.get("retries", 0), message["replays"]) == ("old1", 0, 1)
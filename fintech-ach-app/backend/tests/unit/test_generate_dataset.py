@@ -0,0 +1,73 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import pytest
+from scripts.generate_dataset import (
+    IN_FLIGHT_WINDOW,
+    PAYMENT_COLUMNS,
+    Dataset,
+    PaymentGenerator,
+    parse_status_mix,
+    zipf_weights
+)
+
+def make_generator(status_mix="completed=0.8,pending=0.2", hot_funding_share=0.5, days=30):
+    rng = random.Random(7)
+    dataset = Dataset(rng, organizations=20, external_accounts_per_org=4, internal_accounts=6, org_skew=1.2)
+    end = datetime(2026, 10, 1, tzinfo=timezone.utc)
+    return dataset, PaymentGenerator(
+        dataset, rng, parse_status_mix(status_mix), hot_funding_share, end - timedelta(days=days), end
+    )
+
+def test_parse_status_mix_normalizes_weights():
+    """Weights are normalized and keyed by the database enum names."""
+    assert parse_status_mix("completed=3, failed=1") == {"COMPLETED": 0.75, "FAILED": 0.25}
+    with pytest.raises(ValueError):
+        parse_status_mix("settled=1")
+
+def test_zipf_weights_skew():
+    """Skew 0 gives equal organizations; larger skew favours the first ones."""
+    assert zipf_weights(3, 0) == [1.0, 1.0, 1.0]
+    assert zipf_weights(3, 1) == [1.0, 0.5, 1 / 3]
+
+def test_every_organization_has_an_external_account():
+    """Skewed account ownership still leaves each organization with at least one account."""
+    dataset, _ = make_generator()
+    assert len(dataset.accounts_by_org) == 20
+    assert len(dataset.external_accounts) == 80
+
+def test_payment_batches_are_time_ordered_and_consistent():
+    """Rows come out in created_at order, belong to the external account's organization and respect the mix."""
+    dataset, generator = make_generator()
+    first = generator.batch(0, 2, 2000)
+    second = generator.batch(1, 2, 2000)
+    rows = first + second
+
+    assert all(len(row) == len(PAYMENT_COLUMNS) for row in rows)
+    created = [row[11] for row in rows]
+    assert created == sorted(created)
+    assert created[0] >= generator.start and created[-1] <= generator.end
+
+    org_of_account = {account[0]: account[8] for account in dataset.external_accounts}
+    for row in rows[:200]:
+        external = row[1] if row[8] == "ach_debit" else row[2]
+        assert org_of_account[external] == row[10]
+
+    # Only recent payments may still be pending
+    assert all(row[11] >= generator.end - IN_FLIGHT_WINDOW for row in rows if row[4] == "PENDING")
+
+    hot = sum(1 for row in rows if dataset.internal_accounts[0][0] in (row[1], row[2]))
+    assert hot / len(rows) > 0.5
+
+def test_generation_is_reproducible_with_a_seed():
+    """The same seed produces the same payments."""
+    _, first = make_generator()
+    _, second = make_generator()
+    assert first.batch(0, 1, 50) == second.batch(0, 1, 50)
+
+def test_status_mix_applies_to_settled_payments():
+    """Old payments follow the settled part of the status mix."""
+    _, generator = make_generator(status_mix="completed=0.5,failed=0.5", days=365)
+    statuses = Counter(row[4] for row in generator.batch(0, 1, 4000))
+    assert set(statuses) == {"COMPLETED", "FAILED"}
+    assert 0.4 < statuses["FAILED"] / 4000 < 0.6
@@ -0,0 +1,102 @@
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from sqlalchemy.dialects import postgresql
+from domain.sql_models import Payment
+from message_queue.in_process import InProcessQueue
+from message_queue.outbox import outbox_entry, relay_outbox_batch
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+class FakeEngine:
+    """Records the statements of each begin() block; the first statement returns the given rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    @asynccontextmanager
+    async def begin(self):
+        engine = self
+
+        class Connection:
+            async def execute(self, statement):
+                engine.statements.append(statement)
+                return FakeResult(engine.rows if len(engine.statements) == 1 else [])
+
+        yield Connection()
+
+def outbox_row(row_id, organization_id=None):
+    payment_uuid = uuid4()
+    return SimpleNamespace(
+        id=row_id,
+        payment_uuid=payment_uuid,
+        organization_id=organization_id,
+        payload={"payment_id": str(payment_uuid), "amount": 10.0, "payment_type": "ach_debit"}
+    )
+
+def test_outbox_entry_carries_the_queue_message():
+    """The outbox row holds what the queue message needs, so the relay does not read payments."""
+    payment = Payment(
+        uuid=uuid4(), from_account=uuid4(), to_account=uuid4(), amount=25.0,
+        payment_type="ach_credit", organization_id=uuid4()
+    )
+    entry = outbox_entry(payment)
+    assert (entry.payment_uuid, entry.organization_id) == (payment.uuid, payment.organization_id)
+    assert entry.payload == {
+        "payment_id": str(payment.uuid),
+        "amount": 25.0,
+        "from_account": str(payment.from_account),
+        "to_account": str(payment.to_account),
+        "payment_type": "ach_credit"
+    }
+
+@pytest.mark.asyncio
+async def test_relay_enqueues_and_deletes_in_one_transaction():
+    """A batch is locked with SKIP LOCKED, enqueued in order, then deleted."""
+    organization_id = uuid4()
+    rows = [outbox_row(1, organization_id), outbox_row(2)]
+    engine = FakeEngine(rows)
+    queue = InProcessQueue()
+
+    assert await relay_outbox_batch(engine, queue, batch_size=10) == 2
+    select_sql, delete_sql = (str(statement.compile(dialect=postgresql.dialect())) for statement in engine.statements)
+    assert select_sql.endswith("FOR UPDATE SKIP LOCKED")
+    assert delete_sql.startswith("DELETE FROM payment_outbox")
+
+    batch = await queue.dequeue_batch(10, max_wait=0)
+    assert [message["payment_id"] for message in batch] == [str(rows[0].payment_uuid), str(rows[1].payment_uuid)]
+    assert batch[0]["organization_id"] == str(organization_id)
+
+@pytest.mark.asyncio
+async def test_relay_enqueues_the_batch_in_one_call():
+    """The whole batch reaches the queue through one enqueue_batch call while the rows are locked."""
+    engine = FakeEngine([outbox_row(row_id) for row_id in range(1, 6)])
+    calls = []
+
+    class CountingQueue(InProcessQueue):
+        async def enqueue_batch(self, messages):
+            calls.append(len(messages))
+            return await super().enqueue_batch(messages)
+
+    assert await relay_outbox_batch(engine, CountingQueue()) == 5
+    assert calls == [5]
+
+@pytest.mark.asyncio
+async def test_relay_keeps_rows_when_enqueue_fails():
+    """If the queue is unavailable nothing is deleted, so the rows are relayed on the next pass."""
+    engine = FakeEngine([outbox_row(1)])
+
+    class BrokenQueue(InProcessQueue):
+        async def enqueue_payment(self, *args, **kwargs):
+            raise ConnectionError("queue down")
+
+    with pytest.raises(ConnectionError):
+        await relay_outbox_batch(engine, BrokenQueue())
+    assert len(engine.statements) == 1
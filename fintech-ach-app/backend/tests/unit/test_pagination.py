@@ -0,0 +1,71 @@
+import pytest
+from datetime import datetime, timezone
+from uuid import uuid4
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql
+from api.pagination import (
+    encode_cursor,
+    decode_cursor,
+    filters_fingerprint,
+    keyset_condition,
+    cursor_value,
+    parse_cursor_value,
+    fetch_page_with_total,
+    Explain
+)
+from domain.sql_models import Payment
+
+def test_cursor_round_trip():
+    """A cursor decodes back to the payload it was built from."""
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    payment_uuid = uuid4()
+    cursor = encode_cursor({"s": "created_at", "v": cursor_value(created_at), "u": cursor_value(payment_uuid)})
+
+    payload = decode_cursor(cursor)
+    assert "=" not in cursor
+    assert parse_cursor_value(payload["v"], datetime) == created_at
+    assert payload["u"] == str(payment_uuid)
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor!", encode_cursor(["list"])[:-2], "W10"])
+def test_decode_cursor_rejects_garbage(cursor):
+    """Malformed or non-object cursors raise ValueError."""
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_filters_fingerprint_depends_on_values():
+    """Cursors issued for different filters get different fingerprints."""
+    assert filters_fingerprint(status="pending") == filters_fingerprint(status="pending")
+    assert filters_fingerprint(status="pending") != filters_fingerprint(status="failed")
+
+@pytest.mark.parametrize("direction, operator", [("desc", "<"), ("asc", ">")])
+def test_keyset_condition_uses_row_comparison(direction, operator):
+    """The keyset predicate compares (sort column, uuid) as a row value."""
+    condition = keyset_condition(Payment.created_at, Payment.uuid, direction, datetime(2024, 1, 1), uuid4())
+    sql = str(select(Payment.uuid).where(condition).compile(dialect=postgresql.dialect()))
+    assert f"(payments.created_at, payments.uuid) {operator} (%(param_1)s, %(param_2)s::UUID)" in sql
+
+@pytest.mark.asyncio
+async def test_exact_count_shares_the_page_round_trip(recording_session):
+    """In exact mode the total is selected as a scalar subquery next to the page rows."""
+    session = recording_session([("payment-1", 42), ("payment-2", 42)])
+    count_query = select(func.count()).select_from(Payment).where(Payment.amount > 10)
+
+    items, total = await fetch_page_with_total(session, select(Payment).limit(3), count_query)
+
+    assert items == ["payment-1", "payment-2"]
+    assert total == 42
+    assert len(session.statements) == 1
+    assert "(SELECT count(*) AS count_1" in session.statements[0]
+
+@pytest.mark.asyncio
+async def test_exact_count_on_empty_first_page_skips_count(recording_session):
+    """An empty first page means the listing is empty, so no extra COUNT is issued."""
+    session = recording_session([])
+    items, total = await fetch_page_with_total(session, select(Payment), select(func.count()).select_from(Payment))
+    assert items == [] and total == 0
+    assert len(session.statements) == 1
+
+def test_explain_compiles_to_json_plan():
+    """Estimated counts are read from an EXPLAIN (FORMAT JSON) of the count query."""
+    sql = str(Explain(select(Payment.uuid).where(Payment.amount > 10)).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("EXPLAIN (FORMAT JSON) SELECT payments.uuid")
@@ -0,0 +1,55 @@
+import pytest
+from datetime import date
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from config.partitions import (
+    PAYMENT_DEFAULT_PARTITION,
+    add_months,
+    ensure_payment_partitions,
+    payments_are_partitioned,
+    payment_partition_ddl,
+    payment_partition_name
+)
+from domain.sql_models import Payment
+
+def test_add_months_rolls_over_the_year():
+    """Month arithmetic crosses year boundaries in both directions."""
+    assert add_months(date(2026, 11, 17), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 31), -1) == date(2025, 12, 1)
+
+def test_partition_ddl_covers_one_utc_month():
+    """Each partition holds exactly one calendar month of created_at values."""
+    ddl = payment_partition_ddl(date(2026, 12, 5))
+    assert payment_partition_name(date(2026, 12, 1)) == "payments_y2026m12"
+    assert ddl == (
+        "CREATE TABLE IF NOT EXISTS payments_y2026m12 PARTITION OF payments "
+        "FOR VALUES FROM ('2026-12-01 00:00:00+00') TO ('2027-01-01 00:00:00+00')"
+    )
+
+def test_payments_table_is_range_partitioned():
+    """The table key includes created_at while the ORM still identifies payments by uuid."""
+    ddl = str(CreateTable(Payment.__table__).compile(dialect=postgresql.dialect()))
+    assert "PRIMARY KEY (uuid, created_at)" in ddl
+    assert "PARTITION BY RANGE (created_at)" in ddl
+    assert [column.name for column in Payment.__mapper__.primary_key] == ["uuid"]
+
+@pytest.mark.asyncio
+async def test_ensure_payment_partitions_creates_only_missing_months(recording_session):
+    """Existing partitions are left alone; the default and missing future months are created."""
+    existing = {"payments_y2026m10", "payments_y2026m11"}
+    conn = recording_session(lambda sql, params: [(name,) for name in params.get("names", []) if name in existing])
+    created = await ensure_payment_partitions(conn, months_ahead=3, today=date(2026, 10, 17))
+    assert created == [PAYMENT_DEFAULT_PARTITION, "payments_y2026m12", "payments_y2027m01"]
+    assert conn.statements[1:] == [
+        f"CREATE TABLE IF NOT EXISTS {PAYMENT_DEFAULT_PARTITION} PARTITION OF payments DEFAULT",
+        payment_partition_ddl(date(2026, 12, 1)),
+        payment_partition_ddl(date(2027, 1, 1))
+    ]
+
+@pytest.mark.asyncio
+async def test_unpartitioned_payments_table_is_detected(recording_session):
+    """A payments table created before the migrations is not in pg_partitioned_table."""
+    assert await payments_are_partitioned(recording_session([(1,)])) is True
+    conn = recording_session([])
+    assert await payments_are_partitioned(conn) is False
+    assert "pg_partitioned_table" in conn.statements[0]
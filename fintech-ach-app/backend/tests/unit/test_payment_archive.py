@@ -0,0 +1,140 @@
+import os
+from datetime import date, datetime, timedelta, timezone
+from uuid import uuid4
+from archive.payment_archive import (
+    count_archive,
+    merge_with_archive,
+    read_archived_payment,
+    scan_archive,
+    sort_payments,
+    write_archive_file
+)
+from archive import payment_archive
+from domain.sql_models import PaymentStatus
+
+def make_record(organization_id, created_at, amount=100.0, status="completed"):
+    return {
+        "uuid": str(uuid4()),
+        "from_account": str(uuid4()),
+        "to_account": str(uuid4()),
+        "amount": amount,
+        "status": status,
+        "description": None,
+        "source_routing_number": "021000021",
+        "destination_routing_number": "021000021",
+        "payment_type": "ach_debit",
+        "idempotency_key": str(uuid4()),
+        "organization_id": str(organization_id),
+        "created_at": created_at,
+        "updated_at": None,
+    }
+
+def test_archive_round_trip(tmp_path):
+    """Payments written to the archive are readable by id and partitioned by organization and month."""
+    org_id = uuid4()
+    record = make_record(org_id, datetime(2026, 3, 14, 9, 30, tzinfo=timezone.utc))
+    path = write_archive_file([record], org_id, date(2026, 3, 1), root=str(tmp_path))
+
+    assert os.path.dirname(path).endswith(os.path.join(f"organization_id={org_id}", "month=2026-03"))
+    payment = read_archived_payment(path, record["uuid"])
+    assert str(payment.uuid) == record["uuid"]
+    assert payment.status == PaymentStatus.COMPLETED
+    assert payment.created_at == record["created_at"]
+    assert payment.to_dict()["archived"] is True
+
+def test_scan_archive_prunes_organizations_months_and_filters(tmp_path):
+    """Only the requested organization and date range are returned, with column filters applied."""
+    org_id, other_org_id = uuid4(), uuid4()
+    march = datetime(2026, 3, 10, tzinfo=timezone.utc)
+    april = datetime(2026, 4, 10, tzinfo=timezone.utc)
+    write_archive_file(
+        [make_record(org_id, march, amount=50.0), make_record(org_id, march, amount=500.0, status="failed")],
+        org_id, date(2026, 3, 1), root=str(tmp_path)
+    )
+    write_archive_file([make_record(org_id, april)], org_id, date(2026, 4, 1), root=str(tmp_path))
+    write_archive_file([make_record(other_org_id, march)], other_org_id, date(2026, 3, 1), root=str(tmp_path))
+
+    in_march = scan_archive(
+        organization_id=org_id,
+        start=datetime(2026, 3, 1, tzinfo=timezone.utc),
+        end=datetime(2026, 4, 1, tzinfo=timezone.utc),
+        root=str(tmp_path)
+    )
+    assert sorted(payment.amount for payment in in_march) == [50.0, 500.0]
+
+    failed = scan_archive(organization_id=org_id, status=PaymentStatus.FAILED, min_amount=100, root=str(tmp_path))
+    assert [payment.amount for payment in failed] == [500.0]
+    assert len(scan_archive(root=str(tmp_path))) == 4
+    assert scan_archive(organization_id=uuid4(), root=str(tmp_path)) == []
+
+def test_merge_orders_like_the_database(tmp_path):
+    """Hot and archived payments merge into one created_at DESC, uuid DESC ordering without duplicates."""
+    org_id = uuid4()
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    path = write_archive_file(
+        [make_record(org_id, base + timedelta(days=day)) for day in (1, 3)], org_id, date(2026, 3, 1), root=str(tmp_path)
+    )
+    archived = scan_archive(root=str(tmp_path))
+    hot = [read_archived_payment(path, archived[0].uuid)]
+    hot[0].created_at = base + timedelta(days=2)
+
+    merged = merge_with_archive(hot, archived, "created_at", "desc")
+    assert [payment.created_at.day for payment in merged] == [4, 3]
+    assert len(merged) == 2
+
+def test_sort_and_cursor_follow_enum_declaration_order(tmp_path):
+    """Statuses sort as Postgres sorts the enum, and the archive's cursor agrees with that order."""
+    org_id = uuid4()
+    created_at = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    write_archive_file(
+        [make_record(org_id, created_at, status=status) for status in ("failed", "pending", "completed")],
+        org_id, date(2026, 3, 1), root=str(tmp_path)
+    )
+    ordered = sort_payments(scan_archive(root=str(tmp_path)), "status", "asc")
+    assert [payment.status.value for payment in ordered] == ["pending", "completed", "failed"]
+    pushed_down = scan_archive(sort_key="status", direction="asc", root=str(tmp_path))
+    assert [payment.uuid for payment in pushed_down] == [payment.uuid for payment in ordered]
+
+    first = ordered[0]
+    remaining = scan_archive(sort_key="status", direction="asc", after=(first.status, first.uuid), root=str(tmp_path))
+    assert [payment.uuid for payment in remaining] == [payment.uuid for payment in ordered[1:]]
+
+def test_scan_archive_pages_in_listing_order(tmp_path):
+    """Sorting, the keyset cursor and the limit are applied to the archive scan itself."""
+    org_id = uuid4()
+    base = datetime(2026, 3, 1, tzinfo=timezone.utc)
+    write_archive_file(
+        [make_record(org_id, base + timedelta(days=day // 2)) for day in range(10)],
+        org_id, date(2026, 3, 1), root=str(tmp_path)
+    )
+    expected = [payment.uuid for payment in sort_payments(scan_archive(root=str(tmp_path)), "created_at", "desc")]
+
+    first = scan_archive(sort_key="created_at", direction="desc", limit=3, root=str(tmp_path))
+    assert [payment.uuid for payment in first] == expected[:3]
+    last = first[-1]
+    rest = scan_archive(
+        sort_key="created_at", direction="desc", after=(last.created_at, last.uuid), limit=4, root=str(tmp_path)
+    )
+    assert [payment.uuid for payment in rest] == expected[3:7]
+    assert count_archive(root=str(tmp_path)) == 10
+
+def test_created_at_pages_read_only_the_months_they_need(tmp_path, monkeypatch):
+    """A newest-first page filled by the latest month leaves the older months unread; counts use the footers."""
+    org_id = uuid4()
+    for month in (1, 2, 3):
+        write_archive_file(
+            [make_record(org_id, datetime(2026, month, day, tzinfo=timezone.utc), amount=day) for day in (1, 2, 3)],
+            org_id, date(2026, month, 1), root=str(tmp_path)
+        )
+    read = []
+    read_table = payment_archive.pq.read_table
+    monkeypatch.setattr(payment_archive.pq, "read_table", lambda files, **kw: read.append(files) or read_table(files, **kw))
+
+    page = scan_archive(sort_key="created_at", direction="desc", limit=2, root=str(tmp_path))
+    assert [payment.created_at.month for payment in page] == [3, 3]
+    assert len(read) == 1 and all("month=2026-03" in path for path in read[0])
+
+    assert count_archive(root=str(tmp_path)) == 9
+    assert count_archive(min_amount=3, root=str(tmp_path)) == 3
+    assert count_archive(start=datetime(2026, 2, 2, tzinfo=timezone.utc), root=str(tmp_path)) == 5
+    assert read == [read[0]]
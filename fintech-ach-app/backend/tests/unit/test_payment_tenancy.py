@@ -0,0 +1,78 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from fastapi import HTTPException
+from api import payments
+from api.payments import get_payment, list_payments
+from auth.roles import Role
+from domain.sql_models import Payment
+
+def test_organization_index_leads_with_organization_id():
+    """Tenant listings are served by an (organization_id, created_at, uuid) index."""
+    index = next(index for index in Payment.__table__.indexes if index.name == "ix_payments_organization_created_at")
+    assert [column.name for column in index.columns] == ["organization_id", "created_at", "uuid"]
+
+def admin(organization_id):
+    return SimpleNamespace(role=Role.ORGANIZATION_ADMIN.value, organization_id=organization_id, email="admin@example.com")
+
+async def listing(session, user):
+    # Today's date keeps the listing inside the hot window, so only the database is read
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    return await list_payments(
+        session=session, status=None, startDate=today, endDate=None, minAmount=None, maxAmount=None,
+        sort_by=None, sort_direction=None, limit=10, offset=0, cursor=None, count="exact",
+        includeArchived=False, user=user
+    )
+
+@pytest.mark.asyncio
+async def test_listing_is_scoped_by_the_payment_organization(recording_session):
+    """An organization admin's listing filters on payments.organization_id, with no account lookups or IN lists."""
+    organization_id = uuid4()
+    session = recording_session([])
+    assert (await listing(session, admin(organization_id)))["payments"] == []
+
+    assert len(session.statements) == 1
+    assert "payments.organization_id = %(organization_id_1)s::UUID" in session.statements[0]
+    assert " IN " not in session.statements[0]
+    assert session.params[0]["organization_id_1"] == organization_id
+
+    superuser = SimpleNamespace(role=Role.SUPERUSER.value, organization_id=None, email="root@example.com")
+    await listing(session, superuser)
+    assert "payments.organization_id =" not in session.statements[1]
+
+    with pytest.raises(HTTPException) as error:
+        await listing(session, admin(None))
+    assert error.value.status_code == 403
+
+@pytest.mark.asyncio
+async def test_other_organizations_payments_are_not_found(recording_session):
+    """Looking up a payment as an organization admin scopes both the hot table and the archive index."""
+    organization_id = uuid4()
+    session = recording_session([])
+    with pytest.raises(HTTPException) as error:
+        await get_payment(request=None, payment_id=uuid4(), user=admin(organization_id), session=session)
+    assert error.value.status_code == 404
+
+    hot, archived = session.statements
+    assert "payments.organization_id = %(organization_id_1)s::UUID" in hot
+    assert "payment_archive_index.organization_id = %(organization_id_1)s::UUID" in archived
+    assert [params["organization_id_1"] for params in session.params] == [organization_id, organization_id]
+
+@pytest.mark.asyncio
+async def test_default_listing_leaves_the_archive_alone(recording_session, monkeypatch):
+    """Only includeArchived or a startDate before the hot window reads the archive."""
+    scans = []
+    monkeypatch.setattr(payments, "scan_archive", lambda **kwargs: scans.append(kwargs) or [])
+    monkeypatch.setattr(payments, "count_archive", lambda **kwargs: 0)
+    superuser = SimpleNamespace(role=Role.SUPERUSER.value, organization_id=None, email="root@example.com")
+    arguments = dict(
+        session=recording_session([]), status=None, endDate=None, minAmount=None, maxAmount=None,
+        sort_by=None, sort_direction=None, limit=10, offset=0, cursor=None, count="exact", user=superuser
+    )
+
+    await list_payments(startDate=None, includeArchived=False, **arguments)
+    assert scans == []
+    await list_payments(startDate=None, includeArchived=True, **arguments)
+    await list_payments(startDate="2000-01-01", includeArchived=False, **arguments)
+    assert [scan["start"] for scan in scans] == [None, datetime(2000, 1, 1, tzinfo=timezone.utc)]
@@ -0,0 +1,42 @@
+import pytest
+from unittest.mock import MagicMock
+from config.pool_metrics import PoolMetrics, InstrumentedAsyncQueuePool
+
+@pytest.fixture
+def pool():
+    """Create an instrumented pool backed by mock DBAPI connections."""
+    pool = InstrumentedAsyncQueuePool(creator=MagicMock, pool_size=2, max_overflow=1)
+    pool.metrics = PoolMetrics()
+    yield pool
+    pool.dispose()
+
+def test_checkout_records_wait_time(pool):
+    """Every checkout reports its wait time to the metrics collector."""
+    connection = pool.connect()
+    connection.close()
+    pool.connect().close()
+
+    stats = pool.metrics.snapshot(pool)
+    assert stats["wait"]["count"] == 2
+    assert stats["wait"]["timeouts_total"] == 0
+    assert stats["pool_class"] == "InstrumentedAsyncQueuePool"
+    assert stats["size"] == 2
+
+def test_recreate_keeps_metrics(pool):
+    """A recreated pool keeps reporting to the same metrics collector."""
+    assert pool.recreate().metrics is pool.metrics
+
+def test_snapshot_reports_overflow_and_connect_rate(pool):
+    """Overflow and connects per second are derived from live pool state."""
+    pool.metrics.window_seconds = 1
+    for _ in range(3):
+        pool.metrics._on_connect(None, None)
+    connections = [pool.connect() for _ in range(3)]
+
+    stats = pool.metrics.snapshot(pool)
+    assert stats["overflow"] == 1
+    assert stats["connects_total"] == 3
+    assert stats["connects_per_second"] == 3.0
+
+    for connection in connections:
+        connection.close()
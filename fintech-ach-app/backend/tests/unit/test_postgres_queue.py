@@ -0,0 +1,107 @@
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import Select
+from message_queue import postgres_queue
+from message_queue.postgres_queue import PostgresQueue
+
+class SweepEngine:
+    """Hands out the given batches of stale rows, one per begin() block, and records every statement."""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.statements = []
+
+    @asynccontextmanager
+    async def begin(self):
+        engine = self
+
+        class Connection:
+            async def execute(self, statement):
+                engine.statements.append(statement)
+                rows = engine.batches.pop(0) if isinstance(statement, Select) else []
+                return SimpleNamespace(all=lambda: rows, rowcount=1)
+
+        yield Connection()
+
+def stale_row(row_id, retries=0):
+    return SimpleNamespace(id=row_id, body={"payment_id": f"p{row_id}", "payload": {}}, retries=retries)
+
+@pytest.mark.asyncio
+async def test_sweep_takes_bounded_batches_and_backs_off(monkeypatch):
+    """Stale rows are swept a LIMITed batch per transaction and requeued after retry_delay, not at once."""
+    monkeypatch.setattr(postgres_queue, "QUEUE_SWEEP_BATCH_SIZE", 2)
+    monkeypatch.setattr(postgres_queue, "retry_delay", lambda retry_count: 60 * retry_count)
+    engine = SweepEngine([[stale_row(1), stale_row(2, retries=1)], [stale_row(3)]])
+    queue = PostgresQueue(engine)
+    queue.visibility_timeout = 90
+
+    before = datetime.now(timezone.utc)
+    await queue.cleanup_stale_processing()
+    selects = [statement for statement in engine.statements if isinstance(statement, Select)]
+    updates = [statement.compile().params for statement in engine.statements if not isinstance(statement, Select)]
+    assert len(selects) == 2
+    sql = str(selects[0].compile(dialect=postgresql.dialect()))
+    assert "LIMIT" in sql and sql.endswith("FOR UPDATE SKIP LOCKED")
+    assert selects[0].compile().params["now_1"] == timedelta(seconds=90)
+
+    assert [params["retries"] for params in updates] == [1, 2, 1]
+    delays = [(params["available_at"] - before).total_seconds() for params in updates]
+    assert [round(delay / 60) for delay in delays] == [1, 2, 1]
+
+class FakeDriver:
+    def __init__(self):
+        self.closed = False
+        self.listeners = []
+
+    def is_closed(self):
+        return self.closed
+
+    async def add_listener(self, channel, callback):
+        self.listeners.append(channel)
+
+class FakeConnection:
+    def __init__(self):
+        self.driver = FakeDriver()
+        self.invalidated = False
+
+    async def get_raw_connection(self):
+        return SimpleNamespace(driver_connection=self.driver)
+
+    async def invalidate(self):
+        self.invalidated = True
+
+    async def close(self):
+        pass
+
+class ListenEngine:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.connections = []
+
+    async def connect(self):
+        if self.fail:
+            raise ConnectionError("database unavailable")
+        self.connections.append(FakeConnection())
+        return self.connections[-1]
+
+@pytest.mark.asyncio
+async def test_dropped_listen_connection_is_replaced():
+    """A LISTEN connection that died is invalidated and a new one subscribed; without one the queue polls."""
+    engine = ListenEngine()
+    queue = PostgresQueue(engine)
+    assert await queue._listen() is True
+    assert await queue._listen() is True
+    assert len(engine.connections) == 1
+
+    engine.connections[0].driver.closed = True
+    assert await queue._listen() is True
+    assert engine.connections[0].invalidated
+    assert len(engine.connections) == 2
+    assert engine.connections[1].driver.listeners == [postgres_queue.NOTIFY_CHANNEL]
+
+    engine.connections[1].driver.closed = True
+    engine.fail = True
+    assert await queue._listen() is False
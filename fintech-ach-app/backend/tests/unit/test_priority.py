@@ -0,0 +1,16 @@
+from message_queue.priority import assign_priority, parse_lane_settings
+
+def test_assign_priority_rules_in_order():
+    """Same-day type wins over amount, amount over bulk organization; anything else is standard."""
+    rules = {
+        "same_day_payment_types": frozenset({"same_day_ach_debit"}),
+        "high_value_amount": 1000,
+        "bulk_organizations": frozenset({"org-bulk"})
+    }
+    assert assign_priority("same_day_ach_debit", 5000, "org-bulk", **rules) == "same_day"
+    assert assign_priority("ach_debit", 1000, "org-bulk", **rules) == "high_value"
+    assert assign_priority("ach_credit", 999.99, "org-bulk", **rules) == "bulk"
+    assert assign_priority("ach_credit", None, None, **rules) == "standard"
+
+def test_parse_lane_settings_ignores_unknown_lanes():
+    assert parse_lane_settings("bulk:2, same_day:10,express:5,standard:") == {"bulk": 2.0, "same_day": 10.0}
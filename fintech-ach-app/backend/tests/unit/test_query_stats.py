@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from config.query_stats import fingerprint, instrument_engine, track_queries, query_budget
+
+@pytest.fixture
+def engine():
+    """Create an instrumented in-memory SQLite engine with a small table."""
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE accounts (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO accounts (id, name) VALUES (1, 'a'), (2, 'b'), (3, 'c')"))
+    yield engine
+    engine.dispose()
+
+def test_fingerprint_ignores_values():
+    """Statements differing only in literal or bound values share a fingerprint."""
+    assert fingerprint("SELECT * FROM payments WHERE uuid = $1") == fingerprint(
+        "SELECT *  FROM payments\n WHERE uuid = 'abc'"
+    )
+    assert fingerprint("SELECT 1 FROM t WHERE id IN ($1, $2, $3)") == "SELECT ? FROM t WHERE id IN (?)"
+    assert fingerprint("SELECT x::text FROM t LIMIT 10") == "SELECT x::text FROM t LIMIT ?"
+
+def test_track_queries_counts_statements(engine):
+    """Statements executed inside the block are counted and timed."""
+    with track_queries("req-1") as stats:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT name FROM accounts WHERE id = :id"), {"id": 1})
+            conn.execute(text("SELECT count(*) FROM accounts"))
+
+    assert stats.request_id == "req-1"
+    assert stats.statements == 2
+    assert stats.total_time > 0
+    assert stats.summary()["db_repeated_statements"] == {}
+
+def test_failed_statements_are_recorded_and_leave_no_start_time(engine):
+    """A statement that raises is still counted, and its start time is not left on the connection."""
+    with track_queries("req-2") as stats:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT missing FROM accounts"))
+            assert conn.info["query_start_time"] == []
+            conn.execute(text("SELECT count(*) FROM accounts"))
+    assert stats.statements == 4
+
+def test_query_budget_fails_on_repeated_statement(engine):
+    """Running the same statement once per row trips the N+1 detector."""
+    with pytest.raises(AssertionError, match="repeated 3 times"):
+        with query_budget(max_repeats=2):
+            with engine.connect() as conn:
+                for account_id in (1, 2, 3):
+                    conn.execute(text("SELECT name FROM accounts WHERE id = :id"), {"id": account_id})
+
+def test_query_budget_fails_when_over_budget(engine):
+    """Exceeding the statement budget fails even without repeats."""
+    with pytest.raises(AssertionError, match="2 statements executed, budget is 1"):
+        with query_budget(max_queries=1):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT count(*) FROM accounts"))
+                conn.execute(text("SELECT max(id) FROM accounts"))
+
+def test_query_budget_passes_within_limits(engine):
+    """A block within its budget passes and exposes its stats."""
+    with query_budget(max_queries=2) as stats:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT name FROM accounts WHERE id IN (1, 2, 3)"))
+    assert stats.statements == 1
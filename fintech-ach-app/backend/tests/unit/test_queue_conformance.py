@@ -0,0 +1,241 @@
+"""Contract every payment queue backend must honour, plus a throughput smoke test.
+
+The Redis backends run against fakeredis, alone and sharded, and the
+in-process one as is. The Postgres backend runs when QUEUE_TEST_DATABASE_URL
+points at a scratch database (its payment_queue_messages table is created
+and emptied).
+"""
+import asyncio
+import os
+import time
+import pytest
+import pytest_asyncio
+from message_queue import in_process, postgres_queue, redis_queue, redis_streams
+from message_queue.base import PaymentQueue, create_queue
+from message_queue.in_process import InProcessQueue
+from message_queue.redis_queue import RedisQueue
+from message_queue.redis_streams import RedisStreamQueue
+from message_queue.sharded import ShardedQueue, shard_namespace
+
+QUEUE_TEST_DATABASE_URL = os.getenv("QUEUE_TEST_DATABASE_URL")
+
+@pytest_asyncio.fixture(params=["list", "streams", "memory", "sharded", "postgres"])
+async def queue(request, fake_redis, monkeypatch):
+    """Each backend in turn, with retries due immediately."""
+    for module in (redis_queue, redis_streams, in_process, postgres_queue):
+        monkeypatch.setattr(module, "retry_delay", lambda retry_count: 0)
+
+    if request.param == "list":
+        yield RedisQueue(fake_redis)
+    elif request.param == "streams":
+        yield RedisStreamQueue(fake_redis, consumer="conformance")
+    elif request.param == "memory":
+        yield InProcessQueue()
+    elif request.param == "sharded":
+        yield ShardedQueue([RedisQueue(fake_redis, namespace=shard_namespace(index)) for index in range(3)])
+    else:
+        if not QUEUE_TEST_DATABASE_URL:
+            pytest.skip("QUEUE_TEST_DATABASE_URL is not set")
+        from sqlalchemy import delete
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from domain.sql_models import PaymentQueueMessage
+        engine = create_async_engine(QUEUE_TEST_DATABASE_URL)
+        async with engine.begin() as conn:
+            await conn.run_sync(PaymentQueueMessage.__table__.create, checkfirst=True)
+            await conn.execute(delete(PaymentQueueMessage))
+        queue = postgres_queue.PostgresQueue(engine)
+        yield queue
+        await queue.close()
+        await engine.dispose()
+
+async def dequeue_all(queue: PaymentQueue, n: int = 100):
+    return await queue.dequeue_batch(n, max_wait=0)
+
+def test_backend_is_selected_by_configuration():
+    """QUEUE_BACKEND picks the implementation."""
+    assert type(create_queue("list")) is RedisQueue
+    assert type(create_queue("redis")) is RedisQueue
+    assert isinstance(create_queue("streams"), RedisStreamQueue)
+    assert isinstance(create_queue("memory"), InProcessQueue)
+    with pytest.raises(ValueError):
+        create_queue("kafka")
+
+@pytest.mark.asyncio
+async def test_dequeue_ack_in_fifo_order(queue):
+    """Messages of one lane come out in enqueue order and are gone once acknowledged."""
+    if isinstance(queue, ShardedQueue):
+        pytest.skip("Sharded queues keep enqueue order within a shard only")
+    for i in range(5):
+        await queue.enqueue_payment(f"p{i}", {"amount": i})
+    assert (await queue.get_queue_stats())["main_queue_size"] == 5
+
+    batch = await dequeue_all(queue, 3)
+    assert [message["payment_id"] for message in batch] == ["p0", "p1", "p2"]
+    assert batch[0]["payload"] == {"amount": 0}
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (2, 3)
+
+    await queue.ack_batch(message["receipt"] for message in batch)
+    await queue.complete_payment((await queue.dequeue_payment())["receipt"])
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (1, 0)
+
+@pytest.mark.asyncio
+async def test_enqueue_batch_adds_every_message(queue):
+    """A batch enqueue returns one id per message and the messages come out like single enqueues."""
+    message_ids = await queue.enqueue_batch([
+        {"payment_id": f"p{i}", "payload": {"amount": i}, "organization_id": f"org{i % 2}"} for i in range(6)
+    ])
+    assert len(set(message_ids)) == 6
+    assert await queue.enqueue_batch([]) == []
+
+    batch = await dequeue_all(queue)
+    assert sorted((message["payment_id"], message["payload"]["amount"]) for message in batch) == [
+        (f"p{i}", i) for i in range(6)
+    ]
+    assert {message["organization_id"] for message in batch} == {"org0", "org1"}
+
+@pytest.mark.asyncio
+async def test_empty_dequeue_waits_up_to_max_wait(queue):
+    """An empty queue returns nothing once max_wait has passed (fakeredis does not block XREADGROUP)."""
+    started = time.monotonic()
+    assert await queue.dequeue_batch(10, max_wait=0.2) == []
+    assert time.monotonic() - started < 2
+
+@pytest.mark.asyncio
+async def test_waiting_consumer_wakes_on_enqueue(queue):
+    """A consumer blocked on an empty queue gets a message enqueued while it waits."""
+    if isinstance(queue, RedisStreamQueue):
+        pytest.skip("fakeredis does not block XREADGROUP")
+
+    async def enqueue_later():
+        await asyncio.sleep(0.05)
+        await queue.enqueue_payment("late", {})
+
+    started = time.monotonic()
+    batch, _ = await asyncio.gather(queue.dequeue_batch(10, max_wait=3), enqueue_later())
+    assert [message["payment_id"] for message in batch] == ["late"]
+    assert time.monotonic() - started < 2
+
+@pytest.mark.asyncio
+async def test_retry_then_dead_letter(queue):
+    """A failed message comes back with its retry count until max_retries, then is dead-lettered."""
+    await queue.enqueue_payment("p1", {})
+    for attempt in range(queue.max_retries):
+        message = (await dequeue_all(queue))[0]
+        assert message.get("retries", 0) == attempt
+        assert await queue.retry_payment(message["receipt"], message) is True
+        await queue.promote_due_retries(100)
+    message = (await dequeue_all(queue))[0]
+    assert message["retries"] == queue.max_retries
+    assert await queue.retry_payment(message["receipt"], message) is False
+
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"], stats["dead_letter_queue_size"]) == (0, 0, 1)
+    assert await dequeue_all(queue) == []
+
+@pytest.mark.asyncio
+async def test_dead_letter_is_listed_and_replayed(queue):
+    """A dead letter carries its failures and goes back on the queue once, with retries reset."""
+    await queue.enqueue_payment("p1", {"amount": 1}, organization_id="org")
+    message = (await dequeue_all(queue))[0]
+    await queue.dead_letter_payment(message["receipt"], message, "Insufficient funds")
+
+    dead_letters, cursor = await queue.list_dead_letters(None, 10)
+    assert cursor is None
+    assert [(entry["payment_id"], entry["error"]) for entry in dead_letters] == [("p1", "Insufficient funds")]
+    assert [attempt["error"] for attempt in dead_letters[0]["attempts"]] == ["Insufficient funds"]
+    assert await queue.get_dead_letter(dead_letters[0]["id"]) == dead_letters[0]
+
+    assert await queue.replay_dead_letter(dead_letters[0]["id"]) is True
+    assert await queue.replay_dead_letter(dead_letters[0]["id"]) is False
+    assert await queue.get_dead_letter(dead_letters[0]["id"]) is None
+    assert (await queue.get_queue_stats())["dead_letter_queue_size"] == 0
+    replayed = (await dequeue_all(queue))[0]
+    assert (replayed["payment_id"], replayed["payload"], replayed.get("retries", 0)) == ("p1", {"amount": 1}, 0)
+    assert (replayed["replays"], len(replayed["attempts"])) == (1, 1)
+
+@pytest.mark.asyncio
+async def test_abandoned_message_is_handed_out_again(queue):
+    """A claimed message that is never settled is delivered again."""
+    if isinstance(queue, RedisStreamQueue):
+        queue.claim_idle_ms = 0
+    await queue.enqueue_payment("p1", {})
+    abandoned = (await dequeue_all(queue))[0]
+
+    await queue.cleanup_stale_processing(timeout_minutes=-1)
+    await queue.promote_due_retries(100)
+    redelivered = await dequeue_all(queue)
+    assert [message["payment_id"] for message in redelivered] == ["p1"]
+    assert redelivered[0]["retries"] == 1
+    await queue.ack_batch([redelivered[0]["receipt"]])
+    assert (await queue.get_queue_stats())["processing_queue_size"] == 0
+    assert abandoned["payment_id"] == "p1"
+
+@pytest.mark.asyncio
+async def test_recovered_claim_cannot_be_settled_by_its_old_worker(queue):
+    """Once the sweep hands a message out again, the first claim's receipt no longer acts on it."""
+    if isinstance(queue, RedisStreamQueue):
+        pytest.skip("Streams fence by consumer (test_redis_streams)")
+    await queue.enqueue_payment("p1", {})
+    stale = (await dequeue_all(queue))[0]
+    await queue.cleanup_stale_processing(timeout_minutes=-1)
+    await queue.promote_due_retries(100)
+    current = (await dequeue_all(queue))[0]
+
+    await queue.ack_batch([stale["receipt"]])
+    assert await queue.retry_payment(stale["receipt"], stale) is False
+    await queue.dead_letter_payment(stale["receipt"], stale, "Too slow")
+    stats = await queue.get_queue_stats()
+    assert (stats["processing_queue_size"], stats["dead_letter_queue_size"]) == (1, 0)
+    await queue.ack_batch([current["receipt"]])
+    assert (await queue.get_queue_stats())["processing_queue_size"] == 0
+
+@pytest.mark.asyncio
+async def test_stale_ack_leaves_the_scheduled_retry_alone(queue):
+    """An old worker acknowledging after the sweep scheduled a retry does not drop the retry."""
+    if isinstance(queue, RedisStreamQueue):
+        pytest.skip("Streams fence by consumer (test_redis_streams)")
+    await queue.enqueue_payment("p1", {})
+    stale = (await dequeue_all(queue))[0]
+    await queue.cleanup_stale_processing(timeout_minutes=-1)
+    await queue.ack_batch([stale["receipt"]])
+    assert await queue.retry_payment(stale["receipt"], stale) is False
+
+    await queue.promote_due_retries(100)
+    assert [message["payment_id"] for message in await dequeue_all(queue)] == ["p1"]
+
+@pytest.mark.asyncio
+async def test_sweep_dead_letters_carry_their_reason(queue):
+    """A message the sweep dead-letters after its last retry has the expired claim as its failure."""
+    if isinstance(queue, RedisStreamQueue):
+        pytest.skip("Streams dead-letter by delivery count on reclaim")
+    await queue.enqueue_payment("p1", {})
+    for _ in range(queue.max_retries + 1):
+        assert len(await dequeue_all(queue)) == 1
+        await queue.cleanup_stale_processing(timeout_minutes=-1)
+        await queue.promote_due_retries(100)
+
+    dead_letters, _ = await queue.list_dead_letters(None, 10)
+    assert [entry["error"] for entry in dead_letters] == ["Visibility timeout expired"]
+    assert dead_letters[0]["dead_lettered_at"]
+    assert len(dead_letters[0]["attempts"]) == queue.max_retries + 1
+
+@pytest.mark.asyncio
+async def test_throughput(queue):
+    """Enqueue, batch-dequeue and ack a thousand messages; reports the rate."""
+    count = 1000
+    started = time.perf_counter()
+    for i in range(count):
+        await queue.enqueue_payment(f"p{i}", {})
+    processed = 0
+    while processed < count:
+        batch = await queue.dequeue_batch(50, max_wait=0)
+        assert batch
+        await queue.ack_batch(message["receipt"] for message in batch)
+        processed += len(batch)
+    elapsed = time.perf_counter() - started
+
+    print(f"{type(queue).__name__}: {count / elapsed:,.0f} messages/s")
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (0, 0)
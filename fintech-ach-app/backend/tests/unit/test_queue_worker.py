@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from domain.sql_models import ExternalOrganizationBankAccount, InternalOrganizationBankAccount, Payment, PaymentStatus
+from message_queue import queue_worker
+from message_queue.in_process import InProcessQueue
+
+class FakeSession:
+    """Session over a dict of objects by (model, id) whose first failing_commits commits raise.
+
+    A rollback puts the objects back to their state at the last successful commit.
+    """
+
+    def __init__(self, objects, failing_commits=0):
+        self.objects = objects
+        self.failing_commits = failing_commits
+        self.calls = []
+        self.committed = {key: dict(vars(obj)) for key, obj in objects.items()}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def get(self, model, key, **options):
+        self.calls.append(("get", model, options))
+        return self.objects.get((model, str(key)))
+
+    async def commit(self):
+        self.calls.append(("commit",))
+        if self.failing_commits:
+            self.failing_commits -= 1
+            raise RuntimeError("could not serialize access")
+        self.committed = {key: dict(vars(obj)) for key, obj in self.objects.items()}
+
+    async def rollback(self):
+        self.calls.append(("rollback",))
+        for key, state in self.committed.items():
+            vars(self.objects[key]).update(state)
+
+def payment(balance=100):
+    source = SimpleNamespace(balance=balance)
+    target = SimpleNamespace(balance=0)
+    row = SimpleNamespace(
+        uuid=uuid4(), from_account=uuid4(), to_account=uuid4(), amount=50, status=PaymentStatus.PENDING
+    )
+    return row, {
+        (Payment, str(row.uuid)): row,
+        (ExternalOrganizationBankAccount, str(row.from_account)): source,
+        (InternalOrganizationBankAccount, str(row.to_account)): target
+    }
+
+@pytest.mark.asyncio
+async def test_accounts_are_locked_and_reread():
+    """Balances come from a fresh SELECT ... FOR UPDATE, not the session's cached objects."""
+    row, objects = payment()
+    session = FakeSession(objects)
+    assert await queue_worker.process_payment(row, session) is None
+    gets = [call[2] for call in session.calls if call[0] == "get"]
+    assert gets == [{"with_for_update": True, "populate_existing": True}] * 2
+    assert row.status == PaymentStatus.COMPLETED
+
+@pytest.mark.asyncio
+async def test_failed_commit_rolls_back_and_completed_payments_are_acked(monkeypatch):
+    """Each payment has its own session; a failed commit is rolled back and earlier successes still acked."""
+    queue = InProcessQueue()
+    rows, objects = [], {}
+    for _ in range(2):
+        row, row_objects = payment()
+        rows.append(row)
+        objects.update(row_objects)
+        await queue.enqueue_payment(str(row.uuid), {})
+    sessions = []
+
+    def new_session():
+        # The second payment's first commit fails
+        sessions.append(FakeSession(objects, failing_commits=1 if len(sessions) == 1 else 0))
+        return sessions[-1]
+
+    monkeypatch.setattr(queue_worker, "async_session", new_session)
+    await queue_worker.process_payment_batch(queue, await queue.dequeue_batch(2, max_wait=0))
+
+    assert len(sessions) == 2
+    assert ("rollback",) in sessions[1].calls
+    assert [row.status for row in rows] == [PaymentStatus.COMPLETED, PaymentStatus.FAILED]
+    stats = await queue.get_queue_stats()
+    assert (stats["processing_queue_size"], stats["scheduled_retry_size"]) == (0, 1)
+
+@pytest.mark.asyncio
+async def test_payment_is_locked_before_its_status_is_checked(monkeypatch):
+    """A redelivered payment is read under lock, and one found completed is acked without moving money."""
+    queue = InProcessQueue()
+    row, objects = payment()
+    row.status = PaymentStatus.COMPLETED
+    await queue.enqueue_payment(str(row.uuid), {})
+    session = FakeSession(objects)
+    monkeypatch.setattr(queue_worker, "async_session", lambda: session)
+
+    await queue_worker.process_payment_batch(queue, await queue.dequeue_batch(1, max_wait=0))
+    assert session.calls == [("get", Payment, {"with_for_update": True, "populate_existing": True})]
+    assert objects[(ExternalOrganizationBankAccount, str(row.from_account))].balance == 100
+    assert (await queue.get_queue_stats())["processing_queue_size"] == 0
@@ -0,0 +1,291 @@
+import json
+import time
+import pytest
+from message_queue import redis_queue
+from message_queue.base import close_queue, get_queue, init_queue
+from message_queue.redis_queue import RedisQueue
+
+@pytest.mark.asyncio
+async def test_enqueue_dequeue_complete(fake_redis):
+    """A payment moves from the main queue to in flight and is removed on completion."""
+    queue = RedisQueue(fake_redis)
+    message_id = await queue.enqueue_payment("p1", {"payment_id": "p1", "amount": 10.0})
+
+    message = await queue.dequeue_payment()
+    assert message["payment_id"] == "p1"
+    assert queue.message_id(message["receipt"]) == message_id
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (0, 1)
+
+    await queue.complete_payment(message["receipt"])
+    stats = await queue.get_queue_stats()
+    assert (stats["processing_queue_size"], stats["dead_letter_queue_size"]) == (0, 0)
+    assert await fake_redis.hlen(queue.messages_hash) == 0
+
+@pytest.mark.asyncio
+async def test_retry_moves_to_dlq_after_max_retries(fake_redis, monkeypatch):
+    """Retries requeue the payment until max_retries, then it lands in the dead letter queue."""
+    monkeypatch.setattr(redis_queue, "retry_delay", lambda retry_count: 0)
+    queue = RedisQueue(fake_redis)
+    await queue.enqueue_payment("p1", {"payment_id": "p1"})
+
+    for attempt in range(1, queue.max_retries + 1):
+        message = await queue.dequeue_payment()
+        assert message.get("retries", 0) == attempt - 1
+        assert await queue.retry_payment(message["receipt"], message) is True
+        assert await queue.promote_due_retries() == 1
+    message = await queue.dequeue_payment()
+    assert await queue.retry_payment(message["receipt"], message) is False
+
+    stats = await queue.get_queue_stats()
+    assert (stats["dead_letter_queue_size"], stats["processing_queue_size"], stats["main_queue_size"]) == (1, 0, 0)
+    assert await fake_redis.hlen(queue.messages_hash) == 0
+
+@pytest.mark.asyncio
+async def test_retry_waits_in_schedule_until_due(fake_redis):
+    """A failed payment is not dequeued again before its backoff delay has passed."""
+    queue = RedisQueue(fake_redis)
+    await queue.enqueue_payment("p1", {})
+    message = await queue.dequeue_payment()
+    await queue.retry_payment(message["receipt"], message)
+
+    assert await queue.promote_due_retries() == 0
+    assert await queue.dequeue_batch(10, max_wait=0) == []
+    stats = await queue.get_queue_stats()
+    assert (stats["scheduled_retry_size"], stats["processing_queue_size"]) == (1, 0)
+
+    await fake_redis.zadd(queue.retry_zset, {queue.message_id(message["receipt"]): 0})
+    assert await queue.promote_due_retries() == 1
+    retried = await queue.dequeue_payment()
+    assert (queue.message_id(retried["receipt"]), retried["retries"]) == (queue.message_id(message["receipt"]), 1)
+
+@pytest.mark.asyncio
+async def test_ack_does_not_touch_other_in_flight_messages(fake_redis):
+    """Acknowledging by receipt removes exactly that message, whatever else is in flight."""
+    queue = RedisQueue(fake_redis)
+    for i in range(50):
+        await queue.enqueue_payment(f"p{i}", {})
+    messages = [await queue.dequeue_payment() for _ in range(50)]
+
+    await queue.complete_payment(messages[25]["receipt"])
+    assert await fake_redis.hlen(queue.inflight_hash) == 49
+    assert not await fake_redis.hexists(queue.inflight_hash, queue.message_id(messages[25]["receipt"]))
+
+@pytest.mark.asyncio
+async def test_legacy_lists_are_left_alone_until_migrated(fake_redis):
+    """Dequeue and the stale sweep never touch the pre-lane lists; the one-off migration moves them onto a lane."""
+    queue = RedisQueue(fake_redis)
+    await fake_redis.lpush(queue.main_queue, json.dumps({"payment_id": "old", "payload": {}, "timestamp": "2026-01-01T00:00:00"}))
+    await fake_redis.lpush(queue.legacy_processing_queue, json.dumps({"payment_id": "working", "payload": {}}))
+    await fake_redis.hset(queue.messages_hash, "stranded", json.dumps({"payment_id": "stranded", "payload": {}}))
+    await fake_redis.lpush(queue.handoff_queue, "stranded")
+
+    assert await queue.dequeue_batch(10, max_wait=0) == []
+    await queue.cleanup_stale_processing()
+    assert await fake_redis.llen(queue.legacy_processing_queue) == 1
+
+    assert await queue.migrate_legacy_lists(batch_size=1) == 3
+    batch = await queue.dequeue_batch(10, max_wait=0)
+    assert sorted(message["payment_id"] for message in batch) == ["old", "stranded", "working"]
+    await queue.ack_batch(message["receipt"] for message in batch)
+    assert await fake_redis.hlen(queue.inflight_hash) == 0
+    assert await queue.migrate_legacy_lists() == 0
+
+@pytest.mark.asyncio
+async def test_cleanup_requeues_stale_messages(fake_redis):
+    """Claims past their deadline are scheduled for retry."""
+    queue = RedisQueue(fake_redis)
+    await queue.enqueue_payment("stale", {})
+    stale = await queue.dequeue_payment()
+    await fake_redis.zadd(queue.deadlines_zset, {queue.message_id(stale["receipt"]): 0})
+
+    await queue.cleanup_stale_processing()
+    assert await fake_redis.zrange(queue.retry_zset, 0, -1) == [queue.message_id(stale["receipt"])]
+
+@pytest.mark.asyncio
+async def test_shared_queue_lifecycle():
+    """The lifespan-owned queue is created once, shared, and its pool closed on shutdown."""
+    with pytest.raises(RuntimeError):
+        get_queue()
+
+    queue = init_queue("list")
+    try:
+        assert get_queue() is queue
+        assert init_queue() is queue
+        stats = queue.pool_stats()
+        assert stats == {"max_connections": redis_queue.REDIS_MAX_CONNECTIONS, "in_use": 0, "idle": 0}
+    finally:
+        await close_queue()
+    with pytest.raises(RuntimeError):
+        get_queue()
+
+@pytest.mark.asyncio
+async def test_dequeue_batch_and_ack_batch(fake_redis):
+    """A batch claims up to n messages in order and is acknowledged together."""
+    queue = RedisQueue(fake_redis)
+    for i in range(4):
+        await queue.enqueue_payment(f"p{i}", {})
+
+    batch = await queue.dequeue_batch(10, max_wait=0)
+    assert [message["payment_id"] for message in batch] == ["p0", "p1", "p2", "p3"]
+    assert await fake_redis.hlen(queue.inflight_hash) == 4
+
+    await queue.ack_batch(message["receipt"] for message in batch[:3])
+    assert await fake_redis.hkeys(queue.inflight_hash) == [queue.message_id(batch[3]["receipt"])]
+    assert await queue.dequeue_batch(10, max_wait=0) == []
+
+@pytest.mark.asyncio
+async def test_deadline_index_follows_claims(fake_redis):
+    """Claims are indexed by visibility deadline; settling clears them and the sweep only takes expired ones."""
+    queue = RedisQueue(fake_redis)
+    for i in range(3):
+        await queue.enqueue_payment(f"p{i}", {})
+    before = time.time()
+    acked, retried, expired = await queue.dequeue_batch(3, max_wait=0)
+    deadline = await fake_redis.zscore(queue.deadlines_zset, queue.message_id(acked["receipt"]))
+    assert before + queue.visibility_timeout <= deadline <= time.time() + queue.visibility_timeout
+
+    await queue.ack_batch([acked["receipt"]])
+    await queue.retry_payment(retried["receipt"], retried)
+    assert await fake_redis.zrange(queue.deadlines_zset, 0, -1) == [queue.message_id(expired["receipt"])]
+
+    await queue.cleanup_stale_processing()
+    assert await fake_redis.zcard(queue.deadlines_zset) == 1
+    await fake_redis.zadd(queue.deadlines_zset, {queue.message_id(expired["receipt"]): time.time() - 1})
+    await queue.cleanup_stale_processing()
+    assert await fake_redis.zcard(queue.deadlines_zset) == 0
+    assert set(await fake_redis.zrange(queue.retry_zset, 0, -1)) == {
+        queue.message_id(retried["receipt"]), queue.message_id(expired["receipt"])
+    }
+    assert await fake_redis.hlen(queue.inflight_hash) == 0
+
+@pytest.mark.asyncio
+async def test_sweeper_crash_before_retry_leaves_the_claim_to_expire_again(fake_redis):
+    """Sweeping pushes the deadline forward rather than dropping it, so a claim is never stranded."""
+    queue = RedisQueue(fake_redis)
+    await queue.enqueue_payment("p1", {})
+    message = await queue.dequeue_payment()
+    message_id = queue.message_id(message["receipt"])
+    await fake_redis.zadd(queue.deadlines_zset, {message_id: time.time() - 1})
+
+    # The sweeper takes the claim and dies before scheduling the retry
+    await queue._sweep_expired(
+        keys=[queue.deadlines_zset, queue.inflight_hash, queue.messages_hash],
+        args=[time.time(), 10, time.time() + queue.visibility_timeout]
+    )
+    assert await fake_redis.zscore(queue.deadlines_zset, message_id) > time.time()
+    await queue.cleanup_stale_processing()
+    assert await fake_redis.hlen(queue.inflight_hash) == 1
+
+    await queue.cleanup_stale_processing(timeout_minutes=0)
+    assert await fake_redis.zcard(queue.deadlines_zset) == 0
+    assert await fake_redis.zrange(queue.retry_zset, 0, -1) == [message_id]
+
+@pytest.mark.asyncio
+async def test_recovered_claims_cannot_be_settled_by_their_old_worker(fake_redis):
+    """Once the sweep hands a message to another worker, the first worker's receipt no longer acts on it."""
+    queue = RedisQueue(fake_redis)
+    await queue.enqueue_payment("p1", {}, organization_id="org")
+    slow = await queue.dequeue_payment()
+    assert await queue.retry_payment(slow["receipt"], slow) is True
+    assert await queue.retry_payment(slow["receipt"], slow) is False
+
+    await fake_redis.zadd(queue.retry_zset, {queue.message_id(slow["receipt"]): 0})
+    await queue.promote_due_retries()
+    current = await queue.dequeue_payment()
+    assert queue.message_id(current["receipt"]) == queue.message_id(slow["receipt"])
+    await queue.ack_batch([slow["receipt"]])
+    await queue.dead_letter_payment(slow["receipt"], slow)
+    assert await fake_redis.zcard(queue.dead_letter_index) == 0
+    assert await fake_redis.hget(queue.org_in_flight, "org") == "1"
+
+    # Receipts issued before claims were fenced are bare message ids
+    await queue.ack_batch([queue.message_id(current["receipt"])])
+    assert await fake_redis.hlen(queue.inflight_hash) == 0
+    assert await fake_redis.hlen(queue.messages_hash) == 0
+
+@pytest.mark.asyncio
+async def test_claims_from_before_the_deadline_index_are_backfilled(fake_redis):
+    """In-flight messages that only have a claim time get a deadline from it on the first sweep."""
+    queue = RedisQueue(fake_redis)
+    await queue.enqueue_payment("old", {})
+    message = await queue.dequeue_payment()
+    await fake_redis.delete(queue.deadlines_zset)
+    await fake_redis.hset(queue.inflight_hash, queue.message_id(message["receipt"]), time.time() - 2 * queue.visibility_timeout)
+
+    await queue.cleanup_stale_processing()
+    assert await fake_redis.zrange(queue.retry_zset, 0, -1) == [queue.message_id(message["receipt"])]
+
+@pytest.mark.asyncio
+async def test_small_tenant_is_not_stuck_behind_a_burst(fake_redis):
+    """Organizations take turns, so a later small tenant is served before a large backlog drains."""
+    queue = RedisQueue(fake_redis)
+    for i in range(50):
+        await queue.enqueue_payment(f"big{i}", {}, organization_id="big")
+    for i in range(3):
+        await queue.enqueue_payment(f"small{i}", {}, organization_id="small")
+
+    batch = await queue.dequeue_batch(6, max_wait=0)
+    assert [message["payment_id"] for message in batch] == ["big0", "small0", "big1", "small1", "big2", "small2"]
+    stats = await queue.get_queue_stats()
+    assert {organization: counts["queued"] for organization, counts in stats["organizations"].items()} == {
+        "big": 47, "small": 0
+    }
+    assert stats["organizations"]["big"]["in_flight"] == stats["organizations"]["small"]["in_flight"] == 3
+    assert stats["organizations"]["big"]["oldest_age_seconds"] >= 0
+    assert stats["organizations"]["small"]["oldest_age_seconds"] is None
+    assert stats["main_queue_size"] == 47
+
+@pytest.mark.asyncio
+async def test_weights_and_in_flight_caps(fake_redis):
+    """A weight is the organization's share per turn; a capped organization waits for acks."""
+    queue = RedisQueue(fake_redis)
+    await queue.set_organization_weight("heavy", 3)
+    await queue.set_organization_in_flight_cap("capped", 2)
+    for i in range(6):
+        await queue.enqueue_payment(f"h{i}", {}, organization_id="heavy")
+        await queue.enqueue_payment(f"c{i}", {}, organization_id="capped")
+
+    batch = await queue.dequeue_batch(8, max_wait=0)
+    assert [message["payment_id"] for message in batch] == ["h0", "h1", "h2", "c0", "h3", "h4", "h5", "c1"]
+    assert await queue.dequeue_batch(8, max_wait=0) == []
+
+    await queue.ack_batch([batch[3]["receipt"]])
+    assert [message["payment_id"] for message in await queue.dequeue_batch(8, max_wait=0)] == ["c2"]
+    await queue.retry_payment(batch[7]["receipt"], batch[7])
+    await fake_redis.zadd(queue.retry_zset, {queue.message_id(batch[7]["receipt"]): 0})
+    assert await queue.promote_due_retries() == 1
+    capped = (await queue.get_queue_stats())["organizations"]["capped"]
+    assert (capped["queued"], capped["in_flight"]) == (4, 1)
+
+@pytest.mark.asyncio
+async def test_priority_lanes_share_dequeues_by_weight(fake_redis):
+    """While every lane has work each gets its weighted share, and stats report per-lane depth and age."""
+    queue = RedisQueue(fake_redis)
+    for priority in ("bulk", "standard", "high_value", "same_day"):
+        for i in range(10):
+            await queue.enqueue_payment(f"{priority}{i}", {}, priority=priority)
+    stats = await queue.get_queue_stats()
+    assert {priority: lane["depth"] for priority, lane in stats["lanes"].items()} == {
+        "same_day": 10, "high_value": 10, "standard": 10, "bulk": 10
+    }
+    assert stats["lanes"]["bulk"]["oldest_age_seconds"] >= 0
+
+    batch = await queue.dequeue_batch(15, max_wait=0)
+    assert batch[0]["priority"] == "same_day"
+    served = [message["priority"] for message in batch]
+    assert {priority: served.count(priority) for priority in set(served)} == {
+        "same_day": 8, "high_value": 4, "standard": 2, "bulk": 1
+    }
+
+@pytest.mark.asyncio
+async def test_starved_lane_is_served_first(fake_redis):
+    """A lane whose oldest message waited past its limit jumps ahead of higher-weighted lanes."""
+    queue = RedisQueue(fake_redis)
+    queue.lane_max_wait["bulk"] = 60
+    old = await queue.enqueue_payment("old-bulk", {"payment_type": "ach_debit", "amount": 10}, priority="bulk")
+    await fake_redis.zadd("payment_queue:bulk:enqueued", {old: time.time() - 120})
+    await queue.enqueue_payment("urgent", {"payment_type": "same_day_ach_debit", "amount": 10})
+    assert (await queue.get_queue_stats())["lanes"]["bulk"]["oldest_age_seconds"] >= 120
+
+    assert [message["payment_id"] for message in await queue.dequeue_batch(2, max_wait=0)] == ["old-bulk", "urgent"]
@@ -0,0 +1,126 @@
+import logging
+import pytest
+from message_queue import redis_streams
+from message_queue.redis_queue import RedisQueue, RedisQueueMixin
+from message_queue.redis_streams import RedisStreamQueue, warn_ignored_scheduling_settings
+
+@pytest.mark.asyncio
+async def test_stream_ack_removes_message(fake_redis):
+    """A read message is pending for its consumer until acknowledged by entry id."""
+    queue = RedisStreamQueue(fake_redis, consumer="worker-1")
+    entry_id = await queue.enqueue_payment("p1", {"amount": 5})
+
+    message = await queue.dequeue_payment()
+    assert (message["payment_id"], message["receipt"], message["retries"]) == ("p1", entry_id, 0)
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (0, 1)
+    assert stats["consumers"] == {"worker-1": 1}
+
+    await queue.complete_payment(message["receipt"])
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (0, 0)
+    assert await queue.dequeue_payment() is None
+
+@pytest.mark.asyncio
+async def test_unacked_message_is_autoclaimed_with_delivery_count(fake_redis):
+    """Another consumer reclaims an idle pending message, and retries follow the delivery count."""
+    crashed = RedisStreamQueue(fake_redis, consumer="crashed")
+    survivor = RedisStreamQueue(fake_redis, consumer="survivor")
+    survivor.claim_idle_ms = 0
+    await crashed.enqueue_payment("p1", {})
+    await crashed.dequeue_payment()
+
+    message = await survivor.dequeue_payment()
+    assert message["payment_id"] == "p1"
+    assert message["retries"] == 1
+    assert (await survivor.get_queue_stats())["consumers"]["survivor"] == 1
+
+@pytest.mark.asyncio
+async def test_retries_are_scheduled_then_dead_lettered(fake_redis, monkeypatch):
+    """Failed messages leave the stream until due and move to the DLQ after max_retries."""
+    monkeypatch.setattr(redis_streams, "retry_delay", lambda retry_count: 0)
+    queue = RedisStreamQueue(fake_redis, consumer="worker-1")
+    await queue.enqueue_payment("p1", {})
+
+    for attempt in range(queue.max_retries):
+        message = await queue.dequeue_payment()
+        assert message["retries"] == attempt
+        assert await queue.retry_payment(message["receipt"], message) is True
+        assert (await queue.get_queue_stats())["scheduled_retry_size"] == 1
+        assert await queue.promote_due_retries() == 1
+    message = await queue.dequeue_payment()
+    assert await queue.retry_payment(message["receipt"], message) is False
+
+    stats = await queue.get_queue_stats()
+    assert (stats["processing_queue_size"], stats["dead_letter_queue_size"], stats["scheduled_retry_size"]) == (0, 1, 0)
+    assert await fake_redis.xlen(queue.stream) == 0
+
+@pytest.mark.asyncio
+async def test_message_is_dead_lettered_after_max_redeliveries(fake_redis):
+    """A message that keeps crashing its consumer moves to the DLQ once its delivery count is exhausted."""
+    queue = RedisStreamQueue(fake_redis, consumer="worker-1")
+    queue.claim_idle_ms = 0
+    await queue.enqueue_payment("p1", {})
+
+    for attempt in range(queue.max_retries + 1):
+        message = await queue.dequeue_payment()
+        assert message["retries"] == attempt
+    assert await queue.dequeue_payment() is None
+    assert (await queue.get_queue_stats())["dead_letter_queue_size"] == 1
+
+@pytest.mark.asyncio
+async def test_stream_batch_reclaims_before_reading_new_messages(fake_redis):
+    """A batch starts with idle pending messages and is filled up with new ones."""
+    crashed = RedisStreamQueue(fake_redis, consumer="crashed")
+    worker = RedisStreamQueue(fake_redis, consumer="worker-1")
+    worker.claim_idle_ms = 0
+    for i in range(4):
+        await crashed.enqueue_payment(f"p{i}", {})
+    await crashed.dequeue_batch(1, max_wait=0)
+
+    batch = await worker.dequeue_batch(3, max_wait=0)
+    assert [(message["payment_id"], message["retries"]) for message in batch] == [("p0", 1), ("p1", 0), ("p2", 0)]
+
+    await worker.ack_batch(message["receipt"] for message in batch)
+    stats = await worker.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (1, 0)
+
+@pytest.mark.asyncio
+async def test_reclaimed_entry_cannot_be_settled_by_its_old_consumer(fake_redis):
+    """Once another consumer reclaims an entry, the first one's ack, retry and dead-letter are ignored."""
+    slow = RedisStreamQueue(fake_redis, consumer="slow")
+    other = RedisStreamQueue(fake_redis, consumer="other")
+    other.claim_idle_ms = 0
+    await slow.enqueue_payment("p1", {})
+    stale = await slow.dequeue_payment()
+    current = await other.dequeue_payment()
+    assert current["receipt"] == stale["receipt"]
+
+    await slow.ack_batch([stale["receipt"]])
+    assert await slow.retry_payment(stale["receipt"], stale) is False
+    await slow.dead_letter_payment(stale["receipt"], stale, "Timed out")
+    stats = await other.get_queue_stats()
+    assert (stats["processing_queue_size"], stats["scheduled_retry_size"], stats["dead_letter_queue_size"]) == (1, 0, 0)
+
+    await other.ack_batch([current["receipt"]])
+    assert (await other.get_queue_stats())["processing_queue_size"] == 0
+    assert await fake_redis.xlen(other.stream) == 0
+
+def test_streams_share_only_the_dead_letter_store_with_lists(fake_redis):
+    """The stream queue is not a list queue: it takes the shared mixin and none of the lane scripts."""
+    queue = RedisStreamQueue(fake_redis, consumer="worker-1")
+    assert isinstance(queue, RedisQueueMixin) and not isinstance(queue, RedisQueue)
+    assert not hasattr(queue, "_dequeue") and not hasattr(queue, "key_prefix")
+    assert queue.dead_letters_hash == RedisQueue(fake_redis).dead_letters_hash
+
+def test_scheduling_settings_are_reported_as_ignored(monkeypatch, caplog):
+    """Priority and fairness settings configured for the streams backend are named in a warning."""
+    for name in redis_streams.LIST_QUEUE_SCHEDULING_SETTINGS:
+        monkeypatch.delenv(name, raising=False)
+    assert warn_ignored_scheduling_settings() == []
+
+    monkeypatch.setenv("ORG_QUEUE_MAX_IN_FLIGHT", "5")
+    monkeypatch.setenv("PRIORITY_LANE_WEIGHTS", "bulk:2")
+    with caplog.at_level(logging.WARNING, logger=redis_streams.__name__):
+        assert warn_ignored_scheduling_settings() == ["ORG_QUEUE_MAX_IN_FLIGHT", "PRIORITY_LANE_WEIGHTS"]
+    assert "ORG_QUEUE_MAX_IN_FLIGHT, PRIORITY_LANE_WEIGHTS" in caplog.text
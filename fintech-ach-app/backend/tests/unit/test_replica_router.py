@@ -0,0 +1,42 @@
+from config.replicas import Replica, ReplicaRouter
+
+def make_router(count: int = 2, pin_seconds: float = 0) -> ReplicaRouter:
+    """Create a router over replicas that never open real connections."""
+    replicas = [Replica(f"replica-{i}", engine=None) for i in range(count)]
+    return ReplicaRouter(replicas, cooldown_seconds=30, pin_seconds=pin_seconds)
+
+def test_choose_balances_across_replicas():
+    """Reads rotate across healthy replicas."""
+    router = make_router()
+    chosen = {router.choose("caller").name for _ in range(4)}
+    assert chosen == {"replica-0", "replica-1"}
+
+def test_unhealthy_replica_is_skipped_then_primary_used():
+    """Unhealthy replicas leave rotation and the primary serves when none remain."""
+    router = make_router()
+    router.mark_unhealthy(router.replicas[0], ConnectionRefusedError("down"))
+    assert {router.choose().name for _ in range(3)} == {"replica-1"}
+
+    router.mark_unhealthy(router.replicas[1], ConnectionRefusedError("down"))
+    assert router.choose() is None
+    assert router.replicas[1].last_error == "down"
+
+def test_unhealthy_replica_returns_after_cooldown():
+    """A replica rejoins rotation once its cooldown has passed."""
+    router = make_router(count=1)
+    router.cooldown_seconds = 0
+    router.mark_unhealthy(router.replicas[0], OSError("timeout"))
+    assert router.choose().name == "replica-0"
+
+def test_pinned_caller_reads_from_primary():
+    """A caller that just wrote is routed to the primary while pinned."""
+    router = make_router(pin_seconds=5)
+    router.pin("writer")
+    assert router.choose("writer") is None
+    assert router.choose("reader") is not None
+
+def test_pinning_disabled_by_default():
+    """Pinning is a no-op unless a pin duration is configured."""
+    router = make_router()
+    router.pin("writer")
+    assert router.choose("writer") is not None
@@ -0,0 +1,93 @@
+import pytest
+from message_queue import sharded
+from message_queue.base import create_queue
+from message_queue.redis_queue import RedisQueue
+from message_queue.redis_streams import RedisStreamQueue
+from message_queue.sharded import ShardedQueue, merge_stats, parse_worker_shards, shard_namespace
+
+def redis_shards(client, count=3):
+    return [RedisQueue(client, namespace=shard_namespace(index)) for index in range(count)]
+
+@pytest.mark.asyncio
+async def test_payments_spread_by_shard_key(fake_redis):
+    """Payment ids spread over every shard; an organization's payments stay on one."""
+    by_payment = ShardedQueue(redis_shards(fake_redis))
+    for i in range(60):
+        await by_payment.enqueue_payment(f"p{i}", {}, organization_id="org")
+    depths = [(await shard.get_queue_stats())["main_queue_size"] for shard in by_payment.shards]
+    assert sum(depths) == 60 and all(depths)
+
+    await fake_redis.flushall()
+    by_organization = ShardedQueue(redis_shards(fake_redis), shard_key="organization_id")
+    message_id = await by_organization.enqueue_payment("p1", {}, organization_id="org")
+    for i in range(9):
+        await by_organization.enqueue_payment(f"q{i}", {}, organization_id="org")
+    index = by_organization.shard_for("any", "org")
+    assert message_id.startswith(f"{index}:")
+    assert (await by_organization.shards[index].get_queue_stats())["main_queue_size"] == 10
+
+    # Shard 0 keeps the unsharded keys, the others are hash-tagged
+    assert by_payment.shards[0].main_queue == "payment_queue"
+    assert by_payment.shards[2].main_queue == "{shard2}:payment_queue"
+
+@pytest.mark.asyncio
+async def test_worker_serves_its_shards_then_steals(fake_redis):
+    """A worker drains its own shard first and takes from the others only once it is empty."""
+    shards = redis_shards(fake_redis, 2)
+    producer = ShardedQueue(shards)
+    worker = ShardedQueue(shards, worker_shards=[0], steal_interval=0.05)
+    for i in range(20):
+        await producer.enqueue_payment(f"p{i}", {})
+    own = (await shards[0].get_queue_stats())["main_queue_size"]
+
+    first = await worker.dequeue_batch(own, max_wait=0)
+    assert {message["receipt"].partition(":")[0] for message in first} == {"0"}
+    stolen = await worker.dequeue_batch(100, max_wait=0)
+    assert len(stolen) == 20 - own
+    assert {message["receipt"].partition(":")[0] for message in stolen} == {"1"}
+
+    await worker.ack_batch(message["receipt"] for message in first + stolen)
+    assert (await worker.get_queue_stats())["processing_queue_size"] == 0
+    assert await worker.dequeue_batch(10, max_wait=0.1) == []
+
+@pytest.mark.asyncio
+async def test_stats_are_aggregated_across_shards(fake_redis):
+    """Depths and in-flight counts add up over shards, ages take the oldest, and each shard is reported."""
+    queue = ShardedQueue(redis_shards(fake_redis))
+    for i in range(12):
+        await queue.enqueue_payment(f"p{i}", {"payment_type": "ach_debit"}, organization_id=f"org{i % 2}")
+    claimed = await queue.dequeue_batch(5, max_wait=0)
+
+    stats = await queue.get_queue_stats()
+    assert (stats["main_queue_size"], stats["processing_queue_size"]) == (7, len(claimed))
+    assert sum(shard["main_queue_size"] for shard in stats["shards"]) == 7
+    assert sum(counts["queued"] + counts["in_flight"] for counts in stats["organizations"].values()) == 12
+    assert sum(lane["depth"] for lane in stats["lanes"].values()) == 7
+
+    assert merge_stats([
+        {"main_queue_size": 1, "lanes": {"standard": {"depth": 1, "oldest_age_seconds": 5.0}}},
+        {"main_queue_size": 2, "lanes": {"standard": {"depth": 2, "oldest_age_seconds": None}}},
+        {"main_queue_size": 0, "consumers": {"a": 1}}
+    ]) == {
+        "main_queue_size": 3, "processing_queue_size": 0, "dead_letter_queue_size": 0, "scheduled_retry_size": 0,
+        "lanes": {"standard": {"depth": 3, "oldest_age_seconds": 5.0}},
+        "consumers": {"a": 1}
+    }
+
+def test_sharding_is_configured_by_environment(monkeypatch):
+    """QUEUE_SHARDS above 1 shards the Redis backends; QUEUE_WORKER_SHARDS picks a worker's own shards."""
+    monkeypatch.setattr(sharded, "QUEUE_SHARDS", 4)
+    monkeypatch.setattr(sharded, "QUEUE_WORKER_SHARDS", "1,3")
+    monkeypatch.setattr(sharded, "QUEUE_SHARD_REDIS_URLS", ["redis://one:6379", "redis://two:6379"])
+    queue = create_queue("streams")
+    assert isinstance(queue, ShardedQueue)
+    assert all(isinstance(shard, RedisStreamQueue) for shard in queue.shards)
+    assert (queue.worker_shards, queue.other_shards) == ([1, 3], [0, 2])
+    assert queue.shards[0].redis is queue.shards[2].redis
+    assert queue.shards[0].redis is not queue.shards[1].redis
+
+    assert parse_worker_shards("", 3) == [0, 1, 2]
+    with pytest.raises(ValueError):
+        parse_worker_shards("5", 3)
+    with pytest.raises(ValueError):
+        ShardedQueue(queue.shards, shard_key="amount")
@@ -41,6 +41,8 @@ function PaymentsPage(): JSX.Element {
         maxAmount: 0
     });
     const [currentPage, setCurrentPage] = useState(1);
+    // Keyset cursors for pages reached via "next"; other pages fall back to offset paging
+    const [pageCursors, setPageCursors] = useState<Record<number, string>>({});
     const [sortConfig, setSortConfig] = useState<SortConfig>({
         key: 'created_at',
         direction: 'desc'
@@ -49,7 +51,12 @@ function PaymentsPage(): JSX.Element {
     const { user } = useAuth();
     const queryParams = new URLSearchParams();
     queryParams.append('limit', pageSize.toString());
-    queryParams.append('offset', ((currentPage - 1) * pageSize).toString());
+    const pageCursor = pageCursors[currentPage];
+    if (pageCursor) {
+        queryParams.append('cursor', pageCursor);
+    } else {
+        queryParams.append('offset', ((currentPage - 1) * pageSize).toString());
+    }
     queryParams.append('sort_by', String(sortConfig.key));
     queryParams.append('sort_direction', sortConfig.direction?.toString() ?? '');
 
@@ -75,13 +82,18 @@ function PaymentsPage(): JSX.Element {
     const handleFilterChange = useCallback((newFilters: typeof filters): void => {
         setFilters(newFilters);
         setCurrentPage(1);
+        setPageCursors({});
         void mutatePayments();
     }, [mutatePayments]);
 
     const handlePageChange = useCallback((page: number): void => {
+        const nextCursor = payments?.next_cursor;
+        if (page === currentPage + 1 && nextCursor) {
+            setPageCursors((prev) => ({ ...prev, [page]: nextCursor }));
+        }
         setCurrentPage(page);
         void mutatePayments();
-    }, [mutatePayments]);
+    }, [mutatePayments, payments, currentPage]);
 
     const handlePaymentSuccess = useCallback((): void => {
         setShowForm(false);
@@ -92,6 +104,7 @@ function PaymentsPage(): JSX.Element {
         if (newSortConfig.key !== sortConfig.key) {
             setCurrentPage(1);
         }
+        setPageCursors({});
         setSortConfig(newSortConfig);
         void mutatePayments();
     }, [mutatePayments, sortConfig]);
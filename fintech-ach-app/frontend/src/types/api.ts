@@ -8,6 +8,7 @@ export interface PaymentsResponse {
     payments: Payment[];
     limit: number;
     offset: number;
+    next_cursor?: string | null;
 }
 
 /**